@@ -1,80 +1,456 @@
-"""Модуль кеширования для аналитики"""
+"""Модуль кеширования для аналитики
 
+Два бэкенда с одинаковым интерфейсом:
+    - SharedAnalyticsCache (по умолчанию) - SQLite-файл на локальном диске, общий для
+      всех воркеров gunicorn/Socket.IO: тяжёлый payload считается один раз на сервер,
+      а clear()/invalidate() видят все воркеры;
+    - AnalyticsCache - словарь в памяти процесса (ANALYTICS_CACHE_BACKEND=memory).
+
+Поколение (generation) - счётчик очисток. clear() увеличивает его, и результат,
+посчитанный до очистки, при публикации отбрасывается (set(..., generation=...)).
+
+Зависимости: запись помечается тегами данных, от которых она зависит (см.
+cache_dependencies.py), а invalidate_tags() удаляет только записи с этими тегами.
+Результат, расчёт которого начался до инвалидации его тега, не публикуется
+(set(..., started_at=...)). Поэтому TTL может быть длинным (часы).
+"""
+
+import os
+import json
 import time
+import pickle
+import sqlite3
+import threading
 from functools import wraps
 from threading import Lock
 
+# Файл общего кеша и выбор бэкенда
+CACHE_PATH = os.getenv(
+    'ANALYTICS_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analytics_cache.sqlite3')
+)
+CACHE_BACKEND = os.getenv('ANALYTICS_CACHE_BACKEND', 'sqlite')
+
+# TTL записей: свежесть обеспечивает инвалидация по тегам, TTL - страховка
+CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', 6 * 3600))
+
+
 class AnalyticsCache:
     """Простой кеш с TTL для результатов аналитики"""
 
-    def __init__(self, ttl=300):  # TTL по умолчанию 5 минут
+    def __init__(self, ttl=CACHE_TTL):
         self.cache = {}
         self.ttl = ttl
         self.lock = Lock()
+        self._generation = 0
+        self._refresh_requested_at = 0.0
+        self.tags = {}  # {tag: set(keys)}
+        self.tag_invalidated_at = {}  # {tag: time}
 
     def get(self, key):
         """Получить значение из кеша"""
         with self.lock:
             if key in self.cache:
-                data, timestamp = self.cache[key]
-                if time.time() - timestamp < self.ttl:
+                data, expires_at = self.cache[key]
+                if time.time() < expires_at:
                     return data
                 else:
                     del self.cache[key]
         return None
 
-    def set(self, key, value):
-        """Сохранить значение в кеш"""
+    def set(self, key, value, ttl=None, generation=None, tags=(), started_at=None):
+        """Сохранить значение в кеш
+
+        Замена значения атомарна: читатели видят либо старый, либо новый результат.
+        ttl - время жизни этой записи (по умолчанию self.ttl); фоновый пересчёт
+        публикует записи с запасом, чтобы они не истекали между прогонами.
+        generation - поколение на момент начала расчёта: если кеш с тех пор
+        очищали, результат устарел и не публикуется.
+        tags - теги зависимостей записи; started_at - время начала расчёта: если
+        какой-то из тегов инвалидировали позже, результат не публикуется.
+        """
+        expires_at = time.time() + (ttl if ttl is not None else self.ttl)
         with self.lock:
-            self.cache[key] = (value, time.time())
+            if generation is not None and generation != self._generation:
+                return False
+            if started_at is not None and any(
+                self.tag_invalidated_at.get(tag, 0) >= started_at for tag in tags
+            ):
+                return False
+            self.cache[key] = (value, expires_at)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+        return True
+
+    def generation(self):
+        """Текущее поколение кеша"""
+        return self._generation
 
     def clear(self):
         """Очистить весь кеш"""
         with self.lock:
             self.cache.clear()
+            self.tags.clear()
+            self._generation += 1
+
+    def invalidate_tags(self, tags):
+        """Удалить записи, зависящие от любого из тегов; возвращает число записей"""
+        now = time.time()
+        removed = 0
+        with self.lock:
+            for tag in tags:
+                self.tag_invalidated_at[tag] = now
+                keys = self.tags.pop(tag, set())
+                for key in keys:
+                    if self.cache.pop(key, None) is not None:
+                        removed += 1
+                self._forget_tags(keys)
+        return removed
 
     def invalidate(self, pattern=None):
         """Инвалидировать кеш по паттерну"""
         with self.lock:
             if pattern is None:
                 self.cache.clear()
+                self.tags.clear()
+                self._generation += 1
             else:
                 keys_to_delete = [k for k in self.cache.keys() if pattern in k]
                 for key in keys_to_delete:
                     del self.cache[key]
+                self._forget_tags(keys_to_delete)
+
+    def _forget_tags(self, keys):
+        """Убрать удалённые ключи из привязок к тегам (вызывается под self.lock)"""
+        keys = set(keys)
+        if not keys:
+            return
+        for tag in list(self.tags):
+            self.tags[tag] -= keys
+            if not self.tags[tag]:
+                del self.tags[tag]
+
+    def acquire_lease(self, name, owner, ttl):
+        """Аренда фоновой задачи: в одном процессе она всегда у текущего владельца"""
+        return True
+
+    def request_refresh(self):
+        """Попросить владельца аренды пересчитать кеш"""
+        self._refresh_requested_at = time.time()
+
+    def refresh_requested_at(self):
+        """Время последнего запроса на пересчёт (0 - не было)"""
+        return self._refresh_requested_at
+
+
+class SharedAnalyticsCache:
+    """Кеш аналитики в SQLite, общий для всех процессов на сервере
+
+    Значения хранятся в pickle, чтобы попадание в кеш возвращало те же типы, что и
+    расчёт (кортежи, нестроковые ключи словарей, datetime); записи старого формата
+    (JSON-текст) читаются как раньше. Запись заменяется одним INSERT OR REPLACE. У каждой
+    записи есть версия: воркер держит декодированную копию и заново читает значение
+    из файла, только если версия в базе сменилась.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._decoded = {}  # {key: (version, value)} - декодированные копии этого процесса
+        self._decoded_lock = Lock()
+        self._init_schema()
+
+    def _connection(self):
+        """Соединение текущего потока (sqlite3 не разделяет соединения между потоками)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _init_schema(self):
+        connection = self._connection()
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                generation INTEGER NOT NULL,
+                version INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entry_tags (
+                tag TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (tag, key)
+            );
+            CREATE TABLE IF NOT EXISTS tag_invalidations (
+                tag TEXT PRIMARY KEY,
+                invalidated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', 0);
+            INSERT OR IGNORE INTO meta (name, value) VALUES ('version', 0);
+            INSERT OR IGNORE INTO meta (name, value) VALUES ('refresh_requested_at', 0);
+        """)
+
+    def _bump(self, connection, name):
+        connection.execute("UPDATE meta SET value = value + 1 WHERE name = ?", (name,))
+        return int(connection.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()[0])
+
+    def get(self, key):
+        """Получить значение из кеша (None - нет, истекло или из старого поколения)"""
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT e.version FROM entries e JOIN meta m ON m.name = 'generation' "
+            "WHERE e.key = ? AND e.generation = m.value AND e.expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+
+        version = row[0]
+        with self._decoded_lock:
+            decoded = self._decoded.get(key)
+        if decoded and decoded[0] == version:
+            return decoded[1]
+
+        row = connection.execute("SELECT value, version FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value = _decode(row[0])
+        with self._decoded_lock:
+            self._decoded[key] = (row[1], value)
+        return value
+
+    def set(self, key, value, ttl=None, generation=None, tags=(), started_at=None):
+        """Атомарно заменить запись (см. AnalyticsCache.set)"""
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            print(f"⚠️ Значение для ключа {key} не сериализуется, в кеш не сохранено: {e}")
+            return False
+        expires_at = time.time() + (ttl if ttl is not None else self.ttl)
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            current = self.generation()
+            if generation is not None and generation != current:
+                connection.execute("ROLLBACK")
+                return False
+            tags = list(tags)
+            if started_at is not None and tags:
+                placeholders = ",".join("?" * len(tags))
+                latest = connection.execute(
+                    f"SELECT MAX(invalidated_at) FROM tag_invalidations WHERE tag IN ({placeholders})",
+                    tags
+                ).fetchone()[0]
+                if latest is not None and latest >= started_at:
+                    connection.execute("ROLLBACK")
+                    return False
+            version = self._bump(connection, 'version')
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, generation, version) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, payload, expires_at, current, version)
+            )
+            connection.execute("DELETE FROM entry_tags WHERE key = ?", (key,))
+            connection.executemany(
+                "INSERT OR IGNORE INTO entry_tags (tag, key) VALUES (?, ?)",
+                [(tag, key) for tag in tags]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return True
+
+    def generation(self):
+        """Текущее поколение кеша (общее для всех процессов)"""
+        row = self._connection().execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+        return int(row[0])
+
+    def clear(self):
+        """Очистить кеш во всех воркерах"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._bump(connection, 'generation')
+            connection.execute("DELETE FROM entries")
+            connection.execute("DELETE FROM entry_tags")
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        with self._decoded_lock:
+            self._decoded.clear()
+
+    def invalidate_tags(self, tags):
+        """Удалить записи, зависящие от любого из тегов, во всех воркерах"""
+        tags = list(tags)
+        if not tags:
+            return 0
+        now = time.time()
+        placeholders = ",".join("?" * len(tags))
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS invalidated_keys (key TEXT PRIMARY KEY)"
+            )
+            connection.execute("DELETE FROM invalidated_keys")
+            connection.execute(
+                f"INSERT OR IGNORE INTO invalidated_keys SELECT key FROM entry_tags WHERE tag IN ({placeholders})",
+                tags
+            )
+            removed = connection.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM invalidated_keys)"
+            ).rowcount
+            # Привязки удалённых записей и к остальным их тегам
+            connection.execute("DELETE FROM entry_tags WHERE key IN (SELECT key FROM invalidated_keys)")
+            connection.executemany(
+                "INSERT OR REPLACE INTO tag_invalidations (tag, invalidated_at) VALUES (?, ?)",
+                [(tag, now) for tag in tags]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return removed
+
+    def invalidate(self, pattern=None):
+        """Инвалидировать кеш по паттерну (подстрока ключа) во всех воркерах"""
+        if pattern is None:
+            self.clear()
+            return
+        escaped = pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Вместе с записями удаляем их привязки к тегам, иначе entry_tags копит сирот
+            for table in ("entries", "entry_tags"):
+                connection.execute(
+                    f"DELETE FROM {table} WHERE key LIKE ? ESCAPE '\\'", (f"%{escaped}%",)
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def acquire_lease(self, name, owner, ttl):
+        """Взять или продлить аренду фоновой задачи; False - она у другого процесса"""
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (name, owner, now + ttl, now)
+            )
+            holder = connection.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()[0]
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return holder == owner
+
+    def request_refresh(self):
+        """Попросить владельца аренды пересчитать кеш (из любого воркера)"""
+        self._connection().execute(
+            "UPDATE meta SET value = ? WHERE name = 'refresh_requested_at'", (time.time(),)
+        )
+
+    def refresh_requested_at(self):
+        """Время последнего запроса на пересчёт (0 - не было)"""
+        row = self._connection().execute(
+            "SELECT value FROM meta WHERE name = 'refresh_requested_at'"
+        ).fetchone()
+        return row[0]
+
+
+def _decode(stored):
+    """Значение из таблицы entries: pickle (BLOB) или JSON-текст старого формата"""
+    if isinstance(stored, str):
+        return json.loads(stored)
+    return pickle.loads(stored)
+
+
+def create_cache(ttl=CACHE_TTL):
+    """Кеш выбранного бэкенда; если файл недоступен - кеш в памяти процесса"""
+    if CACHE_BACKEND == 'sqlite':
+        try:
+            return SharedAnalyticsCache(CACHE_PATH, ttl=ttl)
+        except sqlite3.Error as e:
+            print(f"⚠️ Общий кеш аналитики недоступен ({CACHE_PATH}): {e}, используем кеш в памяти")
+    return AnalyticsCache(ttl=ttl)
 
 
 # Глобальный экземпляр кеша
-analytics_cache = AnalyticsCache(ttl=300)  # 5 минут
+analytics_cache = create_cache()
 
 
-def cached(key_func=None):
+def cached(key_func=None, tags=None):
     """
     Декоратор для кеширования результатов функций
 
     Args:
         key_func: функция для генерации ключа кеша из аргументов
+        tags: теги зависимостей - список или функция от тех же аргументов
+
+    У обёрнутой функции есть refresh(*args, ttl=None, **kwargs): пересчитать
+    результат в обход кеша и опубликовать его (используется фоновым пересчётом),
+    и cache_key(*args, **kwargs).
     """
     def decorator(func):
+        def make_key(*args, **kwargs):
+            if key_func:
+                return key_func(*args, **kwargs)
+            return f"{func.__name__}"
+
+        def make_tags(*args, **kwargs):
+            if callable(tags):
+                return tags(*args, **kwargs)
+            return tags or ()
+
+        def compute(cache_key, args, kwargs, ttl=None):
+            # Если кеш очистят или теги инвалидируют во время расчёта - не публикуем
+            generation = analytics_cache.generation()
+            started_at = time.time()
+            result = func(*args, **kwargs)
+            analytics_cache.set(cache_key, result, ttl=ttl, generation=generation,
+                                tags=make_tags(*args, **kwargs), started_at=started_at)
+            return result
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             # Генерируем ключ кеша
-            if key_func:
-                cache_key = key_func(*args, **kwargs)
-            else:
-                cache_key = f"{func.__name__}"
+            cache_key = make_key(*args, **kwargs)
 
             # Проверяем кеш
             cached_result = analytics_cache.get(cache_key)
             if cached_result is not None:
                 return cached_result
 
-            # Вычисляем результат
-            result = func(*args, **kwargs)
+            # Вычисляем результат и сохраняем в кеш
+            return compute(cache_key, args, kwargs)
 
-            # Сохраняем в кеш
-            analytics_cache.set(cache_key, result)
+        def refresh(*args, ttl=None, **kwargs):
+            # Старое значение остаётся доступным, пока считается новое
+            return compute(make_key(*args, **kwargs), args, kwargs, ttl=ttl)
 
-            return result
+        wrapper.refresh = refresh
+        wrapper.cache_key = make_key
         return wrapper
     return decorator
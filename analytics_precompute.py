@@ -0,0 +1,186 @@
+"""Фоновый пересчёт и прогрев кеша аналитики
+
+Раньше первый посетитель после истечения TTL AnalyticsCache платил за полный
+пересчёт тяжёлых payload'ов (get_top_items_by_category, subsubcategory-timeline,
+...). Теперь AnalyticsPrecomputer пересчитывает все payload'ы дашборда:
+    - при старте веб-процесса (прогрев),
+    - по расписанию, чаще чем истекает TTL,
+    - сразу после парсинга и пакета теггирования (trigger()).
+
+Новый результат считается в обход кеша и публикуется одной заменой записи
+(cached(...).refresh), поэтому запросы всё это время получают предыдущее значение.
+Записи публикуются с TTL в несколько интервалов: если один прогон упал или
+затянулся, кеш не остывает.
+
+Внеплановый прогон (старт, trigger()) пересчитывает только payload'ы, которых нет
+в кеше: после инвалидации по тегам (cache_dependencies.py) это ровно затронутые
+изменением записи. Плановый прогон - страховка - пересчитывает всё.
+
+Поток запускается в каждом воркере (app_factory.start_background из create_app), но считает только владелец аренды
+(analytics_cache.acquire_lease): при общем кеше N воркеров не умножают нагрузку
+на MongoDB в N раз. trigger() в любом воркере записывает запрос на пересчёт в
+общий кеш, владелец аренды подхватывает его при следующем опросе.
+"""
+
+import os
+import time
+import socket
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from analytics_cache import analytics_cache
+from metrics import route_context
+from optimized_analytics import OptimizedAnalytics
+
+# Интервал планового пересчёта (секунды) - меньше TTL кеша; свежесть после
+# изменений данных обеспечивает инвалидация, расписание ловит изменения вне веб-процесса
+PRECOMPUTE_INTERVAL = int(os.getenv('ANALYTICS_PRECOMPUTE_INTERVAL', 1800))
+
+# Сколько интервалов живёт опубликованная запись
+PUBLISH_TTL_INTERVALS = 3
+
+# Задержка перед пересчётом по trigger(): несколько триггеров подряд дают один прогон
+TRIGGER_DEBOUNCE = 5
+
+# Аренда пересчёта: как часто воркер проверяет аренду и запросы, и сколько она живёт
+# без продления (продлевается и между payload'ами во время прогона)
+LEASE_NAME = "analytics_precompute"
+LEASE_POLL = 10
+LEASE_TTL = 60
+
+# Payload'ы дашборда аналитики: (метод OptimizedAnalytics, аргументы)
+DASHBOARD_PAYLOADS: List[Tuple[str, tuple]] = [
+    ("get_categories_stats", ()),
+    ("get_subcategories_stats", ()),
+    ("get_colors_stats", ()),
+    ("get_materials_stats", ()),
+    ("get_styles_stats", ()),
+    ("get_trends_timeline", ()),
+    ("get_subsubcategory_timeline", ()),
+    ("get_emerging_trends", ()),
+    ("get_emerging_trends_dynamics", ()),
+    ("get_color_dynamics", ()),
+    ("get_material_dynamics", ()),
+    ("get_trend_predictions", ()),
+    ("get_recommendations", ()),
+    ("get_colors_by_category", ()),
+    ("get_materials_by_category", ()),
+    ("get_styles_by_category", ()),
+] + [
+    (method, (category,))
+    for category in ("Accessories", "Clothing", "Footwear")
+    for method in ("get_top_items_by_category", "get_top_items_dynamics")
+]
+
+
+class AnalyticsPrecomputer:
+    """Фоновый поток, который держит payload'ы дашборда в кеше горячими"""
+
+    def __init__(self, analytics: OptimizedAnalytics, interval: int = PRECOMPUTE_INTERVAL):
+        self.analytics = analytics
+        self.interval = interval
+        self.publish_ttl = max(analytics_cache.ttl, interval * PUBLISH_TTL_INTERVALS)
+        self._trigger = threading.Event()
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self._reasons = []
+        self._next_run = 0.0
+        self._handled_request = 0.0
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self.last_run: Optional[Dict] = None
+
+    def start(self):
+        """Запустить поток (первый прогон - сразу, это прогрев кеша)"""
+        if self._thread and self._thread.is_alive():
+            return
+        # Экземпляр мог быть создан до fork (gunicorn --preload): аренда - на процесс
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._thread = threading.Thread(target=self._loop, name="analytics_precompute", daemon=True)
+        self._thread.start()
+        print(f"🔥 Фоновый пересчёт аналитики запущен (каждые {self.interval} сек)")
+
+    def trigger(self, reason: str):
+        """Запросить внеплановый пересчёт (после парсинга, теггирования, очистки кеша)"""
+        self._reasons.append(reason)
+        analytics_cache.request_refresh()
+        self._trigger.set()
+
+    def _hold_lease(self) -> bool:
+        self.is_leader = analytics_cache.acquire_lease(LEASE_NAME, self.owner, LEASE_TTL)
+        return self.is_leader
+
+    def run_once(self, reason: str = "manual", missing_only: bool = False) -> Dict:
+        """Пересчитать и опубликовать payload'ы; ошибки одного не мешают остальным
+
+        missing_only - только отсутствующие в кеше (инвалидированные или ещё не посчитанные)
+        """
+        with self._run_lock:
+            started = time.time()
+            timings = {}
+            errors = {}
+
+            for method_name, args in DASHBOARD_PAYLOADS:
+                name = method_name + "".join(f"_{arg}" for arg in args)
+                if not self._hold_lease():
+                    errors[name] = "аренда пересчёта перешла к другому воркеру"
+                    break
+                method = getattr(type(self.analytics), method_name)
+                if missing_only and analytics_cache.get(method.cache_key(self.analytics, *args)) is not None:
+                    continue
+                payload_started = time.time()
+                try:
+                    with route_context(f"precompute:{name}"):
+                        method.refresh(self.analytics, *args, ttl=self.publish_ttl)
+                except Exception as e:
+                    errors[name] = str(e)
+                    print(f"❌ Пересчёт {name}: {e}")
+                timings[name] = round(time.time() - payload_started, 3)
+
+            self.last_run = {
+                'reason': reason,
+                'started_at': datetime.fromtimestamp(started).isoformat(),
+                'duration': round(time.time() - started, 3),
+                'payloads': len(timings),
+                'timings': timings,
+                'errors': errors
+            }
+            print(f"✅ Аналитика пересчитана ({reason}): {self.last_run['duration']} сек, "
+                  f"ошибок: {len(errors)}")
+            return self.last_run
+
+    def status(self) -> Dict:
+        """Состояние планировщика для API"""
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'owner': self.owner,
+            'leader': self.is_leader,
+            'interval': self.interval,
+            'publish_ttl': self.publish_ttl,
+            'last_run': self.last_run
+        }
+
+    def _loop(self):
+        reason = "startup"
+        while True:
+            try:
+                if self._hold_lease():
+                    requested = analytics_cache.refresh_requested_at()
+                    if requested > self._handled_request and not reason:
+                        reason = "trigger"
+                    if not reason and time.time() >= self._next_run:
+                        reason = "schedule"
+                    if reason:
+                        # Запросы, пришедшие во время прогона, дадут ещё один прогон
+                        self._handled_request = requested
+                        self.run_once(reason, missing_only=(reason != "schedule"))
+                        self._next_run = time.time() + self.interval
+            except Exception as e:
+                print(f"❌ Ошибка фонового пересчёта аналитики: {e}")
+
+            reason = None
+            if self._trigger.wait(timeout=LEASE_POLL):
+                time.sleep(TRIGGER_DEBOUNCE)
+                self._trigger.clear()
+                reasons, self._reasons = self._reasons, []
+                reason = ", ".join(dict.fromkeys(reasons)) or "trigger"
@@ -0,0 +1,193 @@
+"""Потоковая агрегация для аналитики
+
+Обработчики аналитики раньше делали list(collection.find(...)) и держали в памяти
+весь оттегированный корпус. Здесь курсор читается пакетами (batch_size), сервер
+через $project отдаёт только нужные пути (первая подкатегория, имена цветов,
+материалов и стилей), документы декодируются лениво (RawBSONDocument), а подсчёт
+идёт генераторами - память не зависит от размера коллекции.
+"""
+
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from ximilar_schema import ITEMS_FIELD
+from taxonomy import normalize_subcategory_name
+
+# Размер пакета курсора: ~500 компактных документов - несколько сотен KB
+STREAM_BATCH_SIZE = 500
+
+# Оттегированные, не скрытые и не дубликаты
+TAGGED_MATCH = {
+    ITEMS_FIELD: {"$exists": True, "$ne": []},
+    "hidden": {"$ne": True},
+    "is_duplicate": {"$ne": True}
+}
+
+# То же + есть дата публикации (для временных рядов)
+DATED_MATCH = dict(TAGGED_MATCH, timestamp={"$exists": True, "$ne": "N/A"})
+
+# Облегчённый объект, который возвращает сервер:
+#   c   - top_category
+#   s0  - первая Subcategory, k0 - первая Category
+#   ns  - нормализованная подкатегория, сохранённая при теггировании
+#   col, mat, sty - имена цветов, материалов, стилей (top-k, по убыванию confidence)
+SLIM_ITEM = {
+    "c": "$$obj.c",
+    "s0": {"$arrayElemAt": ["$$obj.s.n", 0]},
+    "k0": {"$arrayElemAt": ["$$obj.k.n", 0]},
+    "ns": "$$obj.ns",
+    "col": "$$obj.col.n",
+    "mat": "$$obj.mat.n",
+    "sty": "$$obj.sty.n",
+}
+
+_RAW_CODEC = CodecOptions(document_class=RawBSONDocument)
+
+
+def stream_images(collection, match: Dict = None, fields: Sequence[str] = (),
+                  slim: bool = True, sort: Dict = None, limit: int = None,
+                  batch_size: int = STREAM_BATCH_SIZE, raw: bool = True) -> Iterator:
+    """Итерирует изображения с облегчёнными объектами, не загружая коллекцию целиком
+
+    Args:
+        match: условие $match (по умолчанию TAGGED_MATCH)
+        fields: дополнительные поля документа (timestamp, likes_count, ...)
+        slim: True - объекты в виде SLIM_ITEM под ключом 'items',
+              False - компактные объекты целиком под ITEMS_FIELD (нужны confidence
+              и прочие атрибуты; читаются через ximilar_schema.read_objects)
+        raw: декодировать документы лениво (RawBSONDocument)
+    """
+    project = {field: 1 for field in fields}
+    if slim:
+        project["items"] = {"$map": {"input": f"${ITEMS_FIELD}", "as": "obj", "in": SLIM_ITEM}}
+    else:
+        project[ITEMS_FIELD] = 1
+
+    pipeline = [{"$match": match if match is not None else TAGGED_MATCH}]
+    if sort:
+        pipeline.append({"$sort": sort})
+    if limit:
+        pipeline.append({"$limit": limit})
+    pipeline.append({"$project": project})
+
+    source = collection.with_options(codec_options=_RAW_CODEC) if raw else collection
+    return source.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+
+
+def items_of(doc) -> Iterable:
+    """Объекты изображения из stream_images"""
+    return doc.get("items") or ()
+
+
+def slim_subcategory(item, fallback_to_category: bool = True) -> Optional[str]:
+    """Первая Subcategory, а если её нет - первая Category"""
+    name = item.get("s0")
+    if not name and fallback_to_category:
+        name = item.get("k0")
+    return name
+
+
+def slim_normalized(item) -> Optional[str]:
+    """Нормализованная подкатегория: сохранённая "ns" или расчёт по таксономии"""
+    if item.get("ns"):
+        return item["ns"]
+    subcategory = slim_subcategory(item)
+    if not subcategory:
+        return None
+    return normalize_subcategory_name(subcategory, item.get("c") or "Other")
+
+
+def slim_names(item, key: str) -> Sequence[str]:
+    """Имена цветов/материалов/стилей облегчённого объекта"""
+    return item.get(key) or ()
+
+
+def month_of(doc) -> Optional[str]:
+    """YYYY-MM из timestamp документа"""
+    timestamp = doc.get("timestamp")
+    if not timestamp or timestamp == "N/A":
+        return None
+    return timestamp[:7]
+
+
+# ============================================
+# СЧЁТЧИКИ НА ГЕНЕРАТОРАХ
+# ============================================
+
+def count_per_image(docs: Iterable, keys_func: Callable) -> Counter:
+    """Сколько изображений содержит каждый ключ (ключ считается один раз на изображение)"""
+    counts = Counter()
+    for doc in docs:
+        counts.update(set(keys_func(doc)))
+    return counts
+
+
+def count_per_image_by_month(docs: Iterable, keys_func: Callable) -> Dict[str, Counter]:
+    """То же, что count_per_image, но с разбивкой по месяцам {YYYY-MM: Counter}"""
+    monthly = defaultdict(Counter)
+    for doc in docs:
+        month = month_of(doc)
+        if month is None:
+            continue
+        monthly[month].update(set(keys_func(doc)))
+    return monthly
+
+
+def sum_per_image(docs: Iterable, keys_func: Callable, value_func: Callable) -> Dict[str, Dict]:
+    """Сумма значения (engagement, likes) по ключам: {key: {'total': ..., 'count': ...}}"""
+    totals = defaultdict(lambda: {'total': 0, 'count': 0})
+    for doc in docs:
+        value = value_func(doc)
+        for key in set(keys_func(doc)):
+            totals[key]['total'] += value
+            totals[key]['count'] += 1
+    return totals
+
+
+# ============================================
+# ТИПОВЫЕ ФУНКЦИИ КЛЮЧЕЙ
+# ============================================
+
+def attribute_keys(key: str) -> Callable:
+    """Функция ключей: все значения атрибута ('col', 'mat', 'sty') во всех объектах"""
+    def keys(doc):
+        for item in items_of(doc):
+            yield from slim_names(item, key)
+    return keys
+
+
+def category_keys(doc) -> Iterator[str]:
+    """Top category всех объектов изображения"""
+    for item in items_of(doc):
+        yield item.get("c") or "Other"
+
+
+def normalized_subcategory_keys(doc) -> Iterator[str]:
+    """Ключи 'category:normalized_subcategory' объектов изображения (для потоковых счётчиков)"""
+    for item in items_of(doc):
+        normalized = slim_normalized(item)
+        if normalized:
+            yield f"{item.get('c') or 'Other'}:{normalized}"
+
+
+def top_item_keys(top_category: str) -> Callable:
+    """Функция ключей 'подкатегория (цвет)' для объектов заданной top category
+
+    Берётся только конкретная Subcategory (не общая Category); объект без цвета
+    даёт ключ из одной подкатегории.
+    """
+    def keys(doc):
+        for item in items_of(doc):
+            if item.get('c') != top_category:
+                continue
+            subcategory = slim_subcategory(item, fallback_to_category=False)
+            if not subcategory:
+                continue
+            colors = slim_names(item, 'col')
+            if colors:
+                for color in colors:
+                    yield f"{subcategory} ({color})"
+            else:
+                yield subcategory
+    return keys
@@ -0,0 +1,106 @@
+"""Фабрика веб-приложения
+
+create_app() собирает Flask-приложение из blueprint'ов:
+    routes_gallery   - галереи, подгрузка, фильтры, скрытие
+    routes_ingestion - парсинг Instagram, сессии, Socket.IO, телеметрия загрузки
+    routes_tagging   - отметка для теггирования и запуск Ximilar
+    routes_analytics - дашборд и /api/analytics/*
+    routes_ops       - /metrics, медленные запросы, профили
+
+Сборка не подключается к MongoDB и не импортирует тяжёлые зависимости (PIL,
+imagehash, Apify, Ximilar) - они загружаются при первом запросе, которому нужны.
+Бюджет времени холодного старта проверяет check_startup_time.py.
+
+Фоновые задачи веб-процесса (start_background) - прогрев и плановый пересчёт
+кеша аналитики, загрузка FashionCLIP, сверка индексов MongoDB с реестром - запускаются из create_app(), а не из
+`if __name__ == '__main__'`: так их получают и start_web_parser.py, и gunicorn.
+Запуск - один раз на процесс; воркер, форкнутый после create_app() (gunicorn
+--preload), запускает их при первом запросе. WEB_BACKGROUND_TASKS=0 отключает
+их (тесты, проверка старта, скрипты, которым нужно только приложение).
+"""
+
+import os
+import threading
+from flask import Flask
+import metrics
+import profiling
+from app_context import STATIC_DIR, socketio, get_collection, get_precomputer
+from taxonomy import normalize_subcategory_name
+
+_background_lock = threading.Lock()
+_background_pid = None
+
+
+def background_enabled() -> bool:
+    return os.getenv('WEB_BACKGROUND_TASKS', '1') != '0'
+
+
+def _run_background():
+    """Тело фонового потока: MongoDB и тяжёлые модули - здесь, а не в create_app()"""
+    try:
+        # Прогрев кеша аналитики и плановый пересчёт до истечения TTL
+        get_precomputer().start()
+    except Exception as e:
+        print(f"⚠️  Фоновый пересчёт аналитики не запущен: {e}")
+
+    # FashionCLIP грузится в фоне: пре-скрин и дедупликация не ждут модель внутри запроса
+    import clip_encoder
+    clip_encoder.warm_up()
+
+    # Последней: построение индекса может занять минуты, остальное его не ждёт
+    from index_registry import apply_on_startup
+    try:
+        apply_on_startup(get_collection().database)
+    except Exception as e:
+        print(f"⚠️  Не удалось сверить индексы: {e}")
+
+
+def start_background() -> bool:
+    """Запустить фоновые задачи веб-процесса (один раз на процесс); False - уже запущены или выключены"""
+    global _background_pid
+    if not background_enabled():
+        return False
+    pid = os.getpid()
+    if _background_pid == pid:
+        return False
+    with _background_lock:
+        if _background_pid == pid:
+            return False
+        _background_pid = pid
+    threading.Thread(target=_run_background, name="web_background", daemon=True).start()
+    return True
+
+
+def _ensure_background():
+    # Потоки не переживают fork: воркер, получивший готовое приложение, запускает свои
+    start_background()
+
+
+def create_app() -> Flask:
+    """Создать приложение и привязать к нему Socket.IO"""
+    app = Flask(__name__, static_folder=STATIC_DIR, static_url_path='/static')
+    app.config['SECRET_KEY'] = os.urandom(24)
+
+    # Время запросов по маршрутам и команды MongoDB (слушатель - до создания MongoClient)
+    metrics.init_app(app)
+    metrics.register_mongo_listener()
+
+    # Профилирование отдельных запросов по токену администратора (X-Profile / ?__profile=)
+    profiling.init_app(app)
+
+    from routes_gallery import bp as gallery_bp
+    from routes_ingestion import bp as ingestion_bp
+    from routes_tagging import bp as tagging_bp
+    from routes_analytics import bp as analytics_bp
+    from routes_ops import bp as ops_bp
+    for blueprint in (gallery_bp, ingestion_bp, tagging_bp, analytics_bp, ops_bp):
+        app.register_blueprint(blueprint)
+
+    # Добавляем глобальную функцию для Jinja2
+    app.jinja_env.globals['normalize_subcategory'] = normalize_subcategory_name
+
+    socketio.init_app(app)
+
+    app.before_request(_ensure_background)
+    start_background()
+    return app
@@ -0,0 +1,5 @@
+"""Бенчмарки аналитики, галерей и дедупликации на синтетическом корпусе
+
+    python -m benchmarks.corpus --size 10k --drop      # сгенерировать и загрузить корпус
+    python -m benchmarks.runner --label 10k            # прогнать эндпоинты, сравнить с baseline
+"""
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Детерминированный генератор синтетического корпуса изображений
+
+Документы повторяют то, что пишут парсер и теггер: username, post_id, timestamp,
+likes/comments, local_filename, perceptual hash (с долей почти-дубликатов) и
+результат Ximilar - структурированные объекты с Category, Subcategory, Color,
+Material и Style, которые сохраняются тем же build_tag_update, что и в продакшене
+(или в legacy-поле ximilar_objects_structured для проверки миграции).
+
+Одинаковые seed и size дают побитово одинаковый корпус.
+
+    python -m benchmarks.corpus --size 10k --drop
+    python -m benchmarks.corpus --size 1m --uri mongodb://localhost:27018/instagram_gallery --drop
+"""
+
+import os
+import random
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+from urllib.parse import urlparse
+from pymongo import MongoClient
+from ximilar_schema import build_tag_update
+
+DEFAULT_URI = 'mongodb://localhost:27017/instagram_gallery'
+DEFAULT_SEED = 287
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+# Доли состояний документа
+TAGGED_SHARE = 0.7
+SELECTED_SHARE = 0.1
+HIDDEN_SHARE = 0.05
+DUPLICATE_SHARE = 0.04
+
+USERS = 200
+MONTHS = 18
+START_DATE = datetime(2024, 6, 1)
+
+# {top_category: {Category: [Subcategory, ...]}}
+VOCABULARY = {
+    "Clothing": {
+        "dresses": ["midi dresses", "maxi dresses", "mini dresses", "slip dresses", "shirt dresses"],
+        "pants": ["jeans", "wide leg pants", "cargo pants", "leggings", "trousers"],
+        "tops": ["t-shirts", "blouses", "tank tops", "crop tops", "shirts"],
+        "jackets": ["blazers", "leather jackets", "denim jackets", "trench coats", "cardigans"],
+        "skirts": ["midi skirts", "mini skirts", "pleated skirts"],
+        "shorts": ["denim shorts", "bermuda shorts"],
+    },
+    "Accessories": {
+        "bags": ["baguette bags", "tote bags", "crossbody bags", "clutches", "long strap bags", "bucket bags"],
+        "sunglasses": ["cat eye sunglasses", "aviator sunglasses", "oval sunglasses"],
+        "jewelry": ["necklaces", "earrings", "bracelets", "rings"],
+        "hats": ["baseball caps", "bucket hats", "fedoras", "beanies"],
+        "belts": ["leather belts", "chain belts"],
+        "scarves": ["silk scarves", "wool scarves"],
+    },
+    "Footwear": {
+        "sneakers": ["low top sneakers", "high top sneakers", "running shoes"],
+        "boots": ["ankle boots", "knee high boots", "chelsea boots", "cowboy boots"],
+        "heels": ["pumps", "stiletto heels", "block heels", "mules"],
+        "sandals": ["flat sandals", "heeled sandals", "flip-flops"],
+        "flats": ["ballet flats", "loafers"],
+    },
+}
+TOP_CATEGORY_WEIGHTS = {"Clothing": 0.55, "Accessories": 0.3, "Footwear": 0.15}
+
+COLORS = ["black", "white", "beige", "brown", "blue", "grey", "pink", "red", "green",
+          "cream", "navy", "khaki", "yellow", "purple", "orange", "silver", "gold", "burgundy"]
+MATERIALS = ["cotton", "denim", "leather", "silk", "wool", "linen", "knit", "suede",
+             "polyester", "satin", "lace", "velvet", "metal", "straw"]
+STYLES = ["casual", "elegant", "streetwear", "minimalist", "boho", "sporty", "vintage",
+          "office", "romantic", "edgy", "preppy"]
+
+
+def parse_size(value: str) -> int:
+    """'10k', '100k', '1m' или число"""
+    value = value.lower()
+    if value in SIZES:
+        return SIZES[value]
+    if value.endswith("k"):
+        return int(float(value[:-1]) * 1_000)
+    if value.endswith("m"):
+        return int(float(value[:-1]) * 1_000_000)
+    return int(value)
+
+
+def _zipf_weights(count: int, exponent: float = 1.1) -> List[float]:
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def _attribute(rng: random.Random, names: List[str], weights: List[float], top_k: int) -> List[Dict]:
+    """Значения атрибута Ximilar по убыванию confidence"""
+    values = []
+    for name in rng.choices(names, weights=weights, k=top_k):
+        if name not in (v["name"] for v in values):
+            values.append({"name": name, "confidence": round(rng.uniform(0.3, 0.99), 3)})
+    values.sort(key=lambda v: v["confidence"], reverse=True)
+    return values
+
+
+class CorpusGenerator:
+    """Генератор документов коллекции images"""
+
+    def __init__(self, seed: int = DEFAULT_SEED):
+        self.rng = random.Random(seed)
+        self.users = [f"bench_user_{i:03d}" for i in range(USERS)]
+        self.user_weights = _zipf_weights(USERS)
+        self.color_weights = _zipf_weights(len(COLORS), 0.8)
+        self.material_weights = _zipf_weights(len(MATERIALS), 0.8)
+        self.style_weights = _zipf_weights(len(STYLES), 0.8)
+        # Более поздние месяцы - больше постов (корпус растёт)
+        self.month_weights = [1 + month / 6 for month in range(MONTHS)]
+        self.hashes: List[str] = []
+
+    def _object(self) -> Dict:
+        rng = self.rng
+        top_category = rng.choices(list(TOP_CATEGORY_WEIGHTS), weights=list(TOP_CATEGORY_WEIGHTS.values()))[0]
+        categories = VOCABULARY[top_category]
+        category = rng.choice(list(categories))
+        subcategories = categories[category]
+        subcategory = rng.choices(subcategories, weights=_zipf_weights(len(subcategories)))[0]
+
+        other = {"Category": [{"name": category, "confidence": round(rng.uniform(0.7, 0.99), 3)}]}
+        if rng.random() < 0.9:
+            other["Subcategory"] = [{"name": subcategory, "confidence": round(rng.uniform(0.4, 0.99), 3)}]
+            if rng.random() < 0.3:
+                other["Subcategory"].append({"name": rng.choice(subcategories), "confidence": round(rng.uniform(0.1, 0.4), 3)})
+
+        return {
+            "name": subcategory.title(),
+            "top_category": top_category,
+            "probability": round(rng.uniform(0.5, 0.99), 3),
+            "properties": {
+                "other_attributes": other,
+                "visual_attributes": {"Color": _attribute(rng, COLORS, self.color_weights, 3)},
+                "material_attributes": {"Material": _attribute(rng, MATERIALS, self.material_weights, 2)},
+                "style_attributes": {"Style": _attribute(rng, STYLES, self.style_weights, 2)},
+            },
+        }
+
+    def _image_hash(self) -> Tuple[str, bool]:
+        """64-битный pHash в hex; доля - почти-дубликаты уже выданных хешей"""
+        rng = self.rng
+        if self.hashes and rng.random() < DUPLICATE_SHARE:
+            value = int(rng.choice(self.hashes), 16)
+            for _ in range(rng.randint(0, 4)):
+                value ^= 1 << rng.randrange(64)
+            return f"{value:016x}", True
+        image_hash = f"{rng.getrandbits(64):016x}"
+        self.hashes.append(image_hash)
+        return image_hash, False
+
+    def document(self, index: int, schema: str = "compact") -> Dict:
+        """Документ изображения номер index"""
+        rng = self.rng
+        username = rng.choices(self.users, weights=self.user_weights)[0]
+        month = rng.choices(range(MONTHS), weights=self.month_weights)[0]
+        posted = START_DATE + timedelta(days=month * 30 + rng.randrange(30), seconds=rng.randrange(86400))
+        image_hash, is_duplicate = self._image_hash()
+
+        doc = {
+            "post_id": f"bench_{index}",
+            "username": username,
+            "timestamp": posted.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "parsed_at": (posted + timedelta(days=rng.randrange(3))).isoformat(),
+            "likes_count": int(rng.lognormvariate(6, 1.2)),
+            "comments_count": int(rng.lognormvariate(2.5, 1.0)),
+            "caption": f"look {index}",
+            "image_url": f"https://bench.invalid/{index}.jpg",
+            "full_image_url": f"https://bench.invalid/{index}.jpg",
+            "local_filename": f"bench_{index}.jpg",
+            "image_hash": image_hash,
+        }
+
+        if is_duplicate:
+            doc["is_duplicate"] = True
+        if rng.random() < HIDDEN_SHARE:
+            doc["hidden"] = True
+            doc["hidden_at"] = doc["parsed_at"]
+
+        if rng.random() < TAGGED_SHARE:
+            objects = [self._object() for _ in range(rng.choices([1, 2, 3, 4], weights=[3, 4, 2, 1])[0])]
+            if schema == "legacy":
+                doc["ximilar_objects_structured"] = objects
+                doc["ximilar_total_objects"] = len(objects)
+                doc["ximilar_tagged_at"] = doc["parsed_at"]
+            else:
+                doc.update(build_tag_update({"success": True, "objects": objects})["$set"])
+                # Время теггирования - из корпуса, а не текущее (детерминизм)
+                doc["ximilar_tagged_at"] = doc["tagged_at"] = doc["parsed_at"]
+        elif rng.random() < SELECTED_SHARE / (1 - TAGGED_SHARE):
+            doc["selected_for_tagging"] = True
+            doc["selected_at"] = doc["parsed_at"]
+
+        return doc
+
+    def documents(self, size: int, schema: str = "compact") -> Iterator[Dict]:
+        for index in range(size):
+            yield self.document(index, schema)
+
+
+def is_local_uri(uri: str) -> bool:
+    """Загружать корпус разрешено только в локальный mongod"""
+    host = urlparse(uri).hostname or ""
+    return host in ("localhost", "127.0.0.1", "::1")
+
+
+def load_corpus(collection, size: int, seed: int = DEFAULT_SEED, schema: str = "compact",
+                batch_size: int = 1000) -> int:
+    """Вставить корпус пакетами insert_many"""
+    batch = []
+    inserted = 0
+    for doc in CorpusGenerator(seed).documents(size, schema):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+            if inserted % (batch_size * 50) == 0:
+                print(f"   ... {inserted}/{size}")
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+def main():
+    """CLI генерации и загрузки корпуса"""
+    parser = argparse.ArgumentParser(description="Синтетический корпус для бенчмарков")
+    parser.add_argument("--size", default="10k", help="10k, 100k, 1m или число документов")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed генератора")
+    parser.add_argument("--uri", default=os.getenv('BENCH_MONGODB_URI', DEFAULT_URI), help="MongoDB URI (только localhost)")
+    parser.add_argument("--schema", choices=["compact", "legacy"], default="compact",
+                        help="compact - ximilar_items, legacy - ximilar_objects_structured")
+    parser.add_argument("--drop", action="store_true", help="Удалить коллекцию перед загрузкой")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Размер пакета insert_many")
+    args = parser.parse_args()
+
+    if not is_local_uri(args.uri):
+        parser.error("корпус загружается только в локальный mongod (localhost)")
+
+    size = parse_size(args.size)
+    client = MongoClient(args.uri)
+    collection = client.get_default_database('instagram_gallery')['images']
+
+    print(f"🧪 СИНТЕТИЧЕСКИЙ КОРПУС: {size} документов, seed={args.seed}, схема {args.schema}")
+    print(f"   {args.uri} -> {collection.full_name}")
+    print("=" * 70)
+
+    existing = collection.estimated_document_count()
+    if existing and not args.drop:
+        print(f"❌ Коллекция уже содержит {existing} документов, используйте --drop")
+        return
+    if args.drop:
+        collection.drop()
+
+    inserted = load_corpus(collection, size, args.seed, args.schema, args.batch_size)
+
+    from index_registry import ensure_indexes
+    ensure_indexes(collection.database)
+
+    print(f"✅ Загружено {inserted} документов, индексы из index_registry созданы")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Раннер бенчмарков: эндпоинты аналитики, галерей и фильтров + дедупликация при загрузке
+
+Запросы идут через Flask test client к web_parser.app, подключённому к локальному
+корпусу (benchmarks/corpus.py). Для каждого эндпоинта - p50/p95 по --repeat
+запускам и пик Python-аллокаций (tracemalloc, отдельный прогон, чтобы трассировка
+не искажала время). По умолчанию кеш аналитики очищается перед каждым запросом
+(холодный путь); --cache warm меряет ответ из кеша.
+
+Результат пишется в benchmarks/results/, сравнение - с benchmarks/baselines/<label>.json:
+
+    python -m benchmarks.runner --label 10k --save-baseline   # зафиксировать baseline
+    python -m benchmarks.runner --label 10k                   # сравнить, exit 1 при регрессии
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import logging
+import random
+import argparse
+import platform
+import resource
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINES_DIR = os.path.join(BENCH_DIR, "baselines")
+
+DEFAULT_URI = 'mongodb://localhost:27017/instagram_gallery'
+
+# Регрессия: медленнее baseline больше чем на tolerance И больше чем на MIN_DELTA_MS
+DEFAULT_TOLERANCE = 0.2
+MIN_DELTA_MS = 5.0
+
+# (группа, URL)
+ENDPOINTS = [
+    ("analytics", "/api/analytics/categories-stats"),
+    ("analytics", "/api/analytics/subcategories-stats"),
+    ("analytics", "/api/analytics/colors-stats"),
+    ("analytics", "/api/analytics/materials-stats"),
+    ("analytics", "/api/analytics/styles-stats"),
+    ("analytics", "/api/analytics/trends-timeline"),
+    ("analytics", "/api/analytics/subsubcategory-timeline"),
+    ("analytics", "/api/analytics/subsubcategory-single?category=Accessories&name=tote+bags"),
+    ("analytics", "/api/analytics/emerging-trends"),
+    ("analytics", "/api/analytics/emerging-trends-dynamics"),
+    ("analytics", "/api/analytics/color-dynamics"),
+    ("analytics", "/api/analytics/material-dynamics"),
+    ("analytics", "/api/analytics/trend-predictions"),
+    ("analytics", "/api/analytics/recommendations"),
+    ("analytics", "/api/analytics/top-accessories-stats"),
+    ("analytics", "/api/analytics/top-accessories-dynamics"),
+    ("analytics", "/api/analytics/top-clothing-stats"),
+    ("analytics", "/api/analytics/top-clothing-dynamics"),
+    ("analytics", "/api/analytics/top-footwear-stats"),
+    ("analytics", "/api/analytics/top-footwear-dynamics"),
+    ("analytics", "/api/analytics/item-gallery?item_name=tote+bags+(black)&top_category=Accessories"),
+    ("analytics", "/api/analytics/colors-by-category"),
+    ("analytics", "/api/analytics/materials-by-category"),
+    ("analytics", "/api/analytics/styles-by-category"),
+    ("gallery", "/gallery"),
+    ("gallery", "/gallery_to_tag"),
+    ("gallery", "/gallery_tagged"),
+    ("gallery", "/gallery_hidden"),
+    ("gallery", "/api/load-more-images?gallery_type=gallery_tagged&offset=50&limit=50"),
+    ("gallery", "/api/get-bloggers?gallery_type=gallery_tagged"),
+    ("gallery", "/api/bloggers-stats"),
+    ("filter", "/api/filter-options"),
+    ("filter", "/api/filtered-images?category=Accessories&colors[]=black"),
+    ("filter", "/api/filtered-images?category=Clothing&subcategory=Dresses&materials[]=silk"),
+]
+
+# Сколько хешей проверять в пути дедупликации (половина - почти-дубликаты, половина - новые)
+DEDUP_SAMPLES = 20
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    rank = max(1, int(round(share * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def measure(call: Callable[[], None], repeat: int, before: Callable[[], None]) -> Dict:
+    """Время repeat вызовов (после одного прогревочного) и пик аллокаций"""
+    sink = io.StringIO()
+    with redirect_stdout(sink):
+        before()
+        call()  # прогрев: импорты, шаблоны, соединения
+
+        timings = []
+        for _ in range(repeat):
+            before()
+            started = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - started) * 1000)
+
+        before()
+        tracemalloc.start()
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "p50_ms": round(percentile(timings, 0.5), 2),
+        "p95_ms": round(percentile(timings, 0.95), 2),
+        "min_ms": round(min(timings), 2),
+        "peak_alloc_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+def endpoint_call(client, url: str) -> Callable[[], None]:
+    def call():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url}: HTTP {response.status_code}")
+        if response.is_json and response.get_json().get("success") is False:
+            raise RuntimeError(f"{url}: {response.get_json().get('message')}")
+    return call
+
+
+def dedup_call(parser, hashes: List[str]) -> Callable[[], None]:
+    """Путь дедупликации при загрузке: InstagramParser.is_duplicate_by_hash"""
+    def call():
+        for image_hash in hashes:
+            parser.is_duplicate_by_hash(image_hash, threshold=5)
+    return call
+
+
+def cascade_call(detector, hashes: List[str]) -> Callable[[], None]:
+    """Каскад отпечатков DuplicateDetector (индекс загружен заранее, как в сессии скачивания)"""
+    def call():
+        for image_hash in hashes:
+            detector.check(image_hash)
+    return call
+
+
+def dedup_sample(collection, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    existing = [doc["image_hash"] for doc in collection.find(
+        {"image_hash": {"$exists": True}}, {"image_hash": 1}
+    ).sort("_id", 1).limit(DEDUP_SAMPLES // 2)]
+    hashes = []
+    for image_hash in existing:
+        value = int(image_hash, 16) ^ (1 << rng.randrange(64))
+        hashes.append(f"{value:016x}")
+    while len(hashes) < DEDUP_SAMPLES:
+        hashes.append(f"{rng.getrandbits(64):016x}")
+    return hashes
+
+
+def run(uri: str, repeat: int, cache_mode: str, only: Optional[str] = None) -> Dict:
+    """Прогнать все эндпоинты и путь дедупликации"""
+    # Окружение до импорта web_parser: корпус, кеш в памяти процесса
+    os.environ['MONGODB_URI'] = uri
+    os.environ['ANALYTICS_CACHE_BACKEND'] = 'memory'
+    os.environ.setdefault('APIFY_API_TOKEN', 'benchmark')
+
+    with redirect_stdout(io.StringIO()):
+        import web_parser
+        from analytics_cache import analytics_cache
+        from instagram_parser import InstagramParser
+
+    # INFO-логи OptimizedAnalytics на каждый вызов только шумят в отчёте
+    logging.getLogger('optimized_analytics').setLevel(logging.WARNING)
+
+    client = web_parser.app.test_client()
+    before = analytics_cache.clear if cache_mode == "cold" else (lambda: None)
+
+    results = {}
+    for group, url in ENDPOINTS:
+        if only and only not in url:
+            continue
+        try:
+            results[url] = dict(group=group, **measure(endpoint_call(client, url), repeat, before))
+        except Exception as e:
+            results[url] = {"group": group, "error": str(e)}
+        print(f"   {url}: {results[url]}")
+
+    if not only or only in "dedup":
+        parser = InstagramParser(os.environ['APIFY_API_TOKEN'], uri)
+        with redirect_stdout(io.StringIO()):
+            parser.connect_mongodb()
+        hashes = dedup_sample(parser.collection, seed=len(ENDPOINTS))
+        name = f"ingestion:is_duplicate_by_hash x{len(hashes)}"
+        results[name] = dict(group="ingestion", **measure(dedup_call(parser, hashes), repeat, lambda: None))
+        print(f"   {name}: {results[name]}")
+
+        from near_duplicates import DuplicateDetector
+        detector = DuplicateDetector(parser.collection, use_embeddings=False)
+        detector.check(None)
+        name = f"ingestion:fingerprint_cascade x{len(hashes)}"
+        results[name] = dict(group="ingestion", **measure(cascade_call(detector, hashes), repeat, lambda: None))
+        print(f"   {name}: {results[name]}")
+
+    corpus_size = web_parser.optimized_analytics.collection.estimated_document_count()
+    return {
+        "created_at": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "corpus_size": corpus_size,
+        "cache_mode": cache_mode,
+        "repeat": repeat,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """Эндпоинты, которые стали медленнее baseline"""
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base or "error" in base or "error" in result:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            delta = result[metric] - base[metric]
+            if delta > MIN_DELTA_MS and result[metric] > base[metric] * (1 + tolerance):
+                regressions.append({
+                    "endpoint": name, "metric": metric,
+                    "baseline": base[metric], "current": result[metric],
+                    "change": f"+{delta / base[metric] * 100:.0f}%" if base[metric] else "new",
+                })
+    return regressions
+
+
+def print_report(report: Dict, baseline: Optional[Dict]):
+    print(f"\n📊 Корпус: {report['corpus_size']} документов, кеш: {report['cache_mode']}, "
+          f"повторов: {report['repeat']}, max RSS: {report['max_rss_mb']} MB")
+    print(f"{'эндпоинт':<70} {'p50 ms':>9} {'p95 ms':>9} {'alloc MB':>9} {'baseline p50':>13}")
+    print("-" * 114)
+    for name, result in report["results"].items():
+        if "error" in result:
+            print(f"{name[:70]:<70} ❌ {result['error']}")
+            continue
+        base = (baseline or {}).get("results", {}).get(name, {})
+        base_p50 = f"{base['p50_ms']:.2f}" if "p50_ms" in base else "-"
+        print(f"{name[:70]:<70} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+              f"{result['peak_alloc_mb']:>9.2f} {base_p50:>13}")
+
+
+def main():
+    """CLI раннера"""
+    parser = argparse.ArgumentParser(description="Бенчмарк эндпоинтов на синтетическом корпусе")
+    parser.add_argument("--uri", default=os.getenv('BENCH_MONGODB_URI', DEFAULT_URI), help="MongoDB с корпусом")
+    parser.add_argument("--label", default="10k", help="Имя baseline (обычно размер корпуса)")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов на эндпоинт")
+    parser.add_argument("--cache", choices=["cold", "warm"], default="cold", help="Очищать кеш аналитики перед запросом")
+    parser.add_argument("--only", help="Только эндпоинты, URL которых содержит подстроку")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Допустимое замедление (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Сохранить результат как baseline")
+    args = parser.parse_args()
+
+    from benchmarks.corpus import is_local_uri
+    if not is_local_uri(args.uri):
+        parser.error("бенчмарк запускается только на локальном корпусе (localhost)")
+
+    print(f"⏱️  БЕНЧМАРК: {args.uri}, label={args.label}")
+    print("=" * 70)
+    report = run(args.uri, args.repeat, args.cache, args.only)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    result_path = os.path.join(RESULTS_DIR, f"{args.label}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    baseline_path = os.path.join(BASELINES_DIR, f"{args.label}-{args.cache}.json")
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print_report(report, baseline)
+    print(f"\n💾 Результат: {result_path}")
+
+    if args.save_baseline:
+        os.makedirs(BASELINES_DIR, exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📌 Baseline сохранён: {baseline_path}")
+        return
+
+    if baseline is None:
+        print(f"⚠️  Baseline {baseline_path} не найден, сравнение пропущено (--save-baseline)")
+        return
+
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ РЕГРЕССИИ относительно baseline ({baseline.get('commit')}):")
+        for regression in regressions:
+            print(f"   {regression['endpoint']} {regression['metric']}: "
+                  f"{regression['baseline']} -> {regression['current']} ms ({regression['change']})")
+        sys.exit(1)
+    print(f"\n✅ Регрессий нет (допуск {args.tolerance:.0%}, baseline {baseline.get('commit')})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Теги зависимостей кеша аналитики и инвалидация по изменениям данных
+
+Запись кеша помечается тегами данных, от которых она зависит:
+    tagged_corpus        - весь оттегированный корпус (статистика, тренды, динамика)
+    category:<name>      - объекты одной top category (топ вещей категории)
+    gallery:<type>       - вкладка галереи (gallery, gallery_to_tag, gallery_tagged,
+                           gallery_no_fashion, gallery_hidden)
+    excluded_images      - скрытые изображения и дубликаты (исключаются из поиска)
+
+Изменение изображений (скрытие, теггирование, отметка, дубликаты) даёт набор тегов
+изменённых документов ДО и ПОСЛЕ изменения: изображение, которое переехало из
+одной вкладки в другую, задевает обе. Инвалидируются только записи с этими тегами.
+
+    tags_before = snapshot_tags(collection, query)
+    collection.update_many(query, ...)
+    invalidate_images(collection, query, tags_before)
+"""
+
+from typing import Dict, Iterable, Set
+from ximilar_schema import ITEMS_FIELD, NO_FASHION_FIELD
+from analytics_cache import analytics_cache
+
+TAGGED_CORPUS = "tagged_corpus"
+EXCLUDED_IMAGES = "excluded_images"
+
+GALLERY_TYPES = ("gallery", "gallery_to_tag", "gallery_tagged", "gallery_no_fashion", "gallery_hidden")
+
+# Поля документа, по которым считаются теги
+DEPENDENCY_PROJECTION = {
+    f"{ITEMS_FIELD}.c": 1,
+    "hidden": 1, "is_duplicate": 1, "selected_for_tagging": 1, "local_filename": 1, NO_FASHION_FIELD: 1
+}
+
+
+def category_tag(category: str) -> str:
+    return f"category:{category}"
+
+
+def gallery_tag(gallery_type: str) -> str:
+    return f"gallery:{gallery_type}"
+
+
+def gallery_type_of(doc: Dict):
+    """Вкладка галереи, на которой показывается изображение (None - ни на какой)"""
+    if not doc.get("local_filename"):
+        return None
+    if doc.get("hidden") is True:
+        return "gallery_hidden"
+    if doc.get("is_duplicate") is True:
+        return None
+    if doc.get(NO_FASHION_FIELD) is True:
+        return "gallery_no_fashion"
+    if doc.get(ITEMS_FIELD):
+        return "gallery_tagged"
+    if doc.get("selected_for_tagging") is True:
+        return "gallery_to_tag"
+    return "gallery"
+
+
+def image_tags(doc: Dict) -> Set[str]:
+    """Теги данных, которые затрагивает изменение этого изображения"""
+    tags = set()
+    items = doc.get(ITEMS_FIELD) or []
+    if items:
+        tags.add(TAGGED_CORPUS)
+        for item in items:
+            tags.add(category_tag(item.get("c") or "Other"))
+
+    if doc.get("hidden") is True or doc.get("is_duplicate") is True:
+        tags.add(EXCLUDED_IMAGES)
+
+    gallery_type = gallery_type_of(doc)
+    if gallery_type:
+        tags.add(gallery_tag(gallery_type))
+    return tags
+
+
+def snapshot_tags(collection, query: Dict) -> Set[str]:
+    """Теги изображений, подходящих под запрос (снимок до изменения)"""
+    tags = set()
+    for doc in collection.find(query, DEPENDENCY_PROJECTION):
+        tags |= image_tags(doc)
+    return tags
+
+
+def invalidate_tags(tags: Iterable[str], reason: str = "") -> int:
+    """Удалить записи кеша, зависящие от тегов"""
+    tags = set(tags)
+    if not tags:
+        return 0
+    removed = analytics_cache.invalidate_tags(tags)
+    print(f"🧹 Инвалидация кеша{f' ({reason})' if reason else ''}: "
+          f"{removed} записей по {len(tags)} тегам")
+    return removed
+
+
+def invalidate_images(collection, query: Dict, tags_before: Set[str] = frozenset(), reason: str = "") -> Set[str]:
+    """Инвалидировать записи, зависящие от изменённых изображений (до и после изменения)"""
+    tags = set(tags_before) | snapshot_tags(collection, query)
+    invalidate_tags(tags, reason)
+    return tags
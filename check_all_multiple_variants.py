@@ -8,6 +8,7 @@ import os
 import pymongo
 from collections import defaultdict
 from dotenv import load_dotenv
+from ximilar_schema import ITEMS_FIELD, TAGGED_QUERY, read_objects
 
 load_dotenv()
 load_dotenv('mongodb_config.env')
@@ -28,9 +29,9 @@ def main():
         {
             "local_filename": {"$exists": True},
             "hidden": {"$ne": True},
-            "ximilar_objects_structured": {"$exists": True, "$ne": []}
+            **TAGGED_QUERY
         },
-        {"_id": 1, "local_filename": 1, "ximilar_objects_structured": 1}
+        {"_id": 1, "local_filename": 1, ITEMS_FIELD: 1}
     ))
 
     print(f"📊 Всего изображений для анализа: {len(images)}")
@@ -40,7 +41,7 @@ def main():
     multi_variant_subcats = defaultdict(lambda: {"count": 0, "examples": []})
 
     for image in images:
-        for obj in image.get('ximilar_objects_structured', []):
+        for obj in read_objects(image):
             if obj.get('properties') and obj['properties'].get('other_attributes'):
                 other_attrs = obj['properties']['other_attributes']
 
@@ -4,6 +4,7 @@
 import os
 from pymongo import MongoClient
 from dotenv import load_dotenv
+from ximilar_schema import ITEMS_FIELD, RAW_COLLECTION
 
 load_dotenv()
 
@@ -16,7 +17,7 @@ collection = db['images']
 # Статистика
 total_count = collection.count_documents({})
 tagged_count = collection.count_documents({
-    "ximilar_objects_structured": {"$exists": True, "$ne": []},
+    ITEMS_FIELD: {"$exists": True, "$ne": []},
     "hidden": {"$ne": True},
     "is_duplicate": {"$ne": True}
 })
@@ -24,7 +25,12 @@ tagged_count = collection.count_documents({
 print(f"📊 Статистика коллекции:")
 print(f"  Всего документов: {total_count:,}")
 print(f"  С тегами (не скрытые, не дубликаты): {tagged_count:,}")
-print(f"  Размер коллекции: {db.command('collstats', 'images')['size'] / 1024 / 1024:.2f} MB")
+images_stats = db.command('collstats', 'images')
+print(f"  Размер коллекции: {images_stats['size'] / 1024 / 1024:.2f} MB")
+print(f"  Средний размер документа: {images_stats.get('avgObjSize', 0) / 1024:.2f} KB")
+if RAW_COLLECTION in db.list_collection_names():
+    raw_stats = db.command('collstats', RAW_COLLECTION)
+    print(f"  Сырые ответы Ximilar ({RAW_COLLECTION}): {raw_stats['count']:,} шт., {raw_stats['size'] / 1024 / 1024:.2f} MB")
 print(f"\n📋 Существующие индексы:")
 for index in collection.list_indexes():
     print(f"  - {index['name']}: {index['key']}")
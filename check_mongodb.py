@@ -6,6 +6,7 @@
 import os
 from dotenv import load_dotenv
 from pymongo import MongoClient
+from ximilar_schema import TAGGED_QUERY, read_objects
 
 load_dotenv()
 load_dotenv('mongodb_config.env')
@@ -55,17 +56,12 @@ def check_mongodb():
                     print(f"   • Комментарии: {first_img.get('comments', 'N/A')}")
                     
                     # Проверяем теги
-                    if 'ximilar_tags' in first_img:
-                        tags_data = first_img['ximilar_tags']
-                        if isinstance(tags_data, dict) and 'tags' in tags_data:
-                            tags = tags_data['tags']
-                            print(f"   • Теги Ximilar: {len(tags)} тегов")
-                        elif isinstance(tags_data, list):
-                            print(f"   • Теги Ximilar: {len(tags_data)} тегов")
-                        else:
-                            print(f"   • Теги Ximilar: {tags_data}")
+                    objects = read_objects(first_img)
+                    if objects:
+                        print(f"   • Объекты Ximilar: {len(objects)}")
                     else:
-                        print(f"   • Теги Ximilar: НЕТ")
+                        print(f"   • Объекты Ximilar: НЕТ")
+                    print(f"   • С тегами: {db.images.count_documents(TAGGED_QUERY)}")
                 else:
                     print("❌ Коллекция images пустая")
             else:
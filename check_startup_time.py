@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Проверка бюджета холодного старта веб-приложения
+
+Импортирует web_parser (сборка приложения через create_app) в отдельных процессах
+и проверяет, что:
+    - медиана времени импорта укладывается в бюджет (--budget, по умолчанию 0.8 сек);
+    - при старте не загружены тяжёлые зависимости (PIL, imagehash, numpy, Apify, Ximilar);
+    - не создано подключение к MongoDB (MONGODB_URI указывает на недоступный адрес).
+
+Использование:
+    python check_startup_time.py
+    python check_startup_time.py --budget 0.5 --runs 7
+    python check_startup_time.py --importtime      # самые медленные импорты
+    python -m pytest tests/test_startup_time.py    # та же проверка как тест
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from statistics import median
+from typing import Dict, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_BUDGET = 0.8
+DEFAULT_RUNS = 5
+
+# Модули, которых не должно быть в процессе сразу после старта
+HEAVY_MODULES = ["PIL", "imagehash", "numpy", "scipy", "apify_client", "ximilar_fashion_tagger"]
+
+# Недоступный адрес: если старт попытается подключиться, он зависнет или упадёт
+UNREACHABLE_URI = "mongodb://10.255.255.1:27017/instagram_gallery?serverSelectionTimeoutMS=2000"
+
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import web_parser
+elapsed = time.perf_counter() - started
+import app_context
+print(json.dumps({
+    "seconds": elapsed,
+    "heavy": [m for m in %r if m in sys.modules],
+    "connected": app_context._analytics_collection is not None,
+    "routes": len(list(web_parser.app.url_map.iter_rules())),
+}))
+""" % (HEAVY_MODULES,)
+
+
+def probe_env(cache_dir: str) -> dict:
+    env = dict(os.environ)
+    env["MONGODB_URI"] = UNREACHABLE_URI
+    env["ANALYTICS_CACHE_PATH"] = os.path.join(cache_dir, "startup_check.sqlite3")
+    # Фоновый поток create_app() подключается к MongoDB и грузит модули сам по себе;
+    # проверяется синхронная часть старта
+    env["WEB_BACKGROUND_TASKS"] = "0"
+    return env
+
+
+def run_probe(env: dict) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BASE_DIR, env=env,
+        capture_output=True, text=True, timeout=60
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "import failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(runs: int = DEFAULT_RUNS, budget: float = DEFAULT_BUDGET) -> Dict:
+    """Запустить пробы и собрать нарушения бюджета (пустой problems - старт в норме)"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        probes = [run_probe(probe_env(cache_dir)) for _ in range(runs)]
+
+    timings = [p["seconds"] for p in probes]
+    startup = median(timings)
+    last = probes[-1]
+    problems: List[str] = []
+    if startup > budget:
+        problems.append(f"Старт превышает бюджет на {startup - budget:.3f} сек")
+    if last["heavy"]:
+        problems.append(f"Тяжёлые модули загружены при старте: {', '.join(last['heavy'])}")
+    if last["connected"]:
+        problems.append("Подключение к MongoDB создано при старте")
+    return {
+        "median": startup, "min": min(timings), "max": max(timings),
+        "routes": last["routes"], "problems": problems,
+    }
+
+
+def slowest_imports(env: dict, top: int = 15):
+    """Самые медленные импорты по -X importtime (cumulative)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import web_parser"], cwd=BASE_DIR, env=env,
+        capture_output=True, text=True, timeout=60
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бюджет холодного старта web_parser")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="Бюджет медианы импорта, сек")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="Количество запусков")
+    parser.add_argument("--importtime", action="store_true", help="Показать самые медленные импорты")
+    args = parser.parse_args()
+
+    print("⏱️ ПРОВЕРКА ХОЛОДНОГО СТАРТА WEB_PARSER")
+    print("=" * 60)
+
+    try:
+        result = measure(args.runs, args.budget)
+    except Exception as e:
+        print(f"❌ Импорт web_parser завершился ошибкой: {e}")
+        sys.exit(1)
+
+    print(f"   Запусков: {args.runs}, маршрутов: {result['routes']}")
+    print(f"   Импорт: медиана {result['median']:.3f} сек (min {result['min']:.3f}, max {result['max']:.3f}), "
+          f"бюджет {args.budget:.3f} сек")
+    for problem in result["problems"]:
+        print(f"❌ {problem}")
+
+    failed = bool(result["problems"])
+    if args.importtime or failed:
+        print("\n🐢 Самые медленные импорты (cumulative):")
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for microseconds, name in slowest_imports(probe_env(cache_dir)):
+                print(f"   {microseconds / 1000:8.1f} ms  {name}")
+
+    if failed:
+        sys.exit(1)
+    print("✅ Старт в пределах бюджета, тяжёлые зависимости и MongoDB не затронуты")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Кодировщик FashionCLIP для веб-приложения и пакетных скриптов
+
+Модель (open_clip, Marqo FashionCLIP) загружается при первом вызове
+get_encoder(): импорт модуля не тянет torch, поэтому холодный старт
+web_parser не меняется. Эмбеддинги возвращаются как L2-нормированные
+float32 numpy-массивы - их можно сразу класть в EmbeddingStore.
+
+Зависимости опциональные: torch и open_clip_torch (см. requirements.txt).
+Без них available() возвращает False, а эндпоинты отвечают понятной ошибкой.
+
+Веб-процесс грузит модель в фоне при запуске (warm_up() в app_factory.start_background);
+пока она не загружена (ready() - False), пре-скрин и дедупликация по
+эмбеддингам пропускают CLIP, а не ждут загрузку внутри запроса.
+"""
+
+import os
+import threading
+from functools import lru_cache
+from typing import List
+
+MODEL_ID = os.getenv('CLIP_MODEL_ID', 'hf-hub:Marqo/marqo-fashionCLIP')
+
+# Потоков torch на CPU (0 - решает torch)
+CLIP_THREADS = int(os.getenv('CLIP_THREADS', 0))
+
+# Изображений за одну прогонку визуальной башни
+IMAGE_BATCH = int(os.getenv('CLIP_IMAGE_BATCH', 32))
+
+# Сколько эмбеддингов поисковых запросов держать в LRU
+QUERY_CACHE_SIZE = int(os.getenv('CLIP_QUERY_CACHE_SIZE', 2048))
+
+_lock = threading.Lock()
+_encoder = None
+_warmup_thread = None
+
+
+def available() -> bool:
+    """Установлены ли torch и open_clip"""
+    try:
+        import torch  # noqa: F401
+        import open_clip  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ClipEncoder:
+    """Визуальная и текстовая башни FashionCLIP"""
+
+    def __init__(self, model_id: str = MODEL_ID):
+        import torch
+        import open_clip
+
+        self.torch = torch
+        if CLIP_THREADS:
+            torch.set_num_threads(CLIP_THREADS)
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        print(f"📦 Загрузка FashionCLIP ({model_id}) на {self.device}...")
+        self.model, _, self.preprocess = open_clip.create_model_and_transforms(model_id)
+        self.model = self.model.to(self.device).eval()
+        self.tokenizer = open_clip.get_tokenizer(model_id)
+        self.model_id = model_id
+        self.dim = int(self.model.visual.output_dim)
+        print(f"✅ FashionCLIP загружен, размерность эмбеддинга {self.dim}")
+
+    def encode_images(self, images: List):
+        """PIL-изображения -> (n, dim) float32, по IMAGE_BATCH за прогонку"""
+        import numpy as np
+
+        chunks = []
+        for start in range(0, len(images), IMAGE_BATCH):
+            batch = self.torch.stack([self.preprocess(image) for image in images[start:start + IMAGE_BATCH]])
+            with self.torch.inference_mode():
+                features = self.model.encode_image(batch.to(self.device), normalize=True)
+            chunks.append(features.float().cpu().numpy())
+        if not chunks:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.concatenate(chunks, axis=0)
+
+    def encode_texts(self, texts: List[str]):
+        """Строки -> (n, dim) float32"""
+        tokens = self.tokenizer(texts).to(self.device)
+        with self.torch.inference_mode():
+            features = self.model.encode_text(tokens, normalize=True)
+        return features.float().cpu().numpy()
+
+
+def get_encoder() -> ClipEncoder:
+    """Общий экземпляр кодировщика (модель грузится один раз на процесс)"""
+    global _encoder
+    if _encoder is None:
+        with _lock:
+            if _encoder is None:
+                _encoder = ClipEncoder()
+    return _encoder
+
+
+def ready() -> bool:
+    """Модель уже загружена в этом процессе"""
+    return _encoder is not None
+
+
+def _load_in_background():
+    try:
+        get_encoder()
+    except Exception as e:
+        print(f"⚠️ FashionCLIP не загружен: {e}")
+
+
+def warm_up() -> bool:
+    """Загрузить модель в фоновом потоке (один раз на процесс); False - CLIP не установлен"""
+    global _warmup_thread
+    if _encoder is not None:
+        return True
+    if not available():
+        return False
+    with _lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_load_in_background, name="clip_warmup", daemon=True)
+            _warmup_thread.start()
+    return True
+
+
+def normalize_query(text: str) -> str:
+    """Ключ кэша запроса: регистр и лишние пробелы не важны"""
+    return ' '.join(text.lower().split())
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _query_embedding(text: str):
+    vector = get_encoder().encode_texts([text])[0]
+    vector.setflags(write=False)
+    return vector
+
+
+def encode_query(text: str):
+    """Эмбеддинг поискового запроса (float32, только чтение) из LRU или текстовой башни"""
+    return _query_embedding(normalize_query(text))
+
+
+def query_cache_info():
+    return _query_embedding.cache_info()
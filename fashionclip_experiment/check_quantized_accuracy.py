@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Проверка точности int8-режима FashionCLIP против fp32-результатов
+
+Эталон - fp32-результаты детализированной версии: data/fashionclip_results_detailed.json,
+а если его нет - карточки FashionCLIP из comparison_report_detailed.html
+(там top-5 и проценты, округлённые вниз). Сравниваются изображения с одинаковым
+image_url:
+
+    - совпадение top-1 по каждому словарю (категории, цвета, материалы, стили);
+    - пересечение top-k списков;
+    - средняя разница уверенности top-1 при совпадении.
+
+    python run_fashionclip_detailed.py --quantize
+    python check_quantized_accuracy.py --min-top1 0.9
+"""
+
+import argparse
+import json
+import os
+import sys
+from html.parser import HTMLParser
+
+from run_fashionclip_detailed import OUTPUT_FILE, QUANTIZED_OUTPUT_FILE
+
+REPORT_FILE = 'comparison_report_detailed.html'
+
+# Отчёт показывает локальные изображения без хоста (generate_html_report_detailed.py)
+SERVER_PREFIX = 'http://158.160.19.119:5000'
+
+ATTRIBUTE_TYPES = ['categories', 'colors', 'materials', 'styles']
+
+# Заголовки секций отчёта -> словарь атрибутов
+REPORT_SECTIONS = {
+    'Категории': 'categories',
+    'Цвета': 'colors',
+    'Материалы': 'materials',
+    'Стили': 'styles',
+}
+
+
+class _ReportParser(HTMLParser):
+    """Колонка FashionCLIP каждой карточки comparison_report_detailed.html"""
+
+    def __init__(self):
+        super().__init__()
+        self.results = {}
+        self.image_url = None
+        self.in_fashionclip = False
+        self.attr_type = None
+        self.current = None       # 'h4' | 'tag' | 'confidence'
+        self.tag_name = ''
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if tag == 'img' and self.image_url is None:
+            self.image_url = attrs.get('src')
+        elif 'comparison-card' in classes:
+            self.image_url = None
+            self.in_fashionclip = False
+        elif 'result-column' in classes:
+            self.in_fashionclip = 'fashionclip' in classes
+            self.attr_type = None
+        elif tag == 'h4' and self.in_fashionclip:
+            self.current = 'h4'
+        elif 'attribute-tag' in classes and self.in_fashionclip and self.attr_type:
+            self.current = 'tag'
+            self.tag_name = ''
+        elif 'confidence' in classes and self.current == 'tag':
+            self.current = 'confidence'
+
+    def handle_data(self, data):
+        if self.current == 'h4':
+            self.attr_type = REPORT_SECTIONS.get(data.strip())
+            self.current = None
+        elif self.current == 'tag':
+            self.tag_name += data
+        elif self.current == 'confidence':
+            text = data.strip().rstrip('%')
+            confidence = int(text) / 100 if text.isdigit() else None
+            image = self.results.setdefault(self.image_url, {})
+            image.setdefault(self.attr_type, []).append(
+                {'name': self.tag_name.strip(), 'confidence': confidence}
+            )
+            self.current = None
+
+
+def load_results(path):
+    """{image_url: {attr_type: [{'name', 'confidence'}, ...]}} из JSON результатов или HTML-отчёта"""
+    if path.endswith('.html'):
+        parser = _ReportParser()
+        with open(path, 'r', encoding='utf-8') as f:
+            parser.feed(f.read())
+        return parser.results
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {
+        sample['image_url'].replace(SERVER_PREFIX, ''): sample['fashionclip_results']
+        for sample in data['samples']
+        if 'error' not in sample.get('fashionclip_results', {'error': True})
+    }
+
+
+def compare(reference, candidate):
+    """Метрики по каждому словарю атрибутов"""
+    common = [url for url in reference if url in candidate]
+    report = {'images': len(common)}
+
+    for attr_type in ATTRIBUTE_TYPES:
+        top1_matches = 0
+        overlap_sum = 0.0
+        confidence_diffs = []
+        counted = 0
+
+        for url in common:
+            ref = reference[url].get(attr_type, [])
+            cand = candidate[url].get(attr_type, [])
+            if not ref or not cand:
+                continue
+            counted += 1
+            # Эталон из HTML содержит top-5, сравниваем списки одинаковой длины
+            k = min(len(ref), len(cand))
+            ref_names = [item['name'] for item in ref[:k]]
+            cand_names = [item['name'] for item in cand[:k]]
+            overlap_sum += len(set(ref_names) & set(cand_names)) / k
+            if ref_names[0] == cand_names[0]:
+                top1_matches += 1
+                if ref[0]['confidence'] is not None and cand[0]['confidence'] is not None:
+                    confidence_diffs.append(abs(ref[0]['confidence'] - cand[0]['confidence']))
+
+        report[attr_type] = {
+            'compared': counted,
+            'top1_agreement': top1_matches / counted if counted else None,
+            'topk_overlap': overlap_sum / counted if counted else None,
+            'top1_confidence_diff': sum(confidence_diffs) / len(confidence_diffs) if confidence_diffs else None,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Точность int8 FashionCLIP против fp32')
+    default_reference = OUTPUT_FILE if os.path.exists(OUTPUT_FILE) else REPORT_FILE
+    parser.add_argument('--reference', default=default_reference,
+                        help='fp32-результаты: JSON или comparison_report_detailed.html')
+    parser.add_argument('--candidate', default=QUANTIZED_OUTPUT_FILE, help='Результаты int8-режима')
+    parser.add_argument('--min-top1', type=float, default=0.9,
+                        help='Минимальное совпадение top-1 по каждому словарю')
+    args = parser.parse_args()
+
+    for path in (args.reference, args.candidate):
+        if not os.path.exists(path):
+            print(f"❌ Файл {path} не найден!")
+            sys.exit(1)
+
+    print(f"📂 Эталон fp32: {args.reference}")
+    print(f"📂 int8: {args.candidate}")
+    report = compare(load_results(args.reference), load_results(args.candidate))
+
+    if not report['images']:
+        print("❌ Нет общих изображений для сравнения")
+        sys.exit(1)
+
+    print(f"\n📊 Сравнено изображений: {report['images']}\n")
+    print(f"{'Словарь':<12} {'top-1':>8} {'top-k':>8} {'Δ conf':>8}")
+    failed = []
+    for attr_type in ATTRIBUTE_TYPES:
+        metrics = report[attr_type]
+        if not metrics['compared']:
+            continue
+        diff = metrics['top1_confidence_diff']
+        print(f"{attr_type:<12} {metrics['top1_agreement']:>8.1%} {metrics['topk_overlap']:>8.1%} "
+              f"{(f'{diff:.3f}' if diff is not None else 'N/A'):>8}")
+        if metrics['top1_agreement'] < args.min_top1:
+            failed.append(attr_type)
+
+    if failed:
+        print(f"\n❌ Совпадение top-1 ниже {args.min_top1:.0%}: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"\n✅ int8-режим совпадает с fp32 (top-1 >= {args.min_top1:.0%} по всем словарям)")
+
+
+if __name__ == '__main__':
+    main()
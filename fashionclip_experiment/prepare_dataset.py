@@ -14,6 +14,7 @@ from datetime import datetime
 # Загружаем переменные окружения
 import sys
 sys.path.append('..')
+from ximilar_schema import ITEMS_FIELD, read_objects
 # load_dotenv('../.env')
 # load_dotenv('../mongodb_config.env')
 # Используем прямое подключение к серверу вместо локального
@@ -46,11 +47,12 @@ def extract_ximilar_summary(doc):
         'styles': []
     }
 
-    if not doc.get('ximilar_objects'):
+    objects = read_objects(doc)
+    if not objects:
         return ximilar_data
 
     # Извлекаем данные из всех объектов
-    for obj in doc['ximilar_objects']:
+    for obj in objects:
         props = obj.get('properties', {})
 
         # Категории
@@ -119,7 +121,7 @@ def prepare_sample_dataset():
         {
             '$match': {
                 'ximilar_success': True,
-                'ximilar_objects': {'$exists': True, '$ne': []},
+                ITEMS_FIELD: {'$exists': True, '$ne': []},
                 'full_image_url': {'$exists': True}
             }
         },
@@ -135,7 +137,7 @@ def prepare_sample_dataset():
                 'username': 1,
                 'post_id': 1,
                 'timestamp': 1,
-                'ximilar_objects': 1,
+                ITEMS_FIELD: 1,
                 'ximilar_tagged_at': 1
             }
         }
@@ -160,7 +162,7 @@ def prepare_sample_dataset():
             'post_id': doc.get('post_id'),
             'timestamp': doc.get('timestamp'),
             'ximilar_results': ximilar_summary,
-            'ximilar_objects_count': len(doc.get('ximilar_objects', [])),
+            'ximilar_objects_count': len(doc.get(ITEMS_FIELD, [])),
             'fashionclip_results': None  # Будет заполнено позже
         }
 
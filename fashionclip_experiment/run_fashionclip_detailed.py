@@ -7,17 +7,26 @@
 import json
 import os
 import sys
+import time
+import argparse
 from PIL import Image
 import requests
 from io import BytesIO
 import torch
-import open_clip
 from tqdm import tqdm
 from datetime import datetime
 
+from text_embeddings import MODEL_ID, TextEmbeddingCache
+from batch_inference import (
+    DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, MODEL_CACHE_DIR, PrefetchLoader, configure_threads,
+    load_model, model_size_mb, peak_memory_mb, quantize_linear,
+)
+
 # Параметры
 INPUT_FILE = 'data/sample_images.json'
 OUTPUT_FILE = 'data/fashionclip_results_detailed.json'
+# Результаты int8-режима (сравниваются с OUTPUT_FILE в check_quantized_accuracy.py)
+QUANTIZED_OUTPUT_FILE = 'data/fashionclip_results_detailed_int8.json'
 
 # Расширенные словари атрибутов с более специфичными терминами
 ATTRIBUTE_PROMPTS = {
@@ -186,26 +195,58 @@ ATTRIBUTE_PROMPTS = {
     ]
 }
 
+# Сколько вариантов оставлять по каждому типу атрибутов
+TOP_K = {
+    'categories': 5,  # Больше вариантов для категорий
+    'colors': 5,
+    'materials': 3,
+    'styles': 3,
+}
+
 class FashionCLIPAnalyzer:
-    def __init__(self):
-        """Инициализация модели FashionCLIP"""
+    def __init__(self, quantize=False, cache_dir=MODEL_CACHE_DIR):
+        """Инициализация модели FashionCLIP
+
+        quantize - int8-режим для CPU: динамическая квантизация линейных слоёв
+        cache_dir - локальный каталог с весами модели (без похода в Hugging Face Hub)
+        """
         print(f"📦 Загрузка FashionCLIP модели (Marqo)...")
 
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        # int8-ядра есть только на CPU
+        self.quantized = bool(quantize) and self.device == "cpu"
         print(f"🖥️  Устройство: {self.device}")
+        if quantize and not self.quantized:
+            print(f"⚠️  Квантизация доступна только на CPU, модель остаётся fp32")
 
         # Загружаем модель Marqo FashionCLIP
-        self.model, _, self.preprocess = open_clip.create_model_and_transforms(
-            'hf-hub:Marqo/marqo-fashionCLIP'
-        )
-        self.model = self.model.to(self.device).eval()
-        self.tokenizer = open_clip.get_tokenizer('hf-hub:Marqo/marqo-fashionCLIP')
+        self.model, self.preprocess, self.tokenizer = load_model(MODEL_ID, cache_dir)
+        self.model = self.model.to(self.device)
 
-        print(f"✅ Модель загружена")
+        print(f"✅ Модель загружена ({model_size_mb(self.model):.0f} MB)")
 
-        # Статистика по словарям
+        # Эмбеддинги промптов считаются один раз (или берутся из кэша на диске)
+        self.text_cache = TextEmbeddingCache(MODEL_ID)
+        self.text_matrices = {}
         for key, values in ATTRIBUTE_PROMPTS.items():
+            matrix = self.text_cache.matrix(values, self.encode_texts)
+            self.text_matrices[key] = torch.from_numpy(matrix).to(self.device)
             print(f"   {key}: {len(values)} вариантов")
+        print(f"📝 Текстовые эмбеддинги: из кэша {self.text_cache.hits}, "
+              f"посчитано {self.text_cache.misses}")
+
+        # Квантуем после расчёта промптов: кэш текстовых эмбеддингов общий с fp32-режимом,
+        # а текстовая башня дальше не вызывается
+        if self.quantized:
+            quantize_linear(self.model)
+            print(f"🔢 int8-квантизация линейных слоёв: {model_size_mb(self.model):.0f} MB")
+
+    def encode_texts(self, prompts):
+        """Текстовая башня для списка промптов -> numpy (используется только при промахе кэша)"""
+        text_tokens = self.tokenizer(prompts).to(self.device)
+        with torch.inference_mode():
+            text_features = self.model.encode_text(text_tokens, normalize=True)
+        return text_features.float().cpu().numpy()
 
     def load_image_from_url(self, url, timeout=10):
         """Загрузить изображение по URL"""
@@ -218,43 +259,38 @@ class FashionCLIPAnalyzer:
             print(f"  ⚠️  Ошибка загрузки изображения: {e}")
             return None
 
-    def classify_attributes(self, image, attribute_type, candidates, top_k=5):
-        """Классифицировать атрибуты изображения"""
-        if image is None:
-            return []
-
-        try:
-            # Препроцессинг изображения
-            image_tensor = self.preprocess(image).unsqueeze(0).to(self.device)
-
-            # Формируем текстовые промпты
-            text_prompts = [f"a photo of {candidate}" for candidate in candidates]
-            text_tokens = self.tokenizer(text_prompts).to(self.device)
+    def encode_images(self, image_tensors):
+        """Эмбеддинги батча препроцесснутых изображений (одна прогонка визуальной башни)"""
+        batch = torch.stack(image_tensors).to(self.device)
+        with torch.inference_mode():
+            if self.device == "cuda":
+                with torch.autocast("cuda"):
+                    image_features = self.model.encode_image(batch, normalize=True)
+            else:
+                # На CPU autocast не нужен: fp32 или int8 после quantize_linear
+                image_features = self.model.encode_image(batch, normalize=True)
+        return image_features.float()
 
-            # Получаем embeddings
-            with torch.no_grad(), torch.cuda.amp.autocast():
-                image_features = self.model.encode_image(image_tensor, normalize=True)
-                text_features = self.model.encode_text(text_tokens, normalize=True)
+    def score_embeddings(self, image_features):
+        """Все словари атрибутов по общему эмбеддингу изображения"""
+        results = [{} for _ in range(image_features.shape[0])]
 
-                # Вычисляем similarity scores
-                similarity = (100.0 * image_features @ text_features.T).softmax(dim=-1)
-                probs = similarity[0]
+        for attr_type, candidates in ATTRIBUTE_PROMPTS.items():
+            text_features = self.text_matrices[attr_type]
+            probs = (100.0 * image_features @ text_features.T).softmax(dim=-1)
+            top = probs.topk(min(TOP_K.get(attr_type, 3), len(candidates)), dim=-1)
 
-            # Получаем топ-k результатов
-            top_indices = probs.argsort(descending=True)[:top_k]
+            for row, (values, indices) in enumerate(zip(top.values.tolist(), top.indices.tolist())):
+                results[row][attr_type] = [
+                    {'name': candidates[idx], 'confidence': float(value)}
+                    for value, idx in zip(values, indices)
+                ]
 
-            results = []
-            for idx in top_indices:
-                results.append({
-                    'name': candidates[idx.item()],
-                    'confidence': float(probs[idx].item())
-                })
+        return results
 
-            return results
-
-        except Exception as e:
-            print(f"  ⚠️  Ошибка классификации {attribute_type}: {e}")
-            return []
+    def analyze_batch(self, image_tensors):
+        """Анализ батча: каждое изображение кодируется один раз"""
+        return self.score_embeddings(self.encode_images(image_tensors))
 
     def analyze_image(self, image_url):
         """Полный анализ изображения"""
@@ -264,26 +300,12 @@ class FashionCLIPAnalyzer:
         if image is None:
             return None
 
-        results = {}
-
-        # Классифицируем по каждому типу атрибутов
-        # Увеличиваем top_k для более детальных результатов
-        for attr_type, candidates in ATTRIBUTE_PROMPTS.items():
-            if attr_type == 'categories':
-                top_k = 5  # Больше вариантов для категорий
-            elif attr_type == 'colors':
-                top_k = 5
-            else:
-                top_k = 3
-
-            results[attr_type] = self.classify_attributes(
-                image, attr_type, candidates, top_k=top_k
-            )
-
-        return results
+        return self.analyze_batch([self.preprocess(image)])[0]
 
-def process_dataset():
+def process_dataset(batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS, threads=None,
+                    quantize=False, cache_dir=MODEL_CACHE_DIR):
     """Обработать весь датасет через FashionCLIP"""
+    output_file = QUANTIZED_OUTPUT_FILE if quantize else OUTPUT_FILE
     print(f"\n🔍 Обработка датасета через FashionCLIP (Детализированная версия)\n")
 
     # Загружаем датасет
@@ -300,48 +322,70 @@ def process_dataset():
     samples = data['samples']
     print(f"✅ Загружено {len(samples)} образцов")
 
+    # Потоки torch - до загрузки модели
+    print(f"🧵 Потоков torch: {configure_threads(threads)}")
+
     # Инициализируем анализатор
-    analyzer = FashionCLIPAnalyzer()
+    analyzer = FashionCLIPAnalyzer(quantize=quantize, cache_dir=cache_dir)
 
-    # Обрабатываем каждое изображение
-    print(f"\n🎨 Анализ изображений...\n")
+    # Обрабатываем батчами: загрузка следующих изображений идёт параллельно с инференсом
+    print(f"\n🎨 Анализ изображений (батч {batch_size}, потоков загрузки {workers})...\n")
 
     processed_count = 0
     failed_count = 0
+    started = time.perf_counter()
 
-    for i, sample in enumerate(tqdm(samples, desc="Обработка")):
-        image_url = sample['image_url']
+    loader = PrefetchLoader(
+        [sample['image_url'] for sample in samples], analyzer.preprocess,
+        batch_size=batch_size, workers=workers
+    )
 
-        try:
-            # Анализируем изображение
-            fashionclip_results = analyzer.analyze_image(image_url)
+    for batch in tqdm(loader, desc="Обработка", total=len(loader)):
+        loaded = [(i, tensor) for i, tensor in batch if tensor is not None]
 
-            if fashionclip_results:
-                sample['fashionclip_results'] = fashionclip_results
-                processed_count += 1
-            else:
-                sample['fashionclip_results'] = {
+        for i, tensor in batch:
+            if tensor is None:
+                samples[i]['fashionclip_results'] = {
                     'error': 'Failed to analyze image'
                 }
                 failed_count += 1
 
+        if not loaded:
+            continue
+
+        try:
+            batch_results = analyzer.analyze_batch([tensor for _, tensor in loaded])
+            for (i, _), fashionclip_results in zip(loaded, batch_results):
+                samples[i]['fashionclip_results'] = fashionclip_results
+                processed_count += 1
+
         except Exception as e:
-            print(f"\n  ❌ Ошибка обработки образца {i+1}: {e}")
-            sample['fashionclip_results'] = {
-                'error': str(e)
-            }
-            failed_count += 1
+            print(f"\n  ❌ Ошибка обработки батча ({len(loaded)} образцов): {e}")
+            for i, _ in loaded:
+                samples[i]['fashionclip_results'] = {
+                    'error': str(e)
+                }
+                failed_count += 1
+
+    elapsed = time.perf_counter() - started
+    if samples:
+        print(f"\n⏱️  {elapsed:.1f} сек, {elapsed / len(samples):.2f} сек/изображение, "
+              f"{len(samples) / elapsed:.2f} изображений/сек")
+    print(f"🧠 Пиковая память процесса: {peak_memory_mb():.0f} MB")
 
     # Обновляем метаданные
     data['metadata']['fashionclip_processed_at'] = datetime.now().isoformat()
     data['metadata']['fashionclip_processed_count'] = processed_count
     data['metadata']['fashionclip_failed_count'] = failed_count
     data['metadata']['fashionclip_version'] = 'detailed'
+    data['metadata']['fashionclip_precision'] = 'int8' if analyzer.quantized else 'fp32'
+    data['metadata']['fashionclip_seconds'] = round(elapsed, 1)
+    data['metadata']['fashionclip_peak_memory_mb'] = round(peak_memory_mb())
 
     # Сохраняем результаты
-    print(f"\n💾 Сохранение результатов в {OUTPUT_FILE}...")
+    print(f"\n💾 Сохранение результатов в {output_file}...")
 
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+    with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
     print(f"\n✅ Обработка завершена!")
@@ -385,4 +429,15 @@ def process_dataset():
     print(f"\n✅ Готово! Следующий шаг: сравнение с базовой версией")
 
 if __name__ == '__main__':
-    process_dataset()
+    parser = argparse.ArgumentParser(description='FashionCLIP (детализированная версия)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Изображений в батче')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Потоков загрузки изображений')
+    parser.add_argument('--threads', type=int, default=None, help='Потоков torch (по умолчанию все ядра)')
+    parser.add_argument('--quantize', action='store_true',
+                        help=f'int8-квантизация для CPU (результаты в {QUANTIZED_OUTPUT_FILE})')
+    parser.add_argument('--cache-dir', default=MODEL_CACHE_DIR,
+                        help='Локальный каталог весов модели (FASHIONCLIP_MODEL_CACHE)')
+    args = parser.parse_args()
+
+    process_dataset(batch_size=args.batch_size, workers=args.workers, threads=args.threads,
+                    quantize=args.quantize, cache_dir=args.cache_dir)
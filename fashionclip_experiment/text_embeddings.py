@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Кэш текстовых эмбеддингов промптов FashionCLIP
+
+Словари ATTRIBUTE_PROMPTS не меняются от изображения к изображению, поэтому
+эмбеддинги промптов считаются один раз на (модель, шаблон промпта, словарь)
+и сохраняются на диск как float32-матрица .npy. Имя файла - sha256 от
+содержимого ключа: поменяли словарь или шаблон - получили новый файл,
+старый просто перестаёт использоваться.
+
+Классификация изображения после этого - одно умножение
+image_features @ text_matrix.T вместо ~400 прогонов текстовой башни.
+
+Использование:
+    cache = TextEmbeddingCache(MODEL_ID)
+    matrix = cache.matrix(candidates, encode_fn)   # encode_fn(list[str]) -> np.ndarray
+
+    python text_embeddings.py --list     # содержимое кэша
+    python text_embeddings.py --clear    # удалить кэш
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from typing import Callable, Dict, List
+
+import numpy as np
+
+MODEL_ID = 'hf-hub:Marqo/marqo-fashionCLIP'
+PROMPT_TEMPLATE = 'a photo of {}'
+
+CACHE_DIR = os.getenv(
+    'FASHIONCLIP_TEXT_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'text_embeddings')
+)
+
+# Сколько промптов кодировать за один прогон текстовой башни
+ENCODE_BATCH = 64
+
+
+def vocabulary_key(model_id: str, template: str, candidates: List[str]) -> str:
+    """Хэш содержимого: модель + шаблон + словарь (порядок важен - это порядок строк матрицы)"""
+    payload = json.dumps(
+        {'model': model_id, 'template': template, 'candidates': list(candidates)},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class TextEmbeddingCache:
+    """Матрицы эмбеддингов промптов: память процесса -> .npy на диске -> текстовая башня"""
+
+    def __init__(self, model_id: str = MODEL_ID, template: str = PROMPT_TEMPLATE, cache_dir: str = CACHE_DIR):
+        self.model_id = model_id
+        self.template = template
+        self.cache_dir = cache_dir
+        self._memory: Dict[str, np.ndarray] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def prompts(self, candidates: List[str]) -> List[str]:
+        return [self.template.format(candidate) for candidate in candidates]
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def matrix(self, candidates: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """L2-нормированная матрица (len(candidates), dim) для словаря"""
+        key = vocabulary_key(self.model_id, self.template, candidates)
+        if key in self._memory:
+            return self._memory[key]
+
+        path = self.path(key)
+        if os.path.exists(path):
+            matrix = np.load(path)
+            if matrix.shape[0] == len(candidates):
+                self.hits += 1
+                self._memory[key] = matrix
+                return matrix
+
+        self.misses += 1
+        prompts = self.prompts(candidates)
+        chunks = [np.asarray(encode_fn(prompts[i:i + ENCODE_BATCH]), dtype=np.float32)
+                  for i in range(0, len(prompts), ENCODE_BATCH)]
+        matrix = _normalize(np.concatenate(chunks, axis=0))
+        self._save(key, matrix, candidates)
+        self._memory[key] = matrix
+        return matrix
+
+    def _save(self, key: str, matrix: np.ndarray, candidates: List[str]):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Пишем во временный файл и переименовываем: параллельный запуск не прочитает половину матрицы
+        tmp_path = self.path(key) + f".{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, self.path(key))
+        meta = {
+            'model': self.model_id,
+            'template': self.template,
+            'size': len(candidates),
+            'dim': int(matrix.shape[1]),
+            'first': candidates[:3],
+        }
+        with open(os.path.join(self.cache_dir, f"{key}.json"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Кэш текстовых эмбеддингов FashionCLIP")
+    parser.add_argument('--list', action='store_true', help='Показать содержимое кэша')
+    parser.add_argument('--clear', action='store_true', help='Удалить кэш')
+    args = parser.parse_args()
+
+    if not os.path.isdir(CACHE_DIR):
+        print(f"📭 Кэш пуст: {CACHE_DIR}")
+        return
+
+    names = sorted(f for f in os.listdir(CACHE_DIR) if f.endswith('.npy'))
+    if args.clear:
+        for name in os.listdir(CACHE_DIR):
+            os.remove(os.path.join(CACHE_DIR, name))
+        print(f"🗑️  Удалено матриц: {len(names)}")
+        return
+
+    print(f"📦 Кэш текстовых эмбеддингов: {CACHE_DIR}")
+    for name in names:
+        meta_path = os.path.join(CACHE_DIR, name[:-len('.npy')] + '.json')
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        size_kb = os.path.getsize(os.path.join(CACHE_DIR, name)) / 1024
+        print(f"   {name[:12]}…  {meta.get('size', '?')} промптов × {meta.get('dim', '?')}  "
+              f"{size_kb:.0f} KB  {meta.get('first', '')}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
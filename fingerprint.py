@@ -0,0 +1,286 @@
+"""Отпечаток изображения и каскадная проверка дубликатов
+
+Один pHash 8x8 с порогом 5 и пропускает лёгкие кропы, и даёт ложные совпадения
+на простых композициях. Поэтому у каждого изображения хранится компактный
+отпечаток (поле fingerprint), посчитанный из одного draft-декодирования
+(image_decode.py):
+
+    {"v": 1,
+     "p": int64,   # pHash (DCT)
+     "d": int64,   # dHash (градиенты)
+     "w": int64,   # wHash (вейвлет Хаара)
+     "m": [9]}     # цветовые моменты: среднее, СКО, асимметрия R, G, B (0..1)
+
+Хеши хранятся целыми со знаком (BSON int64), а не hex-строками: без разбора
+строк и imagehash-объектов при загрузке индекса.
+
+Draft-декодирование даёт хеши, отличные от полного на 0-2 бита, поэтому рядом
+с image_hash хранится, каким декодированием он посчитан (hash_decode: "draft").
+image_hash без этой пометки (полное декодирование старых версий) пересчитывает
+add_perceptual_hash_to_existing.py - после неё все хеши корпуса сравнимы между собой.
+
+Каскад FingerprintIndex.search - от дешёвых этапов к дорогим:
+
+    1. bucket   - точное совпадение pHash по словарю, без просмотра корпуса;
+    2. phash    - XOR + popcount по всему массиву pHash, кандидаты <= PHASH_CANDIDATE_DISTANCE (12);
+    3. dhash, whash - у кандидатов с полным отпечатком расстояния dHash и wHash;
+    4. embedding - если у пары есть эмбеддинги, правило near_duplicates.is_duplicate_pair;
+       иначе color (цветовые моменты) и pHash <= FINGERPRINT_PHASH_DISTANCE (5, как у
+       прежнего правила; поднимать только после ручной проверки пар из
+       mark_duplicates.py --dry-run на своём корпусе).
+
+Изображения без отпечатка (только image_hash) проверяются прежним правилом
+pHash <= PHASH_ONLY_DISTANCE. Отклонения считаются по этапам в stats
+(сколько пар корпуса отсёк каждый этап).
+
+Индекс коллекции один на процесс (get_index): первая сессия скачивания читает
+коллекцию целиком, следующие дочитывают только изображения, скачанные после
+последнего обновления (downloaded_at, индекс downloaded_at_-1).
+
+Отпечатки существующих изображений: python add_perceptual_hash_to_existing.py
+(уже загруженный индекс увидит их после перезапуска процесса)
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from near_duplicates import (
+    PHASH_CANDIDATE_DISTANCE, PHASH_ONLY_DISTANCE, hamming, hash_to_int, is_duplicate_pair,
+)
+
+FINGERPRINT_FIELD = "fingerprint"
+HASH_DECODE_FIELD = "hash_decode"
+HASH_DECODE = "draft"      # image_decode.decode_image
+FINGERPRINT_VERSION = 1
+FINGERPRINT_FEATURES = ("phash", "dhash", "whash", "moments")
+
+# Пороги для пар с полными отпечатками
+DHASH_DISTANCE = int(os.getenv('DEDUP_DHASH_DISTANCE', 12))
+WHASH_DISTANCE = int(os.getenv('DEDUP_WHASH_DISTANCE', 12))
+# Евклидово расстояние векторов цветовых моментов (яркость +15% - около 0.3)
+COLOR_DISTANCE = float(os.getenv('DEDUP_COLOR_DISTANCE', 0.35))
+# pHash без эмбеддингов: dHash, wHash и цвет - дополнительные фильтры, порог тот же, что у
+# прежнего правила. Мягче (например, 8) - только по результатам проверки точности
+FINGERPRINT_PHASH_DISTANCE = int(os.getenv('DEDUP_FINGERPRINT_PHASH_DISTANCE', PHASH_ONLY_DISTANCE))
+
+# Дочитывание индекса: downloaded_at ставится до вставки в базу (вставка - в конце сессии),
+# поэтому окно перекрывает длинную сессию другого процесса; повторы отсекает known
+SYNC_WINDOW = timedelta(hours=int(os.getenv('DEDUP_INDEX_SYNC_WINDOW_HOURS', 24)))
+
+MOMENTS = 9
+_UINT64_MASK = (1 << 64) - 1
+
+STAGES = ("bucket", "phash", "dhash", "whash", "color", "embedding")
+
+
+def to_int64(image_hash: Optional[str]) -> Optional[int]:
+    """hex-хеш imagehash (16 символов) -> int64 со знаком для MongoDB"""
+    value = hash_to_int(image_hash)
+    if value is None:
+        return None
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_uint64(value: int) -> int:
+    """int64 из MongoDB -> беззнаковое значение хеша"""
+    return value & _UINT64_MASK
+
+
+def fingerprint_record(decoded: Dict) -> Dict:
+    """Результат image_decode.decode_image (FINGERPRINT_FEATURES) -> запись fingerprint"""
+    return {
+        "v": FINGERPRINT_VERSION,
+        "p": to_int64(decoded["phash"]),
+        "d": to_int64(decoded["dhash"]),
+        "w": to_int64(decoded["whash"]),
+        "m": decoded["moments"],
+    }
+
+
+def compute_fingerprint(source) -> Optional[Dict]:
+    """Отпечаток из байтов, пути или файлового объекта; None, если не декодируется"""
+    from image_decode import decode_image
+
+    try:
+        return fingerprint_record(decode_image(source, features=FINGERPRINT_FEATURES))
+    except Exception as e:
+        print(f"❌ Ошибка вычисления отпечатка: {e}")
+        return None
+
+
+def _complete(record: Optional[Dict]) -> bool:
+    return bool(record) and all(record.get(key) is not None for key in ("p", "d", "w", "m"))
+
+
+class FingerprintIndex:
+    """Отпечатки коллекции в памяти: хеши - uint64, цветовые моменты - float32
+
+    Массивы растут удвоением, поэтому add() в цикле по корпусу не пересобирает их.
+    Изображения без отпечатка участвуют только pHash из image_hash.
+    """
+
+    QUERY = {"$or": [{FINGERPRINT_FIELD: {"$exists": True}}, {"image_hash": {"$exists": True, "$ne": None}}]}
+    PROJECTION = {"image_hash": 1, FINGERPRINT_FIELD: 1, "image_url": 1, "post_id": 1, "_id": 1}
+
+    def __init__(self, phash_only_distance: int = PHASH_ONLY_DISTANCE,
+                 fingerprint_distance: int = FINGERPRINT_PHASH_DISTANCE):
+        self.phash_only_distance = phash_only_distance
+        self.fingerprint_distance = fingerprint_distance
+        self.candidate_distance = max(PHASH_CANDIDATE_DISTANCE, phash_only_distance, fingerprint_distance)
+        self.docs: List[Dict] = []
+        self._hashes = np.zeros((0, 3), dtype=np.uint64)
+        self._full = np.zeros(0, dtype=bool)
+        self._moments = np.zeros((0, MOMENTS), dtype=np.float32)
+        self.buckets: Dict[int, List[int]] = {}
+        self.known = set()                      # _id загруженных из базы
+        self.synced_at: Optional[str] = None    # начало последнего refresh (isoformat)
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "accepted": 0, "bucket_hits": 0}
+        self.stats.update({f"{stage}_rejected": 0 for stage in STAGES if stage != "bucket"})
+
+    @classmethod
+    def load(cls, collection, **options) -> "FingerprintIndex":
+        """Все изображения с отпечатком или image_hash"""
+        index = cls(**options)
+        index.refresh(collection)
+        return index
+
+    def refresh(self, collection) -> int:
+        """Первая загрузка или дочитывание скачанных после synced_at; возвращает число добавленных"""
+        started = datetime.now()
+        query = dict(self.QUERY)
+        if self.synced_at is not None:
+            since = datetime.fromisoformat(self.synced_at) - SYNC_WINDOW
+            query["downloaded_at"] = {"$gte": since.isoformat()}
+        added = 0
+        with self._lock:
+            for doc in collection.find(query, self.PROJECTION):
+                if doc["_id"] in self.known:
+                    continue
+                record = doc.pop(FINGERPRINT_FIELD, None)
+                if self.add(doc, record, doc.get("image_hash")):
+                    self.known.add(doc["_id"])
+                    added += 1
+            self.synced_at = started.isoformat()
+        return added
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, doc: Dict, record: Optional[Dict], image_hash: Optional[str] = None) -> bool:
+        """Добавить изображение; False - нет ни отпечатка, ни разбираемого image_hash"""
+        if _complete(record):
+            hashes = (to_uint64(record["p"]), to_uint64(record["d"]), to_uint64(record["w"]))
+            full, moments = True, record["m"]
+        else:
+            value = hash_to_int(image_hash)
+            if value is None:
+                return False
+            hashes, full, moments = (value, 0, 0), False, [0.0] * MOMENTS
+        position = len(self.docs)
+        if position == len(self._full):
+            capacity = max(1024, 2 * position)
+            self._hashes = np.resize(self._hashes, (capacity, 3))
+            self._full = np.resize(self._full, capacity)
+            self._moments = np.resize(self._moments, (capacity, MOMENTS))
+        self._hashes[position] = hashes
+        self._full[position] = full
+        self._moments[position] = moments
+        self.buckets.setdefault(hashes[0], []).append(position)
+        self.docs.append(doc)
+        return True
+
+    def _columns(self):
+        size = len(self.docs)
+        hashes = self._hashes[:size]
+        return hashes[:, 0], hashes[:, 1], hashes[:, 2], self._full[:size], self._moments[:size]
+
+    def search(self, record: Dict, similarity: Optional[Callable[[Dict], Optional[float]]] = None) -> List[Tuple]:
+        """Каскад для нового отпечатка -> [(doc, pHash-расстояние, косинус, причина)] принятых пар
+
+        similarity(doc) - косинус эмбеддингов пары или None (этап embedding пропускается).
+        """
+        self.stats["checked"] += 1
+        if not len(self.docs):
+            return []
+        value = to_uint64(record["p"])
+
+        # 1. Точное совпадение pHash - подтвердив его, весь корпус не просматриваем
+        bucket = self.buckets.get(value, [])
+        if bucket:
+            self.stats["bucket_hits"] += 1
+            accepted = self._verify(np.array(bucket), np.zeros(len(bucket), dtype=np.int64), record, similarity)
+            if accepted:
+                return accepted
+
+        # 2. Hamming по всему корпусу (пары из корзины уже проверены)
+        hashes = self._columns()[0]
+        distances = hamming(hashes, value)
+        mask = distances <= self.candidate_distance
+        mask[bucket] = False
+        self.stats["phash_rejected"] += len(hashes) - len(bucket) - int(mask.sum())
+        positions = np.flatnonzero(mask)
+        return self._verify(positions, distances[positions].astype(np.int64), record, similarity)
+
+    def _verify(self, positions: np.ndarray, distances: np.ndarray, record: Dict, similarity) -> List[Tuple]:
+        """Этапы 3-4 для кандидатов pHash"""
+        if not len(positions):
+            return []
+        _, dhashes, whashes, full, moments = self._columns()
+        complete = _complete(record)
+        full = full[positions] & complete
+        keep = np.ones(len(positions), dtype=bool)
+        if complete and full.any():
+            for stage, column, key, limit in (("dhash", dhashes, "d", DHASH_DISTANCE),
+                                              ("whash", whashes, "w", WHASH_DISTANCE)):
+                rejected = full & keep & (hamming(column[positions], to_uint64(record[key])) > limit)
+                self.stats[f"{stage}_rejected"] += int(rejected.sum())
+                keep &= ~rejected
+            color = np.linalg.norm(moments[positions] - np.array(record["m"], dtype=np.float32), axis=1)
+        else:
+            color = np.zeros(len(positions), dtype=np.float32)
+
+        accepted = []
+        for i in np.flatnonzero(keep):
+            doc, distance = self.docs[positions[i]], int(distances[i])
+            sim = similarity(doc) if similarity is not None else None
+            if sim is not None:
+                # 4a. Эмбеддинги решают сами (перефильтрованные репосты меняют цвет)
+                if not is_duplicate_pair(distance, sim):
+                    self.stats["embedding_rejected"] += 1
+                    continue
+                accepted.append((doc, distance, sim, "phash"))
+            elif full[i]:
+                # 4b. Без эмбеддингов: цвет и мягкий порог pHash
+                if color[i] > COLOR_DISTANCE:
+                    self.stats["color_rejected"] += 1
+                    continue
+                if distance > self.fingerprint_distance:
+                    self.stats["phash_rejected"] += 1
+                    continue
+                accepted.append((doc, distance, None, "fingerprint"))
+            elif distance <= self.phash_only_distance:
+                accepted.append((doc, distance, None, "phash"))
+            else:
+                self.stats["phash_rejected"] += 1
+        self.stats["accepted"] += len(accepted)
+        return accepted
+
+
+_shared: Dict[str, FingerprintIndex] = {}
+_shared_lock = threading.Lock()
+
+
+def get_index(collection) -> FingerprintIndex:
+    """Общий на процесс индекс коллекции: загружается один раз, при каждом вызове дочитывает новые"""
+    key = collection.full_name
+    with _shared_lock:
+        index = _shared.get(key)
+        if index is None:
+            index = _shared[key] = FingerprintIndex()
+    index.refresh(collection)
+    return index
@@ -0,0 +1,135 @@
+"""Быстрое декодирование изображений для хешей и миниатюр
+
+Для pHash нужен вход 32x32, а Instagram отдаёт JPEG 1080x1350: полное
+декодирование плюс LANCZOS-уменьшение всего кадра занимали ~20 мс на
+изображение. Здесь JPEG декодируется в draft-режиме (масштабирование DCT
+в libjpeg: 1/2, 1/4, 1/8) сразу до ближайшего размера не меньше нужного,
+один раз на изображение, и из этого декодирования считается всё сразу:
+
+    decoded = decode_image(response.content)          # bytes, путь или файловый объект
+    decoded["phash"], decoded["dhash"], decoded["whash"]  # hex-строки imagehash (64 бита)
+    decoded["histogram"]                              # цветовая гистограмма, 3 x HISTOGRAM_BINS
+    decoded["moments"]                                # цветовые моменты: среднее, СКО, асимметрия по R, G, B
+    decoded["thumbnails"]                             # {размер: PIL.Image} для THUMBNAIL_SIZES
+
+Байты из requests оборачиваются в BytesIO без копирования. Хеши из draft
+декодирования могут отличаться от полного на 0-2 бита из 64, поэтому все хеши
+корпуса считаются только здесь: документ помечается hash_decode: "draft", а
+image_hash старых версий (полное декодирование) пересчитывает
+add_perceptual_hash_to_existing.py.
+Не-JPEG (PNG, WebP) декодируются полностью, draft для них ничего не делает.
+"""
+
+import os
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+
+# Минимальная сторона draft-декодирования (вход pHash - 32x32)
+DRAFT_MIN_SIZE = int(os.getenv('IMAGE_DRAFT_MIN_SIZE', 64))
+
+# Миниатюры при скачивании, например "320,640" (по умолчанию не создаются)
+THUMBNAIL_SIZES = tuple(int(size) for size in os.getenv('IMAGE_THUMBNAIL_SIZES', '').split(',') if size.strip())
+
+HISTOGRAM_BINS = 8
+
+ALL_FEATURES = ("phash", "dhash", "whash", "histogram", "moments", "thumbnails")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+THUMBNAILS_DIR = os.path.join(BASE_DIR, 'images', 'thumbnails')
+
+
+def _source(source):
+    """bytes/bytearray/memoryview -> BytesIO (bytes не копируются), путь и файл - как есть"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return BytesIO(source)
+    return source
+
+
+def open_draft(source, min_size: int = DRAFT_MIN_SIZE) -> Image.Image:
+    """RGB-изображение, декодированное с масштабированием DCT до стороны >= min_size"""
+    with Image.open(_source(source)) as image:
+        original_size = image.size
+        image.draft('RGB', (min_size, min_size))
+        rgb = image.convert('RGB')
+    rgb.info['original_size'] = original_size
+    return rgb
+
+
+def color_histogram(rgb: Image.Image, bins: int = HISTOGRAM_BINS) -> List[float]:
+    """Доли пикселей по bins интервалам для каждого канала R, G, B (3 * bins чисел)"""
+    pixels = np.asarray(rgb, dtype=np.uint8).reshape(-1, 3)
+    shift = 8 - int(np.log2(bins))
+    counts = [np.bincount(pixels[:, channel] >> shift, minlength=bins) for channel in range(3)]
+    return [round(float(v), 4) for v in np.concatenate(counts) / max(len(pixels), 1)]
+
+
+def color_moments(rgb: Image.Image) -> List[float]:
+    """Среднее, СКО и асимметрия (кубический корень третьего момента) каждого канала, в долях 0..1"""
+    pixels = np.asarray(rgb, dtype=np.float32).reshape(-1, 3)
+    mean = pixels.mean(axis=0)
+    centered = pixels - mean
+    std = np.sqrt((centered ** 2).mean(axis=0))
+    skew = np.cbrt((centered ** 3).mean(axis=0))
+    return [round(float(v), 4) for v in np.concatenate([mean, std, skew]) / 255.0]
+
+
+def decode_image(source, features: Iterable[str] = ALL_FEATURES,
+                 thumbnail_sizes: Iterable[int] = THUMBNAIL_SIZES) -> Dict:
+    """Одно draft-декодирование -> {'width', 'height', 'phash', 'dhash', 'whash', 'histogram', 'moments', 'thumbnails'}
+
+    width/height - исходный размер. Считаются только запрошенные features.
+    """
+    import imagehash
+
+    features = set(features)
+    sizes = sorted(set(thumbnail_sizes)) if "thumbnails" in features else []
+    rgb = open_draft(source, max([DRAFT_MIN_SIZE] + sizes))
+    width, height = rgb.info['original_size']
+    result = {"width": width, "height": height}
+
+    if features & {"phash", "dhash", "whash"}:
+        gray = rgb.convert('L')
+        if "phash" in features:
+            result["phash"] = str(imagehash.phash(gray, hash_size=HASH_SIZE))
+        if "dhash" in features:
+            result["dhash"] = str(imagehash.dhash(gray, hash_size=HASH_SIZE))
+        if "whash" in features:
+            # Вейвлет Хаара (PyWavelets); вход - степень двойки не больше draft-размера
+            result["whash"] = str(imagehash.whash(gray, hash_size=HASH_SIZE))
+    if "histogram" in features:
+        result["histogram"] = color_histogram(rgb)
+    if "moments" in features:
+        result["moments"] = color_moments(rgb)
+    if "thumbnails" in features:
+        result["thumbnails"] = {}
+        for size in sizes:
+            thumbnail = rgb.copy()
+            thumbnail.thumbnail((size, size), Image.LANCZOS)
+            result["thumbnails"][size] = thumbnail
+    return result
+
+
+def perceptual_hash(source) -> Optional[str]:
+    """pHash (16 hex-символов) или None, если изображение не декодируется"""
+    try:
+        return decode_image(source, features=("phash",))["phash"]
+    except Exception as e:
+        print(f"❌ Ошибка вычисления perceptual hash: {e}")
+        return None
+
+
+def save_thumbnails(thumbnails: Dict[int, Image.Image], filename: str, root: str = THUMBNAILS_DIR) -> Dict[int, str]:
+    """Сохранить миниатюры в images/thumbnails/<размер>/<filename>; возвращает {размер: путь}"""
+    paths = {}
+    for size, thumbnail in thumbnails.items():
+        folder = os.path.join(root, str(size))
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, os.path.splitext(filename)[0] + '.jpg')
+        thumbnail.save(path, 'JPEG', quality=85, optimize=True)
+        paths[size] = path
+    return paths
@@ -0,0 +1,148 @@
+"""Телеметрия загрузки: время стадий и счётчики сессии парсинга
+
+Сессия парсинга (run_parsing_session) создаёт IngestionTelemetry и отдаёт её
+парсеру (InstagramParser.telemetry). Каждая стадия замеряется так:
+
+    with telemetry.stage("download"):
+        response = requests.get(url)
+    telemetry.count("bytes_downloaded", len(response.content))
+    telemetry.skip("phash_duplicate")
+
+Стадии: apify_wait, dataset_fetch, extract_urls, exists_lookup, download, phash,
+dedup_lookup, file_write, mongo_save, gallery_html, combined_gallery_html.
+По окончании сессии итог сохраняется в коллекцию parsing_runs и показывается
+на главной странице - видно, какая стадия доминирует и как меняется от запуска
+к запуску.
+
+Без сессии (CLI, интерактивные скрипты) у парсера NULL_TELEMETRY - замеры ничего
+не стоят.
+"""
+
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+RUNS_COLLECTION = "parsing_runs"
+
+# Порядок стадий в отчёте
+STAGES = [
+    "apify_wait", "dataset_fetch", "extract_urls", "exists_lookup", "download", "phash",
+    "dedup_lookup", "file_write", "mongo_save", "gallery_html", "combined_gallery_html",
+]
+
+# Стадии пути одного изображения - по их сумме считается images/sec
+PER_IMAGE_STAGES = ("exists_lookup", "download", "phash", "dedup_lookup", "file_write")
+
+
+class IngestionTelemetry:
+    """Таймеры стадий и счётчики одной сессии парсинга"""
+
+    def __init__(self, session_id: str, accounts: List[str], max_posts: int, date_from: Optional[str] = None):
+        self.session_id = session_id
+        self.accounts = accounts
+        self.max_posts = max_posts
+        self.date_from = date_from
+        self.started_at = datetime.now()
+        self._started = time.perf_counter()
+        self.stages = {}      # {stage: {'seconds': float, 'calls': int}}
+        self.counters = {}    # {counter: int}
+        self.skips = {}       # {причина: int}
+        self.account_seconds = {}
+        self._account = None
+        self._account_started = 0.0
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stat = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            stat['seconds'] += time.perf_counter() - started
+            stat['calls'] += 1
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def skip(self, reason: str, value: int = 1):
+        self.skips[reason] = self.skips.get(reason, 0) + value
+
+    def start_account(self, account: str):
+        self.finish_account()
+        self._account = account
+        self._account_started = time.perf_counter()
+
+    def finish_account(self):
+        if self._account is not None:
+            self.account_seconds[self._account] = round(time.perf_counter() - self._account_started, 3)
+            self._account = None
+
+    def summary(self, status: str = "completed", error: Optional[str] = None) -> Dict:
+        """Итог сессии - документ parsing_runs"""
+        self.finish_account()
+        total = time.perf_counter() - self._started
+        ordered = [s for s in STAGES if s in self.stages] + sorted(set(self.stages) - set(STAGES))
+        stages = [
+            {
+                'stage': name,
+                'seconds': round(self.stages[name]['seconds'], 3),
+                'calls': self.stages[name]['calls'],
+                'share': round(self.stages[name]['seconds'] / total, 4) if total else 0,
+            }
+            for name in ordered
+        ]
+        per_image = sum(self.stages.get(s, {}).get('seconds', 0.0) for s in PER_IMAGE_STAGES)
+        downloaded = self.counters.get('images_downloaded', 0)
+
+        return {
+            'session_id': self.session_id,
+            'accounts': self.accounts,
+            'max_posts': self.max_posts,
+            'date_from': self.date_from,
+            'status': status,
+            'error': error,
+            'started_at': self.started_at.isoformat(),
+            'finished_at': datetime.now().isoformat(),
+            'duration_seconds': round(total, 3),
+            'stages': stages,
+            'counters': dict(self.counters),
+            'skips': dict(self.skips),
+            'account_seconds': dict(self.account_seconds),
+            'images_per_sec': round(downloaded / per_image, 2) if per_image else 0,
+            'download_mb_per_sec': round(
+                self.counters.get('bytes_downloaded', 0) / 1024 / 1024 / self.stages['download']['seconds'], 2
+            ) if self.stages.get('download', {}).get('seconds') else 0,
+        }
+
+    def save(self, db, status: str = "completed", error: Optional[str] = None) -> Dict:
+        """Сохранить итог в parsing_runs"""
+        run = self.summary(status, error)
+        db[RUNS_COLLECTION].insert_one(dict(run))
+        slowest = max(run['stages'], key=lambda s: s['seconds'], default=None)
+        print(f"⏱️ Сессия {self.session_id}: {run['duration_seconds']} сек, "
+              f"{run['images_per_sec']} изобр/сек"
+              + (f", дольше всего {slowest['stage']} ({slowest['seconds']} сек)" if slowest else ""))
+        return run
+
+
+class NullTelemetry:
+    """Телеметрия-заглушка для запусков вне веб-сессии"""
+
+    @contextmanager
+    def stage(self, name: str):
+        yield
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def skip(self, reason: str, value: int = 1):
+        pass
+
+
+NULL_TELEMETRY = NullTelemetry()
+
+
+def recent_runs(db, limit: int = 20) -> List[Dict]:
+    """Последние сессии парсинга, новые первыми"""
+    return list(db[RUNS_COLLECTION].find({}, {'_id': 0}).sort('started_at', -1).limit(limit))
@@ -6,14 +6,12 @@ import os
 import json
 import requests
 import pymongo
-import imagehash
-from PIL import Image
-from io import BytesIO
 from datetime import datetime
 from pathlib import Path
 import argparse
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
+from ingestion_telemetry import NULL_TELEMETRY
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
@@ -27,6 +25,10 @@ class InstagramParser:
         self.client = None
         self.db = None
         self.collection = None
+        # Таймеры стадий и счётчики (IngestionTelemetry выставляет сессия парсинга)
+        self.telemetry = NULL_TELEMETRY
+        # Детектор визуальных дубликатов текущей сессии скачивания (near_duplicates.py)
+        self.duplicate_detector = None
         
     def connect_mongodb(self):
         """Подключение к MongoDB"""
@@ -40,6 +42,22 @@ class InstagramParser:
             print(f"❌ Ошибка подключения к MongoDB: {e}")
             return False
     
+    def decode_image(self, image_data: bytes) -> Dict:
+        """Одно draft-декодирование скачанных байтов: хеши отпечатка и миниатюры (image_decode.py)
+        
+        Returns:
+            {'phash', 'dhash', 'whash', 'moments', 'thumbnails', ...} или {} при ошибке декодирования
+        """
+        try:
+            # PIL и imagehash (numpy, scipy) импортируются при первом хеше, а не при старте веб-процесса
+            from image_decode import decode_image
+            from fingerprint import FINGERPRINT_FEATURES
+
+            return decode_image(image_data, features=FINGERPRINT_FEATURES + ("thumbnails",))
+        except Exception as e:
+            print(f"❌ Ошибка вычисления perceptual hash: {e}")
+            return {}
+    
     def calculate_perceptual_hash(self, image_data: bytes) -> str:
         """Вычисление perceptual hash изображения
         
@@ -49,18 +67,7 @@ class InstagramParser:
         Returns:
             Строковое представление perceptual hash
         """
-        try:
-            # Открываем изображение из байтов
-            image = Image.open(BytesIO(image_data))
-            
-            # Вычисляем perceptual hash (pHash)
-            # pHash более устойчив к изменениям, чем average hash
-            phash = imagehash.phash(image, hash_size=8)
-            
-            return str(phash)
-        except Exception as e:
-            print(f"❌ Ошибка вычисления perceptual hash: {e}")
-            return None
+        return self.decode_image(image_data).get("phash")
     
     def is_duplicate_by_hash(self, image_hash: str, threshold: int = 5) -> Optional[Dict]:
         """Проверка на дубликаты по perceptual hash
@@ -78,29 +85,36 @@ class InstagramParser:
         try:
             if not image_hash:
                 return None
-            
+
+            import numpy as np
+            from near_duplicates import hamming, hash_to_int
+
+            current_hash = hash_to_int(image_hash)
+            if current_hash is None:
+                return None
+
             # Получаем все хеши из БД
-            existing_hashes = self.collection.find(
+            docs, values = [], []
+            for doc in self.collection.find(
                 {"image_hash": {"$exists": True}},
                 {"image_hash": 1, "image_url": 1, "post_id": 1, "_id": 1}
-            )
-            
-            current_hash = imagehash.hex_to_hash(image_hash)
-            
-            # Проверяем каждый хеш на похожесть
-            for doc in existing_hashes:
-                try:
-                    existing_hash = imagehash.hex_to_hash(doc["image_hash"])
-                    # Вычисляем Hamming distance (количество различающихся битов)
-                    distance = current_hash - existing_hash
-                    
-                    if distance <= threshold:
-                        print(f"🔍 Найден дубликат! Hamming distance: {distance}")
-                        print(f"   Существующий: {doc.get('post_id', 'N/A')}")
-                        return doc
-                except Exception as e:
-                    continue
-            
+            ):
+                value = hash_to_int(doc.get("image_hash"))
+                if value is not None:
+                    docs.append(doc)
+                    values.append(value)
+            if not docs:
+                return None
+
+            # Hamming distance до всех хешей разом (XOR + popcount)
+            distances = hamming(np.array(values, dtype=np.uint64), current_hash)
+            position = int(np.argmin(distances))
+            if distances[position] <= threshold:
+                doc = docs[position]
+                print(f"🔍 Найден дубликат! Hamming distance: {int(distances[position])}")
+                print(f"   Существующий: {doc.get('post_id', 'N/A')}")
+                return doc
+
             return None
         except Exception as e:
             print(f"❌ Ошибка проверки дубликатов по хешу: {e}")
@@ -159,10 +173,11 @@ class InstagramParser:
             
             # ВАЖНО: Вызов актора может занять много времени с большим лимитом
             print(f"⏳ [PARSER] Вызов актора с таймаутом 600 секунд (10 минут)...")
-            run = client.actor("apify/instagram-scraper").call(
-                run_input=run_input,
-                timeout_secs=600  # Таймаут 10 минут
-            )
+            with self.telemetry.stage("apify_wait"):
+                run = client.actor("apify/instagram-scraper").call(
+                    run_input=run_input,
+                    timeout_secs=600  # Таймаут 10 минут
+                )
             
             elapsed_time = time.time() - start_time
             print(f"⏱️ [PARSER] Актор выполнен за {elapsed_time:.1f} секунд")
@@ -173,7 +188,9 @@ class InstagramParser:
                 dataset_id = run["defaultDatasetId"]
                 print(f"   • [PARSER] ID датасета: {dataset_id}")
                 
-                dataset_items = client.dataset(dataset_id).list_items().items
+                with self.telemetry.stage("dataset_fetch"):
+                    dataset_items = client.dataset(dataset_id).list_items().items
+                self.telemetry.count("posts", len(dataset_items))
                 
                 print(f"✅ [PARSER] Получено {len(dataset_items)} постов")
                 print(f"{'='*60}\n")
@@ -262,8 +279,20 @@ class InstagramParser:
         return image_data
     
     def download_images(self, image_data: List[Dict], max_images: int = 100) -> List[Dict]:
-        """Скачивание изображений с проверкой дубликатов"""
+        """Скачивание изображений с проверкой дубликатов
+
+        Дубликаты ищутся в два этапа (near_duplicates.DuplicateDetector): pHash-кандидаты
+        и, если установлен CLIP, косинус эмбеддингов - так ловятся кропы, зеркала и
+        перефильтрованные репосты, которые pHash пропускает.
+        """
+        from fingerprint import HASH_DECODE, HASH_DECODE_FIELD, fingerprint_record
+        from near_duplicates import DuplicateDetector
+
         print(f"⬇️ Скачивание изображений (максимум {max_images})...")
+        detector = DuplicateDetector(self.collection)
+        self.duplicate_detector = detector
+        if detector.use_embeddings:
+            print("🧠 Проверка дубликатов: pHash + CLIP-эмбеддинги")
         
         # Создаем папку для изображений
         images_dir = Path("images")
@@ -284,9 +313,12 @@ class InstagramParser:
                 img_type = img_data["image_type"]
                 
                 # Проверяем, есть ли уже изображения с этим post_id в БД
-                if self.is_image_exists(url, post_id):
+                with self.telemetry.stage("exists_lookup"):
+                    exists = self.is_image_exists(url, post_id)
+                if exists:
                     print(f"⏭️ [{i+1}/{total_to_download}] Пропуск дубликата по post_id: {post_id}")
                     skipped_count += 1
+                    self.telemetry.skip("already_in_db")
                     continue
                 
                 # Проверяем, нужно ли скачивать изображение (только по локальному файлу)
@@ -304,34 +336,65 @@ class InstagramParser:
                         "downloaded_at": datetime.now().isoformat()
                     })
                     skipped_count += 1
+                    self.telemetry.skip("file_exists")
                     continue
                 
                 
                 print(f"📥 [{i+1}/{total_to_download}] Скачивание: {filename}")
                 
                 # Скачиваем изображение
-                response = requests.get(url, timeout=30)
-                if response.status_code == 200:
+                with self.telemetry.stage("download"):
+                    response = requests.get(url, timeout=30)
                     image_content = response.content
+                if response.status_code == 200:
+                    self.telemetry.count("bytes_downloaded", len(image_content))
                     
                     # Вычисляем perceptual hash
                     print(f"🔢 Вычисление perceptual hash...")
-                    image_hash = self.calculate_perceptual_hash(image_content)
+                    with self.telemetry.stage("phash"):
+                        decoded = self.decode_image(image_content)
+                        image_hash = decoded.get("phash")
+                        fingerprint = fingerprint_record(decoded) if image_hash else None
                     
-                    if image_hash:
-                        # Проверяем на дубликаты по perceptual hash
-                        duplicate = self.is_duplicate_by_hash(image_hash, threshold=5)
-                        
+                    if not image_hash:
+                        self.telemetry.count("phash_failed")
+
+                    embedding = None
+                    if detector.use_embeddings:
+                        try:
+                            with self.telemetry.stage("embed"):
+                                embedding = detector.embed(image_content)
+                        except Exception as e:
+                            # Модель не загрузилась - до конца сессии работаем только по pHash
+                            print(f"⚠️ CLIP-эмбеддинг недоступен, проверка только по pHash: {e}")
+                            detector.use_embeddings = False
+                            self.telemetry.count("embed_failed")
+
+                    if image_hash or embedding is not None:
+                        # Проверяем на визуальные дубликаты (pHash + эмбеддинг)
+                        with self.telemetry.stage("dedup_lookup"):
+                            duplicate = detector.check(image_hash, embedding, post_id, fingerprint)
+
                         if duplicate:
                             print(f"⏭️ [{i+1}/{total_to_download}] Найден визуальный дубликат!")
-                            print(f"   Оригинал: {duplicate.get('post_id', 'N/A')}")
+                            print(f"   Оригинал: {duplicate['doc'].get('post_id', duplicate['doc'].get('_id', 'N/A'))}")
                             print(f"   Текущий: {post_id}")
+                            print(f"   Hamming: {duplicate['distance']}, косинус: {duplicate['similarity']}, "
+                                  f"причина: {duplicate['reason']}")
                             skipped_count += 1
+                            if duplicate['similarity'] is None:
+                                self.telemetry.skip("phash_duplicate")
+                            else:
+                                self.telemetry.skip("embedding_duplicate")
                             continue
                     
                     # Сохраняем файл
-                    with open(filepath, 'wb') as f:
-                        f.write(image_content)
+                    with self.telemetry.stage("file_write"):
+                        with open(filepath, 'wb') as f:
+                            f.write(image_content)
+                        if decoded.get("thumbnails"):
+                            from image_decode import save_thumbnails
+                            save_thumbnails(decoded["thumbnails"], filename)
                     
                     file_size = filepath.stat().st_size
                     print(f"✅ Скачано: {filename} ({file_size} байт)")
@@ -339,21 +402,36 @@ class InstagramParser:
                         print(f"   Hash: {image_hash}")
                     
                     # Добавляем информацию о скачанном файле
-                    downloaded_data.append({
+                    entry = {
                         **img_data,
                         "local_filename": filename,
                         "local_path": str(filepath),
                         "file_size": file_size,
                         "downloaded_at": datetime.now().isoformat(),
-                        "image_hash": image_hash  # Добавляем perceptual hash
-                    })
+                        "image_hash": image_hash,  # Добавляем perceptual hash
+                        HASH_DECODE_FIELD: HASH_DECODE,  # хеш из draft-декодирования
+                        "fingerprint": fingerprint  # pHash, dHash, wHash, цветовые моменты (fingerprint.py)
+                    }
+                    downloaded_data.append(entry)
+                    # Следующие изображения сессии сравниваются и с этим
+                    detector.remember(entry, image_hash, embedding)
                     
                     downloaded_count += 1
+                    self.telemetry.count("images_downloaded")
                 else:
                     print(f"❌ Ошибка скачивания {filename}: HTTP {response.status_code}")
+                    self.telemetry.skip(f"http_{response.status_code}")
                     
             except Exception as e:
                 print(f"❌ Ошибка скачивания изображения {i+1}: {e}")
+                self.telemetry.skip("download_error")
+        
+        # Сколько пар отсёк каждый этап каскада отпечатков
+        for name, value in detector.cascade_stats.items():
+            self.telemetry.count(f"dedup_{name}", value)
+        if detector.embeddings_skipped:
+            # FashionCLIP ещё грузился в фоне - эти изображения проверены только отпечатками
+            self.telemetry.count("embed_not_ready", detector.embeddings_skipped)
         
         print(f"✅ Скачано {downloaded_count} изображений")
         print(f"⏭️ Пропущено {skipped_count} дубликатов")
@@ -422,6 +500,7 @@ class InstagramParser:
                     img_data["post_id"] in existing_posts):
                     print(f"⏭️ Пропуск дубликата: {img_data['image_url']}")
                     skipped_count += 1
+                    self.telemetry.skip("already_in_db_on_save")
                     continue
                 
                 doc = {
@@ -455,6 +534,10 @@ class InstagramParser:
                 # Добавляем perceptual hash, если есть
                 if "image_hash" in img_data and img_data["image_hash"]:
                     doc["image_hash"] = img_data["image_hash"]
+                    if img_data.get("hash_decode"):
+                        doc["hash_decode"] = img_data["hash_decode"]
+                if img_data.get("fingerprint"):
+                    doc["fingerprint"] = img_data["fingerprint"]
                 
                 mongo_docs.append(doc)
             
@@ -462,14 +545,15 @@ class InstagramParser:
             if mongo_docs:
                 result = self.collection.insert_many(mongo_docs)
                 print(f"✅ Сохранено {len(result.inserted_ids)} новых записей в MongoDB")
-                
-                # Создаем индексы для быстрого поиска
-                self.collection.create_index("username")
-                self.collection.create_index("image_url")
-                self.collection.create_index("timestamp")
-                self.collection.create_index("selected_for_tagging")
-                self.collection.create_index("image_hash")  # Индекс для perceptual hash
-                print("✅ Созданы индексы для быстрого поиска")
+                # Эмбеддинги, посчитанные при проверке дубликатов, - в EmbeddingStore по новым _id
+                if self.duplicate_detector is not None:
+                    try:
+                        added = self.duplicate_detector.commit(mongo_docs, result.inserted_ids)
+                        if added:
+                            print(f"🧠 Сохранено {added} CLIP-эмбеддингов")
+                    except Exception as e:
+                        print(f"⚠️ Ошибка сохранения эмбеддингов: {e}")
+                # Индексы объявлены в index_registry.py и создаются при старте, а не после каждой вставки
             else:
                 print("❌ Нет новых данных для сохранения")
             
@@ -0,0 +1,405 @@
+"""Поиск визуальных дубликатов: pHash-кандидаты + косинус CLIP-эмбеддингов
+
+Одного 64-битного pHash с порогом Хэмминга 5 мало. Он пропускает обрезанные,
+отзеркаленные, перефильтрованные репосты и репосты со стикерами, а на простых
+композициях (однотонный фон, текст) даёт ложные совпадения
+(см. debug_false_positive.py). Поэтому решение принимается по комбинированной
+оценке:
+
+    score = cosine + HASH_WEIGHT * max(0, 1 - hamming / PHASH_CANDIDATE_DISTANCE)
+    дубликат, если score >= DUPLICATE_SCORE
+
+Близкий pHash снижает требование к косинусу (при hamming=0 хватает 0.93), далёкий
+pHash требует почти одинаковых эмбеддингов (0.97 - кропы, зеркала, фильтры).
+Совпадение pHash без эмбеддингов у одного из изображений - прежнее правило
+hamming <= PHASH_ONLY_DISTANCE.
+
+Кандидаты для проверки:
+    - изображения с hamming <= PHASH_CANDIDATE_DISTANCE (векторный XOR + popcount
+      по всем хешам коллекции, без imagehash-объектов);
+    - кадры той же карусели, скачанные в текущей сессии (их ещё нет в базе);
+    - ближайшие соседи по эмбеддингу из EmbeddingStore.
+
+Кандидаты из базы проверяет каскад отпечатков (fingerprint.py): pHash, dHash,
+wHash и цветовые моменты. DuplicateDetector используется при скачивании
+(InstagramParser.download_images), cluster_corpus - в пакетном режиме
+mark_duplicates.py --embeddings.
+"""
+
+import os
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# pHash-кандидаты для проверки эмбеддингом
+PHASH_CANDIDATE_DISTANCE = 12
+# Правило без эмбеддингов (прежнее поведение is_duplicate_by_hash)
+PHASH_ONLY_DISTANCE = 5
+
+HASH_WEIGHT = 0.04
+DUPLICATE_SCORE = float(os.getenv('DEDUP_DUPLICATE_SCORE', 0.97))
+
+# Сколько ближайших соседей по эмбеддингу проверять
+NEIGHBOURS = 5
+
+# Тайлы пакетного режима: строки × столбцы матрицы сходства
+CLUSTER_ROW_BLOCK = 1024
+CLUSTER_COL_BLOCK = 16384
+# Тайл pHash: строки × столбцы матрицы XOR (по 8 байт на пару, 256 x 16384 - 32 МБ)
+PHASH_ROW_BLOCK = 256
+
+# Маски SWAR-popcount для uint64 (без таблицы и view uint8 - в 3 раза быстрее на тайлах)
+_M1, _M2, _M4, _H01 = (np.uint64(mask) for mask in (
+    0x5555555555555555, 0x3333333333333333, 0x0f0f0f0f0f0f0f0f, 0x0101010101010101
+))
+
+
+def hash_to_int(image_hash: str) -> Optional[int]:
+    """64-битный pHash (16 hex-символов imagehash) -> int"""
+    if not image_hash or len(image_hash) != 16:
+        return None
+    try:
+        return int(image_hash, 16)
+    except ValueError:
+        return None
+
+
+def _popcount(x: np.ndarray) -> np.ndarray:
+    """Число единичных битов каждого элемента uint64 (x перезаписывается) -> uint8"""
+    if hasattr(np, "bitwise_count"):   # numpy >= 2.0
+        return np.bitwise_count(x)
+    t = x >> np.uint64(1)
+    t &= _M1
+    x -= t
+    t = x >> np.uint64(2)
+    t &= _M2
+    x &= _M2
+    x += t
+    t = x >> np.uint64(4)
+    x += t
+    x &= _M4
+    x *= _H01
+    x >>= np.uint64(56)
+    return x.astype(np.uint8)
+
+
+def hamming(hashes: np.ndarray, value: int) -> np.ndarray:
+    """Расстояния Хэмминга от value до каждого хеша массива uint64"""
+    return _popcount(np.bitwise_xor(hashes, np.uint64(value)))
+
+
+def hamming_block(rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+    """Матрица расстояний Хэмминга len(rows) x len(columns) для массивов uint64"""
+    return _popcount(np.bitwise_xor(rows[:, None], columns[None, :]))
+
+
+def combined_score(distance: Optional[int], similarity: Optional[float]) -> Optional[float]:
+    """Комбинированная оценка пары (None - нет эмбеддинга)"""
+    if similarity is None:
+        return None
+    bonus = 0.0
+    if distance is not None:
+        bonus = HASH_WEIGHT * max(0.0, 1.0 - distance / PHASH_CANDIDATE_DISTANCE)
+    return similarity + bonus
+
+
+def _rounded(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(float(value), 4)
+
+
+def is_duplicate_pair(distance: Optional[int], similarity: Optional[float]) -> bool:
+    score = combined_score(distance, similarity)
+    if score is None:
+        return distance is not None and distance <= PHASH_ONLY_DISTANCE
+    return score >= DUPLICATE_SCORE
+
+
+def embedding_enabled() -> bool:
+    """Второй этап включён, если установлен CLIP и не выключен DEDUP_EMBEDDINGS=0"""
+    if os.getenv('DEDUP_EMBEDDINGS', '1') == '0':
+        return False
+    import clip_encoder
+    return clip_encoder.available()
+
+
+class DuplicateDetector:
+    """Проверка нового изображения на дубликат при скачивании
+
+    Индекс отпечатков коллекции общий на процесс (fingerprint.get_index): в начале
+    сессии он только дочитывает новые изображения. Изображения, принятые в этой
+    сессии, добавляются через remember() и тоже участвуют в проверке.
+    """
+
+    def __init__(self, collection, store=None, use_embeddings: Optional[bool] = None):
+        self.collection = collection
+        self.use_embeddings = embedding_enabled() if use_embeddings is None else use_embeddings
+        self.store = store
+        if self.use_embeddings and self.store is None:
+            from embedding_store import EmbeddingStore
+            self.store = EmbeddingStore()
+        self.index = None               # fingerprint.FingerprintIndex коллекции
+        self.pending: List[Dict] = []   # принятые в сессии, ещё не в базе
+        self._loaded = False
+        self._stats_before: Dict[str, int] = {}
+        self.embeddings_skipped = 0     # модель ещё не загружена
+
+    def _load(self):
+        from fingerprint import get_index
+
+        self.index = get_index(self.collection)
+        self._stats_before = dict(self.index.stats)
+        self._loaded = True
+
+    @property
+    def cascade_stats(self) -> Dict[str, int]:
+        """Счётчики каскада отпечатков за эту сессию: проверено, принято, отсеяно по этапам"""
+        if self.index is None:
+            return {}
+        return {name: value - self._stats_before.get(name, 0) for name, value in self.index.stats.items()}
+
+    def embed(self, image_content: bytes) -> Optional[np.ndarray]:
+        """CLIP-эмбеддинг скачанного изображения
+
+        None - второй этап выключен или модель ещё грузится в фоне (clip_encoder.warm_up):
+        сессия не ждёт загрузку, такие изображения проверяются отпечатками, а эмбеддинги
+        им досчитывает python embedding_store.py --backfill.
+        """
+        if not self.use_embeddings:
+            return None
+        import clip_encoder
+        from embedding_store import load_image
+
+        if not clip_encoder.ready():
+            clip_encoder.warm_up()
+            self.embeddings_skipped += 1
+            return None
+        return clip_encoder.get_encoder().encode_images([load_image(BytesIO(image_content))])[0]
+
+    def _similarity(self, embedding: Optional[np.ndarray], image_id) -> Optional[float]:
+        if embedding is None or self.store is None:
+            return None
+        other = self.store.vector(str(image_id))
+        return None if other is None else float(other @ embedding)
+
+    def check(self, image_hash: Optional[str], embedding: Optional[np.ndarray] = None,
+              post_id: Optional[str] = None, fingerprint: Optional[Dict] = None) -> Optional[Dict]:
+        """Лучший найденный дубликат: {'doc', 'distance', 'similarity', 'score', 'reason'} или None
+
+        fingerprint - запись fingerprint.fingerprint_record; без неё кандидаты из базы
+        проверяются только по pHash.
+        """
+        if not self._loaded:
+            self._load()
+        if embedding is not None:
+            embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+
+        value = hash_to_int(image_hash)
+        matches = []
+
+        # 1. Кандидаты из базы: каскад отпечатков (корзина pHash, Hamming, dHash/wHash, цвет/эмбеддинг)
+        if fingerprint is None and value is not None:
+            from fingerprint import to_int64
+            fingerprint = {"p": to_int64(image_hash)}
+        if fingerprint is not None and fingerprint.get("p") is not None:
+            matches.extend(self.index.search(
+                fingerprint, similarity=lambda doc: self._similarity(embedding, doc["_id"])
+            ))
+
+        # 2. Принятые в этой сессии: pHash-кандидаты и кадры той же карусели
+        for item in self.pending:
+            distance = None
+            if value is not None and item["hash"] is not None:
+                distance = int(hamming(np.array([item["hash"]], dtype=np.uint64), value)[0])
+            same_post = post_id is not None and item["doc"].get("post_id") == post_id
+            if not same_post and (distance is None or distance > PHASH_CANDIDATE_DISTANCE):
+                continue
+            similarity = None
+            if embedding is not None and item["embedding"] is not None:
+                similarity = float(item["embedding"] @ embedding)
+            matches.append((item["doc"], distance, similarity, "carousel" if same_post else "phash"))
+
+        # 3. Ближайшие соседи по эмбеддингу (кропы и зеркала с далёким pHash)
+        if embedding is not None and self.store is not None and len(self.store):
+            seen = {str(doc["_id"]) for doc, *_ in matches if "_id" in doc}
+            for image_id, similarity in self.store.search(embedding, k=NEIGHBOURS):
+                if image_id not in seen and similarity >= DUPLICATE_SCORE:
+                    matches.append(({"_id": image_id}, None, similarity, "embedding"))
+
+        best = None
+        for doc, distance, similarity, reason in matches:
+            # "fingerprint" - пару уже подтвердили dHash, wHash и цвет
+            if reason != "fingerprint" and not is_duplicate_pair(distance, similarity):
+                continue
+            score = combined_score(distance, similarity)
+            rank = score if score is not None else 1.0 - distance / 64
+            if best is None or rank > best["rank"]:
+                best = {"doc": doc, "distance": distance, "similarity": _rounded(similarity),
+                        "score": _rounded(score), "reason": reason, "rank": rank}
+        if best is not None:
+            best.pop("rank")
+        return best
+
+    def remember(self, doc: Dict, image_hash: Optional[str], embedding: Optional[np.ndarray]):
+        """Изображение принято (не дубликат) - сравнивать с ним следующие в этой сессии"""
+        if embedding is not None:
+            embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        self.pending.append({"doc": doc, "hash": hash_to_int(image_hash), "embedding": embedding})
+
+    def commit(self, saved_docs: List[Dict], inserted_ids: List) -> int:
+        """После insert_many: эмбеддинги принятых изображений -> EmbeddingStore по их _id"""
+        if self.store is None:
+            return 0
+        by_filename = {item["doc"].get("local_filename"): item for item in self.pending}
+        ids, vectors = [], []
+        for doc, inserted_id in zip(saved_docs, inserted_ids):
+            item = by_filename.get(doc.get("local_filename"))
+            if item is not None and item["embedding"] is not None:
+                ids.append(str(inserted_id))
+                vectors.append(item["embedding"])
+        if not ids:
+            return 0
+        from clip_encoder import MODEL_ID
+        return self.store.add(ids, np.stack(vectors), model=MODEL_ID)
+
+
+# ============================================
+# ПАКЕТНЫЙ РЕЖИМ: КЛАСТЕРЫ ДУБЛИКАТОВ ПО ВСЕМУ КОРПУСУ
+# ============================================
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # Корень - более раннее изображение (меньший индекс)
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def _pair_edges(docs: List[Dict], store, progress=None) -> Dict[Tuple[int, int], Dict]:
+    """Пары (i, j), i < j, признанные дубликатами, с расстоянием и сходством"""
+    count = len(docs)
+    hashes = np.array([hash_to_int(doc.get("image_hash")) or 0 for doc in docs], dtype=np.uint64)
+    has_hash = np.array([hash_to_int(doc.get("image_hash")) is not None for doc in docs])
+
+    # Строка хранилища для каждого документа (-1 - нет эмбеддинга)
+    if store is not None:
+        store.refresh()
+    store_rows = np.array([store.rows.get(str(doc["_id"]), -1) if store is not None else -1 for doc in docs],
+                          dtype=np.int64)
+    with_embedding = np.flatnonzero(store_rows >= 0)
+    # Позиция документа в матрице эмбеддингов корпуса
+    positions = np.full(count, -1, dtype=np.int64)
+    positions[with_embedding] = np.arange(len(with_embedding))
+    matrix = None
+    if len(with_embedding):
+        source = store._resident_matrix()
+        source = store.vectors if source is None else source
+        matrix = np.asarray(source[store_rows[with_embedding]], dtype=np.float32)
+
+    edges = {}
+
+    # 1. pHash-кандидаты: тайлы XOR + popcount, только верхний треугольник;
+    #    в Python проходят лишь пары с расстоянием <= PHASH_CANDIDATE_DISTANCE
+    for row_start in range(0, count, PHASH_ROW_BLOCK):
+        row_end = min(row_start + PHASH_ROW_BLOCK, count)
+        for col_start in range(row_start, count, CLUSTER_COL_BLOCK):
+            col_end = min(col_start + CLUSTER_COL_BLOCK, count)
+            distances = hamming_block(hashes[row_start:row_end], hashes[col_start:col_end])
+            candidates = (
+                (distances <= PHASH_CANDIDATE_DISTANCE)
+                & has_hash[row_start:row_end, None] & has_hash[None, col_start:col_end]
+            )
+            if col_start == row_start:
+                candidates &= np.triu(np.ones(candidates.shape, dtype=bool), k=1)
+            rows, columns = np.nonzero(candidates)
+            if not len(rows):
+                continue
+            pair_distances = distances[rows, columns].astype(np.int64)
+            rows, columns = rows + row_start, columns + col_start
+            # Косинус сразу для всех кандидатов с эмбеддингами у обоих изображений
+            sims = np.full(len(rows), np.nan, dtype=np.float32)
+            both = (positions[rows] >= 0) & (positions[columns] >= 0)
+            if both.any():
+                sims[both] = np.einsum(
+                    "ij,ij->i", matrix[positions[rows[both]]], matrix[positions[columns[both]]]
+                )
+            for i, j, distance, sim in zip(rows.tolist(), columns.tolist(), pair_distances.tolist(), sims.tolist()):
+                sim = None if sim != sim else sim   # NaN - нет эмбеддинга
+                if is_duplicate_pair(distance, sim):
+                    edges[(i, j)] = {"distance": distance, "similarity": sim, "reason": "phash"}
+        if progress:
+            progress("phash", row_end, count)
+
+    # 2. Эмбеддинги: тайлы матрицы сходства, только верхний треугольник
+    if matrix is not None:
+        total = len(with_embedding)
+        for row_start in range(0, total, CLUSTER_ROW_BLOCK):
+            rows = matrix[row_start:row_start + CLUSTER_ROW_BLOCK]
+            for col_start in range(row_start, total, CLUSTER_COL_BLOCK):
+                sims = rows @ matrix[col_start:col_start + CLUSTER_COL_BLOCK].T
+                # Минимальная оценка достижима только при сходстве >= DUPLICATE_SCORE - HASH_WEIGHT
+                hits = np.argwhere(sims >= DUPLICATE_SCORE - HASH_WEIGHT)
+                for r, c in hits:
+                    a, b = int(with_embedding[row_start + r]), int(with_embedding[col_start + c])
+                    if a >= b:
+                        continue
+                    distance = None
+                    if has_hash[a] and has_hash[b]:
+                        distance = int(hamming(hashes[b:b + 1], int(hashes[a]))[0])
+                    sim = float(sims[r, c])
+                    if (a, b) not in edges and is_duplicate_pair(distance, sim):
+                        same_post = docs[a].get("post_id") and docs[a].get("post_id") == docs[b].get("post_id")
+                        edges[(a, b)] = {"distance": distance, "similarity": sim,
+                                         "reason": "carousel" if same_post else "embedding"}
+            if progress:
+                progress("embedding", min(row_start + CLUSTER_ROW_BLOCK, total), total)
+
+    return edges
+
+
+def cluster_corpus(docs: List[Dict], store=None, progress=None) -> List[Dict]:
+    """Кластеры дубликатов по всему корпусу
+
+    docs - документы, отсортированные по дате добавления (первый в кластере - оригинал).
+    Возвращает [{'original': doc, 'duplicates': [{'doc', 'distance', 'similarity', 'score', 'reason'}]}].
+    """
+    edges = _pair_edges(docs, store, progress)
+    union = _UnionFind(len(docs))
+    by_node: Dict[int, List[Tuple[int, int]]] = {}
+    for a, b in edges:
+        union.union(a, b)
+        by_node.setdefault(a, []).append((a, b))
+        by_node.setdefault(b, []).append((a, b))
+
+    clusters = {}
+    for i in range(len(docs)):
+        root = union.find(i)
+        if root != i:
+            clusters.setdefault(root, []).append(i)
+
+    result = []
+    for root, members in sorted(clusters.items()):
+        duplicates = []
+        for i in members:
+            # Связь с оригиналом, если она прямая; иначе - лучшая связь внутри кластера
+            edge = edges.get((root, i)) or max(
+                (edges[key] for key in by_node[i]), key=lambda e: e["similarity"] or 0.0
+            )
+            duplicates.append({
+                "doc": docs[i],
+                "distance": edge["distance"],
+                "similarity": _rounded(edge["similarity"]),
+                "score": _rounded(combined_score(edge["distance"], edge["similarity"])),
+                "reason": edge["reason"],
+            })
+        result.append({"original": docs[root], "duplicates": duplicates})
+    return result
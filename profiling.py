@@ -0,0 +1,208 @@
+"""Профилирование отдельных запросов по требованию
+
+Включается только для запроса с токеном администратора (PROFILE_TOKEN):
+    curl -H "X-Profile: $PROFILE_TOKEN" http://host:5000/api/analytics/subsubcategory-timeline
+    curl "http://host:5000/api/analytics/subsubcategory-timeline?__profile=$PROFILE_TOKEN"
+
+Для такого запроса работает cProfile (только поток запроса) и снимаются два снимка
+tracemalloc - до и после; разница показывает, какие строки выделили память.
+Артефакты складываются в PROFILE_DIR:
+    <id>.prof  - pstats (snakeviz, python -m pstats)
+    <id>.txt   - топ функций по cumulative time и топ аллокаций
+    <id>.json  - маршрут, параметры, статус, длительность
+Ответ получает заголовок X-Profile-Id. Список и скачивание - /api/profiles.
+
+Без PROFILE_TOKEN профилирование выключено. Одновременно профилируется один
+запрос: остальные с флагом выполняются как обычно (X-Profile-Status: busy).
+Снимки tracemalloc общие для процесса - параллельные запросы попадают в разницу.
+"""
+
+import os
+import io
+import re
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional
+
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_DIR = os.getenv(
+    'PROFILE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+)
+
+# Сколько профилей хранить (старые удаляются)
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 100))
+
+# Строк в текстовом отчёте
+TOP_FUNCTIONS = 60
+TOP_ALLOCATIONS = 30
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_FLAG = '__profile'
+PROFILES_API = '/api/profiles'
+
+ARTIFACT_KINDS = {"prof": "application/octet-stream", "txt": "text/plain", "json": "application/json"}
+
+_busy = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(PROFILE_TOKEN)
+
+
+def authorized(token: Optional[str]) -> bool:
+    """Токен администратора из заголовка X-Profile или параметра __profile"""
+    return enabled() and token == PROFILE_TOKEN
+
+
+def _slug(route: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+
+
+class RequestProfile:
+    """cProfile + разница снимков tracemalloc для одного запроса"""
+
+    def __init__(self, route: str, method: str, path: str, args: Dict):
+        self.route = route
+        self.method = method
+        self.path = path
+        self.args = args
+        self.profiler = cProfile.Profile()
+        self.own_tracemalloc = False
+        self.snapshot_before = None
+        self.started = 0.0
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self.own_tracemalloc = True
+        self.snapshot_before = tracemalloc.take_snapshot()
+        self.started = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self, status: int) -> str:
+        """Остановить профилирование и сохранить артефакты; возвращает id профиля"""
+        self.profiler.disable()
+        duration = time.perf_counter() - self.started
+        snapshot_after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if self.own_tracemalloc:
+            tracemalloc.stop()
+
+        profile_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{_slug(self.route)}"
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, profile_id)
+
+        self.profiler.dump_stats(base + ".prof")
+
+        report = io.StringIO()
+        report.write(f"{self.method} {self.path} -> {status}, {duration * 1000:.1f} ms\n")
+        report.write(f"args: {json.dumps(self.args, ensure_ascii=False)}\n\n")
+        stats = pstats.Stats(self.profiler, stream=report)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+        allocations = snapshot_after.compare_to(self.snapshot_before, "lineno")
+        report.write(f"\nАллокации за запрос (tracemalloc, пик {peak / 1024 / 1024:.1f} MB):\n")
+        for stat in allocations[:TOP_ALLOCATIONS]:
+            report.write(f"{stat}\n")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+
+        meta = {
+            "id": profile_id,
+            "created_at": datetime.now().isoformat(),
+            "route": self.route,
+            "method": self.method,
+            "path": self.path,
+            "args": self.args,
+            "status": status,
+            "duration_ms": round(duration * 1000, 1),
+            "peak_alloc_mb": round(peak / 1024 / 1024, 2),
+            "allocated_mb": round(sum(s.size_diff for s in allocations) / 1024 / 1024, 2),
+        }
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        _prune()
+        print(f"🔬 Профиль запроса {self.method} {self.route}: {meta['duration_ms']} ms -> {profile_id}")
+        return profile_id
+
+
+def _prune():
+    metas = sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith(".json"))
+    for name in metas[:-PROFILE_KEEP] if len(metas) > PROFILE_KEEP else []:
+        for kind in ARTIFACT_KINDS:
+            path = os.path.join(PROFILE_DIR, name[:-len(".json")] + "." + kind)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def init_app(app):
+    """Подключить профилирование запросов по флагу к Flask-приложению"""
+    from flask import g, request
+
+    @app.before_request
+    def _profile_start():
+        token = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_FLAG)
+        # Токен в запросах к самим профилям - это авторизация, а не флаг профилирования
+        if not token or not authorized(token) or request.path.startswith(PROFILES_API):
+            return
+        if not _busy.acquire(blocking=False):
+            g.profile_status = "busy"
+            return
+        rule = request.url_rule
+        args = {k: v for k, v in request.args.lists() if k != PROFILE_QUERY_FLAG}
+        g.request_profile = RequestProfile(
+            rule.rule if rule is not None else "unmatched", request.method, request.path, args
+        )
+        g.request_profile.start()
+
+    @app.after_request
+    def _profile_stop(response):
+        profile = g.pop("request_profile", None)
+        if profile is not None:
+            try:
+                response.headers["X-Profile-Id"] = profile.stop(response.status_code)
+            except Exception as e:
+                print(f"❌ Ошибка сохранения профиля: {e}")
+                response.headers["X-Profile-Status"] = "error"
+            finally:
+                _busy.release()
+        elif g.pop("profile_status", None):
+            response.headers["X-Profile-Status"] = "busy"
+        return response
+
+    @app.teardown_request
+    def _profile_teardown(exc):
+        # Необработанное исключение: after_request не вызывался
+        profile = g.pop("request_profile", None)
+        if profile is not None:
+            try:
+                profile.stop(500)
+            finally:
+                _busy.release()
+
+
+def list_profiles() -> List[Dict]:
+    """Метаданные сохранённых профилей, новые первыми"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith(".json"):
+            with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                profiles.append(json.load(f))
+    return profiles
+
+
+def artifact_path(profile_id: str, kind: str) -> Optional[str]:
+    """Путь к артефакту профиля (None - нет такого или недопустимое имя)"""
+    if kind not in ARTIFACT_KINDS or not re.fullmatch(r"[A-Za-z0-9_]+", profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{kind}")
+    return path if os.path.exists(path) else None
@@ -0,0 +1,380 @@
+"""Аналитика трендов: страницы дашборда и /api/analytics/*"""
+
+import os
+from flask import Blueprint, render_template, request, jsonify, Response, stream_with_context
+from instagram_parser import InstagramParser
+from analytics_cache import analytics_cache
+from taxonomy import normalize_subcategory_name
+from ximilar_schema import ITEMS_FIELD
+from analytics_stream import (
+    TAGGED_MATCH, DATED_MATCH, stream_images, items_of, slim_subcategory, slim_normalized, slim_names, count_per_image_by_month
+)
+from app_context import get_analytics, get_collection, get_precomputer, mongodb_uri
+
+bp = Blueprint('analytics', __name__)
+
+@bp.route('/analytics')
+def analytics():
+    """Страница аналитики с вкладками"""
+    return render_template('analytics.html')
+
+@bp.route('/analytics/trends')
+def analytics_trends():
+    """Страница аналитики модных трендов с разбивкой по категориям"""
+    return render_template('analytics_trends.html')
+
+@bp.route('/api/analytics/categories-stats', methods=['GET'])
+def api_analytics_categories_stats():
+    """API для получения статистики по категориям (оптимизировано)"""
+    try:
+        categories = get_analytics().get_categories_stats()
+        return jsonify({'success': True, 'categories': categories})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/subcategories-stats', methods=['GET'])
+def api_analytics_subcategories_stats():
+    """API для получения статистики по подкатегориям (оптимизировано)"""
+    try:
+        subcategories = get_analytics().get_subcategories_stats()
+        return jsonify({'success': True, 'subcategories': subcategories})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/colors-stats', methods=['GET'])
+def api_analytics_colors_stats():
+    """API для получения статистики по цветам"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_colors_stats()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/materials-stats', methods=['GET'])
+def api_analytics_materials_stats():
+    """API для получения статистики по материалам"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_materials_stats()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/styles-stats', methods=['GET'])
+def api_analytics_styles_stats():
+    """API для получения статистики по стилям"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_styles_stats()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/trends-timeline', methods=['GET'])
+def api_analytics_trends_timeline():
+    """API для получения трендов по времени"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_trends_timeline()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/subsubcategory-timeline', methods=['GET'])
+def api_analytics_subsubcategory_timeline():
+    """API для получения временных трендов по подподкатегориям с топ-20 для каждой категории"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_subsubcategory_timeline()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/subsubcategory-single', methods=['GET'])
+def api_analytics_subsubcategory_single():
+    """API для получения timeline данных для конкретного subsubcategory"""
+    try:
+        category = request.args.get('category')
+        subsubcategory_name = request.args.get('name')
+
+        if not category or not subsubcategory_name:
+            return jsonify({'success': False, 'message': 'Требуются параметры category и name'})
+
+        parser = InstagramParser(
+            apify_token=os.getenv("APIFY_API_TOKEN"),
+            mongodb_uri=mongodb_uri()
+        )
+
+        if not parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к базе данных'})
+
+        # Собираем данные: {year_month: count} - изображения, где есть нужный subsubcategory
+        def has_subsubcategory(doc):
+            for item in items_of(doc):
+                if item.get('c') == category and slim_subcategory(item) == subsubcategory_name:
+                    yield subsubcategory_name
+                    return
+
+        monthly_counts = count_per_image_by_month(
+            stream_images(parser.collection, dict(DATED_MATCH, **{f"{ITEMS_FIELD}.c": category}), fields=("timestamp",)),
+            has_subsubcategory
+        )
+        timeline_data = {month: counts[subsubcategory_name] for month, counts in monthly_counts.items() if counts}
+
+        # Преобразуем в массив для фронтенда
+        sorted_months = sorted(timeline_data.keys())
+        data_array = [timeline_data.get(month, 0) for month in sorted_months]
+
+        return jsonify({
+            'success': True,
+            'months': sorted_months,
+            'data': data_array
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/emerging-trends', methods=['GET'])
+def api_analytics_emerging_trends():
+    """API для получения растущих и угасающих трендов"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_emerging_trends()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/emerging-trends-dynamics', methods=['GET'])
+def api_analytics_emerging_trends_dynamics():
+    """API для получения динамики растущих трендов по месяцам"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_emerging_trends_dynamics()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/color-dynamics', methods=['GET'])
+def api_analytics_color_dynamics():
+    """API для получения динамики растущих цветов по месяцам"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_color_dynamics()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/material-dynamics', methods=['GET'])
+def api_analytics_material_dynamics():
+    """API для получения динамики растущих материалов по месяцам"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_material_dynamics()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/trend-predictions', methods=['GET'])
+def api_analytics_trend_predictions():
+    """API для прогнозирования трендов"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_trend_predictions()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/recommendations', methods=['GET'])
+def api_analytics_recommendations():
+    """API для получения рекомендаций"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_recommendations()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/top-accessories-stats', methods=['GET'])
+def api_analytics_top_accessories_stats():
+    """API для получения топ-20 популярных аксессуаров (оптимизировано)"""
+    try:
+        items = get_analytics().get_top_items_by_category('Accessories')
+        return jsonify({'success': True, 'items': items})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/top-accessories-dynamics', methods=['GET'])
+def api_analytics_top_accessories_dynamics():
+    """API для получения динамики топ-20 популярных аксессуаров по месяцам"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_top_items_dynamics('Accessories')})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/top-clothing-stats', methods=['GET'])
+def api_analytics_top_clothing_stats():
+    """API для получения топ-20 популярной одежды (оптимизировано)"""
+    try:
+        items = get_analytics().get_top_items_by_category('Clothing')
+        return jsonify({'success': True, 'items': items})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/top-clothing-dynamics', methods=['GET'])
+def api_analytics_top_clothing_dynamics():
+    """API для получения динамики топ-20 популярной одежды по месяцам"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_top_items_dynamics('Clothing')})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/top-footwear-stats', methods=['GET'])
+def api_analytics_top_footwear_stats():
+    """API для получения топ-20 популярной обуви (оптимизировано)"""
+    try:
+        items = get_analytics().get_top_items_by_category('Footwear')
+        return jsonify({'success': True, 'items': items})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/top-footwear-dynamics', methods=['GET'])
+def api_analytics_top_footwear_dynamics():
+    """API для получения динамики топ-20 популярной обуви по месяцам"""
+    try:
+        return jsonify({'success': True, **get_analytics().get_top_items_dynamics('Footwear')})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/item-gallery', methods=['GET'])
+def api_analytics_item_gallery():
+    """API для получения галереи изображений по конкретной вещи"""
+    try:
+        item_name = request.args.get('item_name')
+        top_category = request.args.get('top_category')
+
+        if not item_name or not top_category:
+            return jsonify({'success': False, 'message': 'Требуются параметры item_name и top_category'})
+
+        parser = InstagramParser(
+            apify_token=os.getenv("APIFY_API_TOKEN"),
+            mongodb_uri=mongodb_uri()
+        )
+
+        if not parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к базе данных'})
+
+        # Парсим item_name для извлечения подкатегории и цвета
+        # Формат: "Subcategory (Color)" или просто "Subcategory"
+        subcategory = item_name
+        color = None
+
+        if '(' in item_name and ')' in item_name:
+            parts = item_name.split('(')
+            subcategory = parts[0].strip()
+            color = parts[1].replace(')', '').strip()
+
+        # Ищем изображения с этой вещью (потоково, сервер отбирает только нужную top category)
+        images = stream_images(
+            parser.collection,
+            dict(TAGGED_MATCH, local_filename={"$exists": True}, **{f"{ITEMS_FIELD}.c": top_category}),
+            fields=("local_filename", "username", "likes_count", "comments_count", "caption", "timestamp"),
+            sort={"timestamp": -1}
+        )
+
+        # ИСПРАВЛЕНИЕ: Сравниваем нормализованные названия
+        normalized_search = normalize_subcategory_name(subcategory, top_category)
+
+        # Фильтруем изображения, которые содержат нужную вещь
+        matching_images = []
+
+        for image in images:
+            has_item = False
+
+            for item in items_of(image):
+                # Проверяем категорию
+                if item.get('c') != top_category:
+                    continue
+
+                # Проверяем подкатегорию (нормализованную при теггировании)
+                if slim_normalized(item) != normalized_search:
+                    continue
+
+                # Если цвет указан, проверяем и его
+                if color and color not in slim_names(item, 'col'):
+                    continue
+
+                # Вещь найдена!
+                has_item = True
+                break
+
+            if has_item:
+                matching_images.append({
+                    '_id': str(image['_id']),
+                    'local_filename': image.get('local_filename'),
+                    'username': image.get('username'),
+                    'likes_count': image.get('likes_count', 0),
+                    'comments_count': image.get('comments_count', 0),
+                    'caption': image.get('caption', ''),
+                    'timestamp': image.get('timestamp', '')
+                })
+
+        return jsonify({
+            'success': True,
+            'item_name': item_name,
+            'top_category': top_category,
+            'count': len(matching_images),
+            'images': matching_images
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/colors-by-category', methods=['GET'])
+def api_analytics_colors_by_category():
+    """API для получения статистики по цветам, разбитой по категориям (оптимизировано)"""
+    try:
+        colors = get_analytics().get_colors_by_category()
+        return jsonify({'success': True, 'data': colors})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/materials-by-category', methods=['GET'])
+def api_analytics_materials_by_category():
+    """API для получения статистики по материалам, разбитой по категориям (оптимизировано)"""
+    try:
+        materials = get_analytics().get_materials_by_category()
+        return jsonify({'success': True, 'data': materials})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/styles-by-category', methods=['GET'])
+def api_analytics_styles_by_category():
+    """API для получения статистики по стилям, разбитой по категориям (оптимизировано)"""
+    try:
+        styles = get_analytics().get_styles_by_category()
+        return jsonify({'success': True, 'data': styles})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/clear-cache', methods=['POST'])
+def api_analytics_clear_cache():
+    """API для очистки кеша аналитики"""
+    try:
+        analytics_cache.clear()
+        get_precomputer().trigger('clear-cache')
+        return jsonify({'success': True, 'message': 'Кеш аналитики очищен'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/analytics/precompute-status', methods=['GET'])
+def api_analytics_precompute_status():
+    """API для получения состояния фонового пересчёта аналитики"""
+    try:
+        return jsonify({'success': True, **get_precomputer().status()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/export/tags', methods=['GET'])
+def api_export_tags():
+    """Потоковая выгрузка тегов (объект на строку) в CSV или Parquet, chunked-ответом
+
+    Параметры: format (csv|parquet), username, date_from, date_to (YYYY-MM-DD), limit
+    """
+    try:
+        import export_tags
+
+        fmt = request.args.get('format', 'csv')
+        limit = request.args.get('limit', type=int)
+        match = export_tags.build_match(
+            request.args.get('username'), request.args.get('date_from'), request.args.get('date_to')
+        )
+        chunks = export_tags.export_chunks(get_collection(), fmt, match, limit)
+    except (ValueError, RuntimeError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+    # Без Content-Length: ответ уходит чанками по мере чтения курсора
+    return Response(
+        stream_with_context(chunks),
+        mimetype=export_tags.CONTENT_TYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename=tags.{fmt}'},
+    )
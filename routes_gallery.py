@@ -0,0 +1,1375 @@
+"""Галереи изображений: страницы, подгрузка, фильтры, скрытие и список блогеров"""
+
+import os
+import time
+from flask import Blueprint, render_template, request, jsonify, send_from_directory
+from instagram_parser import InstagramParser
+from cache_dependencies import snapshot_tags, invalidate_images
+from taxonomy import normalize_subcategory_name
+from ximilar_schema import ITEMS_FIELD, NO_FASHION_QUERY, read_objects, with_legacy_objects
+from analytics_stream import stream_images
+from app_context import web_parser, get_analytics, get_precomputer, get_collection, get_embedding_store, IMAGES_DIR, mongodb_uri
+
+bp = Blueprint('gallery', __name__)
+
+@bp.route('/images/<path:filename>')
+def serve_images(filename):
+    return send_from_directory(IMAGES_DIR, filename)
+
+@bp.route('/')
+def index():
+    """Главная страница"""
+    return render_template('index.html')
+
+@bp.route('/api/bloggers-stats', methods=['GET'])
+def api_bloggers_stats():
+    """API для получения статистики по блогерам (последняя дата поста)"""
+    try:
+        # Создаем экземпляр парсера для доступа к MongoDB
+        parser = InstagramParser(
+            apify_token=os.getenv("APIFY_API_TOKEN"),
+            mongodb_uri=mongodb_uri()
+        )
+        
+        # Подключаемся к MongoDB
+        if not parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к базе данных'})
+        
+        # Получаем статистику по блогерам с последними датами постов
+        pipeline = [
+            {
+                "$match": {
+                    "username": {"$exists": True, "$ne": None},
+                    "timestamp": {"$exists": True, "$ne": "N/A"}
+                }
+            },
+            {
+                "$group": {
+                    "_id": "$username",
+                    "latest_post_date": {"$max": "$timestamp"},
+                    "total_posts": {"$sum": 1}
+                }
+            },
+            {
+                "$sort": {"latest_post_date": -1}
+            }
+        ]
+        
+        bloggers = list(parser.collection.aggregate(pipeline))
+        
+        # Форматируем результат
+        bloggers_list = []
+        for blogger in bloggers:
+            latest_date = blogger.get('latest_post_date', 'N/A')
+            # Извлекаем только дату (YYYY-MM-DD) из ISO строки
+            if latest_date != 'N/A' and 'T' in latest_date:
+                latest_date = latest_date.split('T')[0]
+            
+            bloggers_list.append({
+                'username': blogger['_id'],
+                'latest_post_date': latest_date,
+                'total_posts': blogger.get('total_posts', 0)
+            })
+        
+        return jsonify({
+            'success': True,
+            'bloggers': bloggers_list,
+            'total_bloggers': len(bloggers_list)
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/disk-usage')
+def api_disk_usage():
+    """API для получения информации о дисковом пространстве"""
+    try:
+        import shutil
+        
+        # Получаем информацию о диске для текущей директории (где хранятся изображения)
+        disk_usage = shutil.disk_usage('/')
+        
+        # Вычисляем проценты
+        total_gb = disk_usage.total / (1024 ** 3)
+        used_gb = disk_usage.used / (1024 ** 3)
+        free_gb = disk_usage.free / (1024 ** 3)
+        used_percent = (disk_usage.used / disk_usage.total) * 100
+        free_percent = 100 - used_percent
+        
+        return jsonify({
+            'success': True,
+            'total_gb': round(total_gb, 2),
+            'used_gb': round(used_gb, 2),
+            'free_gb': round(free_gb, 2),
+            'used_percent': round(used_percent, 2),
+            'free_percent': round(free_percent, 2)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Ошибка получения информации о диске: {e}'
+        })
+
+@bp.route('/gallery_<username>.html')
+def serve_gallery(username):
+    """Динамическая галерея изображений для конкретного пользователя из MongoDB"""
+    try:
+        # Создаем экземпляр парсера для доступа к MongoDB
+        parser = InstagramParser(
+            apify_token=os.getenv("APIFY_API_TOKEN"),
+            mongodb_uri=mongodb_uri()
+        )
+
+        # Подключаемся к MongoDB
+        if not parser.connect_mongodb():
+            return f"Ошибка подключения к базе данных для @{username}", 500
+
+        # Получаем изображения для этого пользователя (не скрытые)
+        images = list(parser.collection.find(
+            {
+                "local_filename": {"$exists": True},
+                "username": username,
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True}  # Не показываем дубликаты
+            },
+            {"_id": 1, "local_filename": 1, "username": 1, "likes_count": 1, "comments_count": 1, "caption": 1, "timestamp": 1, ITEMS_FIELD: 1}
+        ).sort("timestamp", -1).limit(200))
+
+        if not images:
+            return f"Галерея для @{username} не найдена (нет изображений в базе)", 404
+
+        # Определяем текущую страницу в зависимости от наличия тегов
+        # Если хотя бы у одного изображения есть теги, показываем как gallery_tagged
+        has_tags = any(img.get(ITEMS_FIELD) for img in images)
+        current_page = 'gallery_tagged' if has_tags else 'gallery'
+
+        # Шаблон работает со структурой properties.* (reader совместимости)
+        images = [with_legacy_objects(img) for img in images]
+
+        return render_template('gallery.html', images=images, current_page=current_page, username=username)
+    except Exception as e:
+        return f"Ошибка при загрузке галереи для @{username}: {e}", 500
+
+@bp.route('/gallery')
+def gallery():
+    """Галерея изображений из базы данных"""
+    try:
+        # Создаем экземпляр парсера для доступа к MongoDB
+        parser = InstagramParser(
+            apify_token=os.getenv("APIFY_API_TOKEN"),
+            mongodb_uri=mongodb_uri()
+        )
+        
+        # Подключаемся к MongoDB
+        if not parser.connect_mongodb():
+            return "Ошибка подключения к базе данных", 500
+        
+        # Получаем изображения из базы данных (только не выбранные для теггирования, не скрытые и без тегов Ximilar)
+        # Загружаем только первый batch (50 изображений), остальные подгрузятся через infinite scroll
+        images = list(parser.collection.find(
+            {
+                "local_filename": {"$exists": True},
+                "selected_for_tagging": {"$ne": True},
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True},  # Не показываем дубликаты
+                ITEMS_FIELD: {"$exists": False}
+            },
+            {"_id": 1, "local_filename": 1, "username": 1, "likes_count": 1, "comments_count": 1, "caption": 1, "selected_for_tagging": 1, "timestamp": 1}
+        ).sort("timestamp", -1).limit(50))
+        
+        return render_template('gallery.html', images=images, current_page='gallery')
+    except Exception as e:
+        return f"Ошибка: {e}", 500
+
+@bp.route('/gallery_to_tag')
+def gallery_to_tag():
+    """Галерея изображений, выбранных для теггирования"""
+    try:
+        # Создаем экземпляр парсера для доступа к MongoDB
+        parser = InstagramParser(
+            apify_token=os.getenv("APIFY_API_TOKEN"),
+            mongodb_uri=mongodb_uri()
+        )
+        
+        # Подключаемся к MongoDB
+        if not parser.connect_mongodb():
+            return "Ошибка подключения к базе данных", 500
+        
+        # Получаем изображения, выбранные для теггирования (только не скрытые и без тегов Ximilar)
+        # Загружаем только первый batch (50 изображений), остальные подгрузятся через infinite scroll
+        images = list(parser.collection.find(
+            {
+                "local_filename": {"$exists": True},
+                "selected_for_tagging": True,
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True},  # Не показываем дубликаты
+                ITEMS_FIELD: {"$exists": False}
+            },
+            {"_id": 1, "local_filename": 1, "username": 1, "likes_count": 1, "comments_count": 1, "caption": 1, "selected_for_tagging": 1, "selected_at": 1, "timestamp": 1}
+        ).sort("timestamp", -1).limit(50))
+        
+        return render_template('gallery.html', images=images, current_page='gallery_to_tag')
+    except Exception as e:
+        return f"Ошибка: {e}", 500
+
+@bp.route('/gallery_tagged')
+def gallery_tagged():
+    """Галерея изображений с тегами Ximilar"""
+    try:
+        # Создаем экземпляр парсера для доступа к MongoDB
+        parser = InstagramParser(
+            apify_token=os.getenv("APIFY_API_TOKEN"),
+            mongodb_uri=mongodb_uri()
+        )
+        
+        # Подключаемся к MongoDB
+        if not parser.connect_mongodb():
+            return "Ошибка подключения к базе данных", 500
+        
+        # Получаем изображения с тегами Ximilar (только не скрытые, приоритет объектно-ориентированной структуре)
+        # Загружаем только первый batch (50 изображений), остальные подгрузятся через infinite scroll
+        images = list(parser.collection.find(
+            {
+                "local_filename": {"$exists": True},
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True},  # Не показываем дубликаты
+                ITEMS_FIELD: {"$exists": True, "$ne": []}
+            },
+            {
+                "_id": 1, "local_filename": 1, "username": 1, "likes_count": 1,
+                "comments_count": 1, "caption": 1, ITEMS_FIELD: 1, "tagged_at": 1, "ximilar_tagged_at": 1,
+                "timestamp": 1
+            }
+        ).sort("timestamp", -1).limit(50))
+        images = [with_legacy_objects(img) for img in images]
+
+        print(f"🖼️  Загружено {len(images)} изображений в галерею (первый batch, остальные подгрузятся через infinite scroll)")
+        
+        return render_template('gallery.html', images=images, current_page='gallery_tagged')
+    except Exception as e:
+        return f"Ошибка: {e}", 500
+
+@bp.route('/gallery_hidden')
+def gallery_hidden():
+    """Галерея скрытых изображений"""
+    try:
+        # Создаем экземпляр парсера для доступа к MongoDB
+        parser = InstagramParser(
+            apify_token=os.getenv("APIFY_API_TOKEN"),
+            mongodb_uri=mongodb_uri()
+        )
+        
+        # Подключаемся к MongoDB
+        if not parser.connect_mongodb():
+            return "Ошибка подключения к базе данных", 500
+        
+        # Получаем скрытые изображения
+        # Загружаем только первый batch (50 изображений), остальные подгрузятся через infinite scroll
+        images = list(parser.collection.find(
+            {
+                "local_filename": {"$exists": True},
+                "hidden": True  # Только скрытые
+            },
+            {
+                "_id": 1, "local_filename": 1, "username": 1, "likes_count": 1,
+                "comments_count": 1, "caption": 1, "timestamp": 1, "hidden_at": 1
+            }
+        ).sort("hidden_at", -1).limit(50))
+
+        print(f"🙈 Загружено {len(images)} скрытых изображений (первый batch)")
+        
+        return render_template('gallery.html', images=images, current_page='gallery_hidden')
+    except Exception as e:
+        return f"Ошибка: {e}", 500
+
+@bp.route('/gallery_no_fashion')
+def gallery_no_fashion():
+    """Галерея изображений, отсеянных пре-скрином (одежды не найдено)"""
+    try:
+        # Создаем экземпляр парсера для доступа к MongoDB
+        parser = InstagramParser(
+            apify_token=os.getenv("APIFY_API_TOKEN"),
+            mongodb_uri=mongodb_uri()
+        )
+
+        # Подключаемся к MongoDB
+        if not parser.connect_mongodb():
+            return "Ошибка подключения к базе данных", 500
+
+        # Отсеянные пре-скрином (не скрытые и не дубликаты); отсюда их можно вернуть в галерею
+        images = list(parser.collection.find(
+            {
+                "local_filename": {"$exists": True},
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True},
+                **NO_FASHION_QUERY
+            },
+            {
+                "_id": 1, "local_filename": 1, "username": 1, "likes_count": 1,
+                "comments_count": 1, "caption": 1, "timestamp": 1, "fashion_score": 1
+            }
+        ).sort("timestamp", -1).limit(50))
+
+        return render_template('gallery.html', images=images, current_page='gallery_no_fashion')
+    except Exception as e:
+        return f"Ошибка: {e}", 500
+
+@bp.route('/all_accounts_gallery.html')
+@bp.route('/all_accounts_gallery_page_<int:page>.html')
+def serve_combined_gallery(page=1):
+    """Обслуживание общей галереи всех аккаунтов"""
+    import os
+    
+    # Определяем имя файла
+    if page == 1:
+        gallery_file = "all_accounts_gallery.html"
+    else:
+        gallery_file = f"all_accounts_gallery_page_{page}.html"
+    
+    if os.path.exists(gallery_file):
+        with open(gallery_file, 'r', encoding='utf-8') as f:
+            return f.read()
+    else:
+        return f"Общая галерея (страница {page}) не найдена", 404
+
+@bp.route('/api/hide-images', methods=['POST'])
+def api_hide_images():
+    """API для скрытия изображений"""
+    try:
+        data = request.get_json()
+        image_ids = data.get('image_ids', [])
+        
+        if not image_ids:
+            return jsonify({'success': False, 'message': 'Список ID изображений пуст'})
+        
+        # Проверяем инициализацию парсера
+        success, message = web_parser.init_parser()
+        if not success:
+            return jsonify({'success': False, 'message': message})
+        
+        # Подключаемся к MongoDB
+        if not web_parser.parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к MongoDB'})
+        
+        # Обновляем статус изображений
+        from bson import ObjectId
+        from datetime import datetime
+        
+        # Преобразуем строковые ID в ObjectId
+        object_ids = []
+        for img_id in image_ids:
+            try:
+                object_ids.append(ObjectId(img_id))
+            except Exception as e:
+                print(f"❌ Ошибка преобразования ID {img_id}: {e}")
+                continue
+        
+        if not object_ids:
+            return jsonify({'success': False, 'message': 'Некорректные ID изображений'})
+        
+        # Обновляем документы в MongoDB - помечаем как скрытые
+        query = {"_id": {"$in": object_ids}}
+        tags_before = snapshot_tags(web_parser.parser.collection, query)
+        result = web_parser.parser.collection.update_many(
+            query,
+            {
+                "$set": {
+                    "hidden": True,
+                    "hidden_at": datetime.now().isoformat()
+                }
+            }
+        )
+        invalidate_images(web_parser.parser.collection, query, tags_before, 'hide-images')
+        get_precomputer().trigger('hide-images')
+        
+        return jsonify({
+            'success': True,
+            'message': f'Скрыто {result.modified_count} изображений',
+            'hidden_count': result.modified_count
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/unhide-images', methods=['POST'])
+def api_unhide_images():
+    """API для восстановления скрытых изображений"""
+    try:
+        data = request.get_json()
+        image_ids = data.get('image_ids', [])
+        
+        if not image_ids:
+            return jsonify({'success': False, 'message': 'Список ID изображений пуст'})
+        
+        # Проверяем инициализацию парсера
+        success, message = web_parser.init_parser()
+        if not success:
+            return jsonify({'success': False, 'message': message})
+        
+        # Подключаемся к MongoDB
+        if not web_parser.parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к MongoDB'})
+        
+        # Обновляем статус изображений
+        from bson import ObjectId
+        
+        # Преобразуем строковые ID в ObjectId
+        object_ids = []
+        for img_id in image_ids:
+            try:
+                object_ids.append(ObjectId(img_id))
+            except Exception as e:
+                print(f"❌ Ошибка преобразования ID {img_id}: {e}")
+                continue
+        
+        if not object_ids:
+            return jsonify({'success': False, 'message': 'Некорректные ID изображений'})
+        
+        # Обновляем документы в MongoDB - убираем флаг скрытия
+        query = {"_id": {"$in": object_ids}}
+        tags_before = snapshot_tags(web_parser.parser.collection, query)
+        result = web_parser.parser.collection.update_many(
+            query,
+            {
+                "$set": {
+                    "hidden": False
+                },
+                "$unset": {
+                    "hidden_at": ""
+                }
+            }
+        )
+        invalidate_images(web_parser.parser.collection, query, tags_before, 'unhide-images')
+        get_precomputer().trigger('unhide-images')
+        
+        return jsonify({
+            'success': True,
+            'message': f'Восстановлено {result.modified_count} изображений',
+            'unhidden_count': result.modified_count
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/filter-options', methods=['GET'])
+def api_filter_options():
+    """API для получения доступных опций фильтрации"""
+    try:
+        # Получаем параметр use_confidence (по умолчанию True)
+        use_confidence = request.args.get('use_confidence', 'true').lower() == 'true'
+        # Получаем порог confidence из параметров (по умолчанию 60)
+        confidence_threshold = float(request.args.get('confidence_threshold', 60)) / 100.0
+
+        # Проверяем инициализацию парсера
+        success, message = web_parser.init_parser()
+        if not success:
+            return jsonify({'success': False, 'message': message})
+
+        # Подключаемся к MongoDB
+        if not web_parser.parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к MongoDB'})
+        
+        # Потоково читаем все изображения с тегами Ximilar (исключаем скрытые)
+        # Нужны confidence и все атрибуты, поэтому объекты целиком (slim=False)
+        images = stream_images(
+            web_parser.parser.collection,
+            {
+                "local_filename": {"$exists": True},
+                "hidden": {"$ne": True},
+                ITEMS_FIELD: {"$exists": True, "$ne": []}
+            },
+            slim=False
+        )
+        
+        # Собираем уникальные значения для иерархических фильтров с подсчетом (по одному разу на изображение)
+        # Используем ту же логику дедупликации, что и в шаблоне
+        hierarchical_filters = {}
+        
+        # Структура: {category: {subcategory: {colors: {}, materials: {}, styles: {}}}}
+        
+        total_images = 0
+        processed_images = 0
+        for image in images:
+            total_images += 1
+            objects = read_objects(image)
+            if objects:
+                processed_images += 1
+                # Дедупликация объектов по их основному названию (ТОЛЬКО ПЕРВЫЙ вариант Subcategory[0])
+                # Это важно: если у нас Subcategory = ["long strap bags", "baguette bags"],
+                # берем только "long strap bags" (первый, с наибольшей уверенностью)
+                unique_objects_by_name = {}
+
+                for obj in objects:
+                    # Получаем основное название объекта (ТОЛЬКО ПЕРВЫЙ вариант!)
+                    obj_name = ''
+                    if obj.get('properties'):
+                        if obj['properties'].get('other_attributes'):
+                            if obj['properties']['other_attributes'].get('Subcategory'):
+                                # Берем ТОЛЬКО первый элемент (с наибольшей confidence)
+                                obj_name = obj['properties']['other_attributes']['Subcategory'][0]['name']
+                            elif obj['properties']['other_attributes'].get('Category'):
+                                obj_name = obj['properties']['other_attributes']['Category'][0]['name']
+
+                    # Если объект с таким названием уже есть, пропускаем
+                    if obj_name and obj_name in unique_objects_by_name:
+                        continue
+
+                    # Сохраняем первый объект с этим названием
+                    if obj_name:
+                        unique_objects_by_name[obj_name] = obj
+
+                # Теперь добавляем атрибуты каждого уникального объекта
+                for obj in unique_objects_by_name.values():
+                    category = obj.get('top_category', 'Other')
+
+                    # Получаем подкатегорию этого объекта (ТОЛЬКО ПЕРВЫЙ вариант)
+                    original_subcategory = ''
+                    subcategory_prob = 1.0  # По умолчанию максимальный confidence
+
+                    if obj.get('properties'):
+                        if obj['properties'].get('other_attributes'):
+                            if obj['properties']['other_attributes'].get('Subcategory'):
+                                subcategory_data = obj['properties']['other_attributes']['Subcategory'][0]
+                                original_subcategory = subcategory_data['name']
+                                subcategory_prob = subcategory_data.get('confidence', 1.0)
+                            elif obj['properties']['other_attributes'].get('Category'):
+                                category_data = obj['properties']['other_attributes']['Category'][0]
+                                original_subcategory = category_data['name']
+                                subcategory_prob = category_data.get('confidence', 1.0)
+
+                    if not original_subcategory:
+                        continue
+
+                    # Проверяем confidence подкатегории/категории если включен фильтр
+                    if use_confidence and subcategory_prob <= confidence_threshold:
+                        continue
+
+                    # Нормализуем название подкатегории (уровень 2)
+                    normalized_subcategory = obj.get('normalized_subcategory') or normalize_subcategory_name(original_subcategory, category)
+
+                    # Инициализируем структуру для категории
+                    if category not in hierarchical_filters:
+                        hierarchical_filters[category] = {}
+
+                    # Проверяем, нужен ли третий уровень вложенности
+                    needs_third_level = (normalized_subcategory.lower() != original_subcategory.lower())
+
+                    if needs_third_level:
+                        # Создаем 3 уровня
+                        if normalized_subcategory not in hierarchical_filters[category]:
+                            hierarchical_filters[category][normalized_subcategory] = {
+                                'subsubcategories': {}
+                            }
+
+                        if original_subcategory not in hierarchical_filters[category][normalized_subcategory]['subsubcategories']:
+                            hierarchical_filters[category][normalized_subcategory]['subsubcategories'][original_subcategory] = {
+                                'colors': {},
+                                'materials': {},
+                                'styles': {}
+                            }
+
+                        subsubcat = hierarchical_filters[category][normalized_subcategory]['subsubcategories'][original_subcategory]
+                    else:
+                        # Создаем только 2 уровня
+                        if original_subcategory not in hierarchical_filters[category]:
+                            hierarchical_filters[category][original_subcategory] = {
+                                'colors': {},
+                                'materials': {},
+                                'styles': {}
+                            }
+
+                        subsubcat = hierarchical_filters[category][original_subcategory]
+
+                    # Цвета
+                    if obj.get('properties', {}).get('visual_attributes', {}).get('Color'):
+                        for color in obj['properties']['visual_attributes']['Color']:
+                            # Проверяем confidence если включен фильтр
+                            if use_confidence and color.get('confidence', 0) <= confidence_threshold:
+                                continue
+                            color_name = color['name']
+                            if color_name not in subsubcat['colors']:
+                                subsubcat['colors'][color_name] = set()
+                            subsubcat['colors'][color_name].add(image['_id'])
+
+                    # Материалы
+                    if obj.get('properties', {}).get('material_attributes', {}).get('Material'):
+                        for material in obj['properties']['material_attributes']['Material']:
+                            # Проверяем confidence если включен фильтр
+                            if use_confidence and material.get('confidence', 0) <= confidence_threshold:
+                                continue
+                            material_name = material['name']
+                            if material_name not in subsubcat['materials']:
+                                subsubcat['materials'][material_name] = set()
+                            subsubcat['materials'][material_name].add(image['_id'])
+
+                    # Стили
+                    if obj.get('properties', {}).get('style_attributes', {}).get('Style'):
+                        for style in obj['properties']['style_attributes']['Style']:
+                            # Проверяем confidence если включен фильтр
+                            if use_confidence and style.get('confidence', 0) <= confidence_threshold:
+                                continue
+                            style_name = style['name']
+                            if style_name not in subsubcat['styles']:
+                                subsubcat['styles'][style_name] = set()
+                            subsubcat['styles'][style_name].add(image['_id'])
+                
+                # Подсчет уже происходит в иерархической структуре выше
+        
+        # Конвертируем sets в counts для каждой категории фильтра
+        # Также добавляем общие счётчики для категорий, подкатегорий и подподкатегорий
+        hierarchical_filters_with_counts = {}
+        for category, subcategories in hierarchical_filters.items():
+            hierarchical_filters_with_counts[category] = {
+                '_meta': {'image_count': 0, 'subcategories': {}}
+            }
+
+            # Собираем уникальные image_ids для всей категории
+            category_image_ids = set()
+
+            for subcategory, subcat_data in subcategories.items():
+                # Собираем уникальные image_ids для подкатегории
+                subcategory_image_ids = set()
+
+                # Проверяем, есть ли третий уровень (subsubcategories) или это двухуровневая структура
+                if 'subsubcategories' in subcat_data and subcat_data['subsubcategories']:
+                    # Трехуровневая структура: category -> subcategory -> subsubcategory -> colors/materials/styles
+
+                    # Инициализируем структуру для подкатегории
+                    hierarchical_filters_with_counts[category][subcategory] = {
+                        'subsubcategories': {},
+                        '_meta': {'subsubcategories': {}}
+                    }
+
+                    # Обрабатываем подподкатегории (уровень 3)
+                    for subsubcat_name, subsubcat_filters in subcat_data['subsubcategories'].items():
+                        # Собираем уникальные image_ids для подподкатегории
+                        subsubcat_image_ids = set()
+                        for image_ids_set in subsubcat_filters['colors'].values():
+                            subsubcat_image_ids.update(image_ids_set)
+                        for image_ids_set in subsubcat_filters['materials'].values():
+                            subsubcat_image_ids.update(image_ids_set)
+                        for image_ids_set in subsubcat_filters['styles'].values():
+                            subsubcat_image_ids.update(image_ids_set)
+
+                        subcategory_image_ids.update(subsubcat_image_ids)
+
+                        # Конвертируем sets в counts для подподкатегории
+                        hierarchical_filters_with_counts[category][subcategory]['subsubcategories'][subsubcat_name] = {
+                            'colors': {color: len(image_ids) for color, image_ids in subsubcat_filters['colors'].items()},
+                            'materials': {material: len(image_ids) for material, image_ids in subsubcat_filters['materials'].items()},
+                            'styles': {style: len(image_ids) for style, image_ids in subsubcat_filters['styles'].items()},
+                            '_image_count': len(subsubcat_image_ids)
+                        }
+
+                        # Сохраняем count для подподкатегории в мета-данные
+                        hierarchical_filters_with_counts[category][subcategory]['_meta']['subsubcategories'][subsubcat_name] = len(subsubcat_image_ids)
+                else:
+                    # Двухуровневая структура: category -> subcategory -> colors/materials/styles
+
+                    # Собираем уникальные image_ids для подкатегории напрямую
+                    for image_ids_set in subcat_data['colors'].values():
+                        subcategory_image_ids.update(image_ids_set)
+                    for image_ids_set in subcat_data['materials'].values():
+                        subcategory_image_ids.update(image_ids_set)
+                    for image_ids_set in subcat_data['styles'].values():
+                        subcategory_image_ids.update(image_ids_set)
+
+                    # Конвертируем sets в counts напрямую на уровне подкатегории
+                    hierarchical_filters_with_counts[category][subcategory] = {
+                        'colors': {color: len(image_ids) for color, image_ids in subcat_data['colors'].items()},
+                        'materials': {material: len(image_ids) for material, image_ids in subcat_data['materials'].items()},
+                        'styles': {style: len(image_ids) for style, image_ids in subcat_data['styles'].items()},
+                        '_image_count': len(subcategory_image_ids)
+                    }
+
+                category_image_ids.update(subcategory_image_ids)
+
+                # Добавляем общий счетчик для подкатегории
+                hierarchical_filters_with_counts[category][subcategory]['_image_count'] = len(subcategory_image_ids)
+                hierarchical_filters_with_counts[category]['_meta']['subcategories'][subcategory] = len(subcategory_image_ids)
+
+            hierarchical_filters_with_counts[category]['_meta']['image_count'] = len(category_image_ids)
+        
+        # Отладочная информация
+        print(f"🔍 DEBUG: Найдено {total_images} изображений с тегами (ВСЕ в базе)")
+        print(f"🔍 DEBUG: Обработано {processed_images} изображений с {ITEMS_FIELD}")
+        print(f"📊 Иерархические фильтры: {len(hierarchical_filters)} категорий")
+        
+        # Показываем статистику по категориям
+        for category, subcategories in hierarchical_filters_with_counts.items():
+            # Исключаем _meta из подсчёта
+            real_subcategories = {k: v for k, v in subcategories.items() if k != '_meta'}
+            total_subcategories = len(real_subcategories)
+
+            # Теперь нужно подсчитывать через 3 уровня: category -> subcategory -> subsubcategory -> colors/materials/styles
+            total_colors = 0
+            total_materials = 0
+            total_styles = 0
+            total_subsubcategories = 0
+
+            for subcat_name, subcat_data in real_subcategories.items():
+                if 'subsubcategories' in subcat_data:
+                    for subsubcat_name, subsubcat_filters in subcat_data['subsubcategories'].items():
+                        total_subsubcategories += 1
+                        total_colors += len(subsubcat_filters.get('colors', {}))
+                        total_materials += len(subsubcat_filters.get('materials', {}))
+                        total_styles += len(subsubcat_filters.get('styles', {}))
+
+            image_count = subcategories.get('_meta', {}).get('image_count', 0)
+            print(f"  📂 {category}: {image_count} изображений, {total_subcategories} подкатегорий, {total_subsubcategories} подподкатегорий, {total_colors} цветов, {total_materials} материалов, {total_styles} стилей")
+        
+        return jsonify({
+            'success': True,
+            'hierarchical_filters': hierarchical_filters_with_counts
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/debug-filter/<tag_name>')
+def api_debug_filter(tag_name):
+    """API для отладки конкретного тега"""
+    try:
+        # Проверяем инициализацию парсера
+        success, message = web_parser.init_parser()
+        if not success:
+            return jsonify({'success': False, 'message': message})
+        
+        # Подключаемся к MongoDB
+        if not web_parser.parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к MongoDB'})
+        
+        # Потоково читаем все изображения с тегами Ximilar (исключаем скрытые)
+        images = stream_images(
+            web_parser.parser.collection,
+            {
+                "local_filename": {"$exists": True},
+                "hidden": {"$ne": True},
+                ITEMS_FIELD: {"$exists": True, "$ne": []}
+            },
+            fields=("local_filename",),
+            slim=False
+        )
+        
+        # Применяем ту же логику дедупликации, что и в API
+        total_images = 0
+        matching_images = []
+        for image in images:
+            total_images += 1
+            objects = read_objects(image)
+            if objects:
+                # Дедуплицируем объекты по их основному названию
+                unique_objects_by_name = {}
+                for obj in objects:
+                    obj_name = ''
+                    if obj.get('properties'):
+                        if obj['properties'].get('other_attributes'):
+                            if obj['properties']['other_attributes'].get('Subcategory'):
+                                obj_name = obj['properties']['other_attributes']['Subcategory'][0]['name']
+                            elif obj['properties']['other_attributes'].get('Category'):
+                                obj_name = obj['properties']['other_attributes']['Category'][0]['name']
+                    
+                    if obj_name and obj_name not in unique_objects_by_name:
+                        unique_objects_by_name[obj_name] = obj
+                
+                # Проверяем, есть ли искомый тег среди уникальных объектов
+                for obj in unique_objects_by_name.values():
+                    if obj.get('properties'):
+                        if obj['properties'].get('other_attributes'):
+                            if obj['properties']['other_attributes'].get('Subcategory'):
+                                sub_name = obj['properties']['other_attributes']['Subcategory'][0]['name']
+                                if sub_name == tag_name:
+                                    matching_images.append({
+                                        'id': str(image['_id']),
+                                        'filename': image['local_filename']
+                                    })
+                                    break
+                            elif obj['properties']['other_attributes'].get('Category'):
+                                cat_name = obj['properties']['other_attributes']['Category'][0]['name']
+                                if cat_name == tag_name:
+                                    matching_images.append({
+                                        'id': str(image['_id']),
+                                        'filename': image['local_filename']
+                                    })
+                                    break
+        
+        return jsonify({
+            'success': True,
+            'tag_name': tag_name,
+            'total_images': total_images,
+            'matching_images_count': len(matching_images),
+            'matching_images': matching_images[:10]  # Показываем первые 10
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/get-bloggers', methods=['GET'])
+def api_get_bloggers():
+    """API для получения списка всех блогеров из базы данных"""
+    try:
+        gallery_type = request.args.get('gallery_type', 'gallery')
+        
+        # Определяем базовый запрос в зависимости от типа галереи
+        if gallery_type == 'gallery':
+            base_query = {
+                "local_filename": {"$exists": True},
+                "selected_for_tagging": {"$ne": True},
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True},  # Не показываем дубликаты
+                ITEMS_FIELD: {"$exists": False}
+            }
+        elif gallery_type == 'gallery_to_tag':
+            base_query = {
+                "local_filename": {"$exists": True},
+                "selected_for_tagging": True,
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True},  # Не показываем дубликаты
+                ITEMS_FIELD: {"$exists": False}
+            }
+        elif gallery_type == 'gallery_tagged':
+            base_query = {
+                "local_filename": {"$exists": True},
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True},  # Не показываем дубликаты
+                ITEMS_FIELD: {"$exists": True, "$ne": []}
+            }
+        elif gallery_type == 'gallery_no_fashion':
+            base_query = {
+                "local_filename": {"$exists": True},
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True},
+                **NO_FASHION_QUERY
+            }
+        elif gallery_type == 'gallery_hidden':
+            base_query = {
+                "local_filename": {"$exists": True},
+                "hidden": True  # Только скрытые
+            }
+        else:
+            return jsonify({'success': False, 'message': 'Неверный тип галереи'})
+        
+        # Получаем список блогеров с количеством изображений (кеш по вкладке галереи)
+        bloggers_list = get_analytics().get_bloggers(gallery_type, base_query)
+        
+        return jsonify({
+            'success': True,
+            'bloggers': bloggers_list,
+            'total_bloggers': len(bloggers_list)
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/load-more-images', methods=['GET'])
+def api_load_more_images():
+    """API для загрузки дополнительных изображений (infinite scroll)"""
+    try:
+        gallery_type = request.args.get('gallery_type', 'gallery')
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', 50))
+        sort_order = request.args.get('sort_order', 'desc')  # 'desc' или 'asc'
+        usernames = request.args.get('usernames', '')  # Фильтр по блогерам (через запятую)
+        date_from = request.args.get('date_from', '')  # Фильтр по дате от (YYYY-MM-DD)
+        date_to = request.args.get('date_to', '')  # Фильтр по дате до (YYYY-MM-DD)
+
+        # Преобразуем sort_order в направление MongoDB (-1 для desc, 1 для asc)
+        sort_direction = -1 if sort_order == 'desc' else 1
+
+        # Создаем экземпляр парсера для доступа к MongoDB
+        parser = InstagramParser(
+            apify_token=os.getenv("APIFY_API_TOKEN"),
+            mongodb_uri=mongodb_uri()
+        )
+
+        # Подключаемся к MongoDB
+        if not parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к базе данных'})
+
+        # Используем timestamp для сортировки во всех галереях
+        sort_field = "timestamp"
+
+        # Парсим список блогеров из параметра usernames
+        usernames_list = []
+        if usernames:
+            usernames_list = [u.strip() for u in usernames.split(',') if u.strip()]
+
+        # Определяем запрос в зависимости от типа галереи
+        if gallery_type == 'gallery':
+            # Обычная галерея (не выбранные для теггирования, не скрытые, без тегов Ximilar)
+            query = {
+                "local_filename": {"$exists": True},
+                "selected_for_tagging": {"$ne": True},
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True},  # Не показываем дубликаты
+                ITEMS_FIELD: {"$exists": False}
+            }
+            projection = {"_id": 1, "local_filename": 1, "username": 1, "likes_count": 1, "comments_count": 1, "caption": 1, "selected_for_tagging": 1, "timestamp": 1}
+
+        elif gallery_type == 'gallery_to_tag':
+            # Галерея изображений, выбранных для теггирования
+            query = {
+                "local_filename": {"$exists": True},
+                "selected_for_tagging": True,
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True},  # Не показываем дубликаты
+                ITEMS_FIELD: {"$exists": False}
+            }
+            projection = {"_id": 1, "local_filename": 1, "username": 1, "likes_count": 1, "comments_count": 1, "caption": 1, "selected_for_tagging": 1, "selected_at": 1, "timestamp": 1}
+
+        elif gallery_type == 'gallery_tagged':
+            # Галерея оттегированных изображений
+            query = {
+                "local_filename": {"$exists": True},
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True},  # Не показываем дубликаты
+                ITEMS_FIELD: {"$exists": True, "$ne": []}
+            }
+            projection = {
+                "_id": 1, "local_filename": 1, "username": 1, "likes_count": 1,
+                "comments_count": 1, "caption": 1, ITEMS_FIELD: 1, "tagged_at": 1, "ximilar_tagged_at": 1,
+                "timestamp": 1
+            }
+        elif gallery_type == 'gallery_no_fashion':
+            # Отсеянные пре-скрином
+            query = {
+                "local_filename": {"$exists": True},
+                "hidden": {"$ne": True},
+                "is_duplicate": {"$ne": True},
+                **NO_FASHION_QUERY
+            }
+            projection = {
+                "_id": 1, "local_filename": 1, "username": 1, "likes_count": 1,
+                "comments_count": 1, "caption": 1, "timestamp": 1, "fashion_score": 1
+            }
+        elif gallery_type == 'gallery_hidden':
+            # Галерея скрытых изображений
+            query = {
+                "local_filename": {"$exists": True},
+                "hidden": True  # Только скрытые
+            }
+            projection = {
+                "_id": 1, "local_filename": 1, "username": 1, "likes_count": 1,
+                "comments_count": 1, "caption": 1, "timestamp": 1, "hidden_at": 1
+            }
+        else:
+            return jsonify({'success': False, 'message': 'Неверный тип галереи'})
+
+        # Добавляем фильтр по username, если указаны блогеры
+        if usernames_list:
+            query["username"] = {"$in": usernames_list}
+
+        # Добавляем фильтр по датам, если указаны (проверяем на непустые строки)
+        if date_from and date_from.strip():
+            if "timestamp" not in query:
+                query["timestamp"] = {}
+            # Начало дня date_from
+            query["timestamp"]["$gte"] = f"{date_from}T00:00:00"
+        
+        if date_to and date_to.strip():
+            if "timestamp" not in query:
+                query["timestamp"] = {}
+            # Конец дня date_to
+            query["timestamp"]["$lte"] = f"{date_to}T23:59:59"
+
+        # Получаем изображения с пагинацией и сортировкой
+        images = list(parser.collection.find(query, projection).sort(sort_field, sort_direction).skip(offset).limit(limit))
+
+        # Конвертируем ObjectId в строки для JSON
+        for image in images:
+            image['_id'] = str(image['_id'])
+            with_legacy_objects(image)
+
+        # Получаем общее количество изображений
+        total_count = parser.collection.count_documents(query)
+
+        return jsonify({
+            'success': True,
+            'images': images,
+            'offset': offset,
+            'limit': limit,
+            'total_count': total_count,
+            'has_more': (offset + limit) < total_count
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/filtered-images', methods=['GET'])
+def api_filtered_images():
+    """API для серверной фильтрации изображений по иерархическим фильтрам"""
+    try:
+        # Получаем параметры фильтрации
+        category = request.args.get('category', '')
+        subcategory = request.args.get('subcategory', '')
+        subsubcategory = request.args.get('subsubcategory', '')
+        colors = request.args.getlist('colors[]')  # Массив цветов
+        materials = request.args.getlist('materials[]')  # Массив материалов
+        styles = request.args.getlist('styles[]')  # Массив стилей
+
+        # Параметр confidence фильтра (по умолчанию True)
+        use_confidence = request.args.get('use_confidence', 'true').lower() == 'true'
+        # В ximilar_items confidence хранится в целых процентах
+        confidence_threshold = int(float(request.args.get('confidence_threshold', 60)))
+
+        # Параметры пагинации
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', 50))
+
+        # Создаем экземпляр парсера для доступа к MongoDB
+        parser = InstagramParser(
+            apify_token=os.getenv("APIFY_API_TOKEN"),
+            mongodb_uri=mongodb_uri()
+        )
+
+        # Подключаемся к MongoDB
+        if not parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к базе данных'})
+
+        # Базовый запрос - только оттегированные, не скрытые изображения
+        query = {
+            "local_filename": {"$exists": True},
+            "hidden": {"$ne": True},
+            "is_duplicate": {"$ne": True},
+            ITEMS_FIELD: {"$exists": True, "$ne": []}
+        }
+
+        # Строим условия фильтрации
+        # Важно: category может быть либо top_category (Accessories), либо normalized_subcategory (Bags)
+        # subsubcategory - это всегда оригинальное имя из MongoDB (baguette bags)
+
+        # КРИТИЧЕСКИ ВАЖНО: Все условия должны применяться к ОДНОМУ объекту в массиве!
+        # Создаем ОДИН $elemMatch с условием $and внутри, чтобы subsubcategory и атрибуты
+        # проверялись в ОДНОМ И ТОМ ЖЕ объекте ximilar_items
+        # Ключи компактной схемы: c - top_category, s - Subcategory, k - Category,
+        # col/mat/sty - Color/Material/Style, n - имя, p - confidence в процентах
+
+        if subsubcategory:
+            # Собираем все условия, которые должны выполняться в ОДНОМ объекте
+            elemMatch_conditions = []
+
+            # 1. Условие по subsubcategory (обязательное)
+            if use_confidence:
+                # Если включен confidence фильтр, проверяем и имя, и confidence
+                elemMatch_conditions.append({
+                    "$or": [
+                        {
+                            "s": {
+                                "$elemMatch": {
+                                    "n": subsubcategory,
+                                    "p": {"$gt": confidence_threshold}
+                                }
+                            }
+                        },
+                        {
+                            "k": {
+                                "$elemMatch": {
+                                    "n": subsubcategory,
+                                    "p": {"$gt": confidence_threshold}
+                                }
+                            }
+                        }
+                    ]
+                })
+            else:
+                # Если confidence фильтр выключен, проверяем только имя
+                elemMatch_conditions.append({
+                    "$or": [
+                        {"s.0.n": subsubcategory},
+                        {"k.0.n": subsubcategory}
+                    ]
+                })
+
+            # 2. Условия по атрибутам (если указаны) - добавляем в тот же $elemMatch
+            if colors:
+                color_condition = {"n": {"$in": colors}}
+                if use_confidence:
+                    color_condition["p"] = {"$gt": confidence_threshold}
+                elemMatch_conditions.append({
+                    "col": {"$elemMatch": color_condition}
+                })
+
+            if materials:
+                material_condition = {"n": {"$in": materials}}
+                if use_confidence:
+                    material_condition["p"] = {"$gt": confidence_threshold}
+                elemMatch_conditions.append({
+                    "mat": {"$elemMatch": material_condition}
+                })
+
+            if styles:
+                style_condition = {"n": {"$in": styles}}
+                if use_confidence:
+                    style_condition["p"] = {"$gt": confidence_threshold}
+                elemMatch_conditions.append({
+                    "sty": {"$elemMatch": style_condition}
+                })
+
+            # Создаем ОДИН $elemMatch со всеми условиями через $and
+            query[ITEMS_FIELD] = {
+                "$elemMatch": {
+                    "$and": elemMatch_conditions
+                }
+            }
+
+        elif category:
+            # Если указана только категория (без subsubcategory)
+            elemMatch_conditions = []
+
+            # 1. Условие по категории
+            if use_confidence:
+                # Если включен confidence фильтр, проверяем и имя, и confidence
+                elemMatch_conditions.append({
+                    "$or": [
+                        {"c": category},  # top_category не имеет confidence
+                        {
+                            "k": {
+                                "$elemMatch": {
+                                    "n": category,
+                                    "p": {"$gt": confidence_threshold}
+                                }
+                            }
+                        }
+                    ]
+                })
+            else:
+                # Если confidence фильтр выключен, проверяем только имя
+                elemMatch_conditions.append({
+                    "$or": [
+                        {"c": category},
+                        {"k": {"$elemMatch": {"n": category}}}
+                    ]
+                })
+
+            # 2. Условия по атрибутам
+            if colors:
+                color_condition = {"n": {"$in": colors}}
+                if use_confidence:
+                    color_condition["p"] = {"$gt": confidence_threshold}
+                elemMatch_conditions.append({
+                    "col": {"$elemMatch": color_condition}
+                })
+
+            if materials:
+                material_condition = {"n": {"$in": materials}}
+                if use_confidence:
+                    material_condition["p"] = {"$gt": confidence_threshold}
+                elemMatch_conditions.append({
+                    "mat": {"$elemMatch": material_condition}
+                })
+
+            if styles:
+                style_condition = {"n": {"$in": styles}}
+                if use_confidence:
+                    style_condition["p"] = {"$gt": confidence_threshold}
+                elemMatch_conditions.append({
+                    "sty": {"$elemMatch": style_condition}
+                })
+
+            # Создаем ОДИН $elemMatch
+            query[ITEMS_FIELD] = {
+                "$elemMatch": {
+                    "$and": elemMatch_conditions
+                }
+            }
+
+        # Отладочный вывод финального запроса
+        import json
+        print("=" * 70)
+        print("🔍 DEBUG: Финальный MongoDB запрос:")
+        print(json.dumps(query, indent=2, default=str, ensure_ascii=False))
+        print("=" * 70)
+
+        # Проекция полей
+        projection = {
+            "_id": 1, "local_filename": 1, "username": 1, "likes_count": 1,
+            "comments_count": 1, "caption": 1, ITEMS_FIELD: 1, "tagged_at": 1, "ximilar_tagged_at": 1,
+            "timestamp": 1
+        }
+
+        # Получаем изображения с пагинацией и сортировкой
+        images = list(parser.collection.find(query, projection).sort("timestamp", -1).skip(offset).limit(limit))
+
+        # Конвертируем ObjectId в строки для JSON
+        for image in images:
+            image['_id'] = str(image['_id'])
+            with_legacy_objects(image)
+
+        # Получаем общее количество изображений
+        total_count = parser.collection.count_documents(query)
+
+        print(f"🔍 Фильтр: category={category}, subsubcategory={subsubcategory}, colors={colors}, materials={materials}, styles={styles}")
+        print(f"📊 Найдено: {total_count} изображений (загружено {len(images)} с offset={offset})")
+
+        return jsonify({
+            'success': True,
+            'images': images,
+            'offset': offset,
+            'limit': limit,
+            'total_count': total_count,
+            'has_more': (offset + limit) < total_count,
+            'filters': {
+                'category': category,
+                'subcategory': subcategory,
+                'subsubcategory': subsubcategory,
+                'colors': colors,
+                'materials': materials,
+                'styles': styles
+            }
+        })
+
+    except Exception as e:
+        import traceback
+        print(f"❌ Ошибка фильтрации: {e}")
+        print(traceback.format_exc())
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+# Поля карточки изображения в ответах поиска по эмбеддингам (как в /api/filtered-images)
+SEARCH_PROJECTION = {
+    "_id": 1, "local_filename": 1, "username": 1, "likes_count": 1,
+    "comments_count": 1, "caption": 1, ITEMS_FIELD: 1, "tagged_at": 1, "ximilar_tagged_at": 1,
+    "timestamp": 1
+}
+
+
+# Состояние видимости для поиска по эмбеддингам
+VISIBILITY_QUERIES = {
+    'visible': {"hidden": {"$ne": True}, "is_duplicate": {"$ne": True}},
+    'hidden': {"hidden": True},
+    'all': {},
+}
+
+
+def images_by_ranked_ids(ranked, extra_query=None):
+    """Документы для [(image_id, score)] в порядке ранжирования, с полем similarity"""
+    from bson import ObjectId
+
+    scores = dict(ranked)
+    query = dict({"_id": {"$in": [ObjectId(image_id) for image_id in scores]}}, **(extra_query or {}))
+    docs = {str(doc['_id']): doc for doc in get_collection().find(query, SEARCH_PROJECTION)}
+
+    images = []
+    for image_id, score in ranked:
+        image = docs.get(image_id)
+        if image is None:
+            continue
+        image['_id'] = image_id
+        image['similarity'] = score
+        images.append(with_legacy_objects(image))
+    return images
+
+
+@bp.route('/api/similar-images/<image_id>', methods=['GET'])
+def api_similar_images(image_id):
+    """API "похожие изображения" по CLIP-эмбеддингам (карточки галереи и галерея вещи)"""
+    try:
+        limit = min(int(request.args.get('limit', 24)), 200)
+        store = get_embedding_store()
+
+        started = time.perf_counter()
+        # С запасом: часть найденных может оказаться скрытой или дубликатом
+        ranked = store.similar(image_id, k=limit * 2)
+        if ranked is None:
+            return jsonify({
+                'success': False,
+                'message': 'Для изображения ещё нет эмбеддинга (python embedding_store.py --backfill)'
+            })
+        search_ms = (time.perf_counter() - started) * 1000
+
+        images = images_by_ranked_ids(ranked, VISIBILITY_QUERIES['visible'])[:limit]
+
+        return jsonify({
+            'success': True,
+            'image_id': image_id,
+            'images': images,
+            'offset': 0,
+            'limit': limit,
+            'total_count': len(images),
+            'has_more': False,
+            'search_ms': round(search_ms, 2),
+            'store_size': len(store)
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+
+@bp.route('/api/text-search', methods=['GET'])
+def api_text_search():
+    """API поиска по свободному тексту ("red leather mini skirt") по CLIP-эмбеддингам"""
+    try:
+        import clip_encoder
+
+        text = request.args.get('q', '').strip()
+        usernames = request.args.get('usernames', '')  # Фильтр по блогерам (через запятую)
+        date_from = request.args.get('date_from', '')  # YYYY-MM-DD
+        date_to = request.args.get('date_to', '')  # YYYY-MM-DD
+        state = request.args.get('state', 'visible')  # visible / hidden / all
+        offset = int(request.args.get('offset', 0))
+        limit = min(int(request.args.get('limit', 50)), 200)
+
+        if not text:
+            return jsonify({'success': False, 'message': 'Требуется параметр q'})
+        if state not in VISIBILITY_QUERIES:
+            return jsonify({'success': False, 'message': f'Неверное состояние: {state}'})
+        if not clip_encoder.available():
+            return jsonify({'success': False, 'message': 'Поиск недоступен: не установлены torch и open_clip_torch'})
+        if not clip_encoder.ready():
+            # Модель грузится в фоне (warm_up при старте), запрос её не ждёт
+            clip_encoder.warm_up()
+            return jsonify({'success': False, 'message': 'Модель FashionCLIP загружается, повторите запрос через минуту'})
+
+        store = get_embedding_store()
+        collection = get_collection()
+
+        started = time.perf_counter()
+        query_vector = clip_encoder.encode_query(text)
+        encode_ms = (time.perf_counter() - started) * 1000
+
+        # Фильтры MongoDB (те же, что в /api/load-more-images)
+        filter_query = {}
+        usernames_list = [u.strip() for u in usernames.split(',') if u.strip()]
+        if usernames_list:
+            filter_query["username"] = {"$in": usernames_list}
+        if date_from.strip():
+            filter_query.setdefault("timestamp", {})["$gte"] = f"{date_from}T00:00:00"
+        if date_to.strip():
+            filter_query.setdefault("timestamp", {})["$lte"] = f"{date_to}T23:59:59"
+
+        started = time.perf_counter()
+        if filter_query or state == 'hidden':
+            # Узкий набор кандидатов: ищем только среди отфильтрованных строк
+            candidates = collection.find(dict(filter_query, **VISIBILITY_QUERIES[state]), {"_id": 1})
+            rows = store.rows_for(str(doc['_id']) for doc in candidates)
+            total_count = len(rows)
+            ranked = store.search(query_vector, k=offset + limit, rows=rows) if total_count else []
+        else:
+            # Весь корпус, кроме скрытых и дубликатов (их немного - маска из кеша,
+            # сбрасывается при скрытии/восстановлении и разметке дубликатов)
+            excluded = [] if state == 'all' else get_analytics().get_excluded_image_ids()
+            total_count = len(store) - len(store.rows_for(excluded))
+            ranked = store.search(query_vector, k=offset + limit, exclude=excluded)
+        search_ms = (time.perf_counter() - started) * 1000
+
+        images = images_by_ranked_ids(ranked[offset:offset + limit])
+
+        return jsonify({
+            'success': True,
+            'query': text,
+            'images': images,
+            'offset': offset,
+            'limit': limit,
+            'total_count': total_count,
+            'has_more': (offset + limit) < total_count,
+            'filters': {
+                'usernames': usernames_list,
+                'date_from': date_from,
+                'date_to': date_to,
+                'state': state
+            },
+            'encode_ms': round(encode_ms, 2),
+            'search_ms': round(search_ms, 2)
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
@@ -0,0 +1,379 @@
+"""Парсинг Instagram: запуск сессий, статус, Socket.IO и телеметрия загрузки"""
+
+import threading
+import time
+from datetime import datetime
+from flask import Blueprint, request, jsonify
+from cache_dependencies import invalidate_tags, gallery_tag
+from ingestion_telemetry import IngestionTelemetry, recent_runs
+from app_context import socketio, active_parsing_sessions, web_parser, log_print, get_collection
+
+bp = Blueprint('ingestion', __name__)
+
+@bp.route('/api/status')
+def api_status():
+    """API статуса"""
+    success, message = web_parser.init_parser()
+    return jsonify({
+        'success': success,
+        'message': message,
+        'active_sessions': len(active_parsing_sessions)
+    })
+
+@bp.route('/api/parse', methods=['POST'])
+def api_parse():
+    """API для запуска парсинга"""
+    try:
+        log_print("\n" + "="*70)
+        log_print("🔥 [API] ПОЛУЧЕН POST ЗАПРОС НА /api/parse")
+        log_print("="*70)
+        
+        data = request.get_json()
+        log_print(f"📦 [API] Данные запроса: {data}")
+        
+        accounts = data.get('accounts', [])
+        date_from = data.get('date_from')  # Дата начала (YYYY-MM-DD)
+        session_id = data.get('session_id', f"session_{int(time.time())}")
+        
+        log_print(f"📋 [API] Извлечённые параметры:")
+        log_print(f"   accounts: {accounts}")
+        log_print(f"   date_from: {date_from}")
+        log_print(f"   session_id: {session_id}")
+        
+        if not accounts:
+            return jsonify({'success': False, 'message': 'Список аккаунтов пуст'})
+        
+        # Вычисляем разумный лимит на основе периода (если дата указана)
+        if date_from:
+            try:
+                from datetime import datetime as dt
+                date_from_obj = dt.strptime(date_from, '%Y-%m-%d')
+                today = dt.now()
+                days_diff = (today - date_from_obj).days + 1
+                # 10 постов в день (с запасом для активных блогеров)
+                max_posts = min(2000, max(50, days_diff * 10))
+                log_print(f"📊 [API] Период: {days_diff} дней (с {date_from} до сегодня), установлен лимит: {max_posts} постов")
+            except Exception as e:
+                max_posts = 200
+                log_print(f"📊 [API] Ошибка расчёта периода ({e}), установлен лимит: {max_posts} постов")
+        else:
+            # Если дата не указана, парсим все посты (по умолчанию 200)
+            max_posts = 200
+            date_from = None
+            log_print(f"📊 [API] Дата не указана, парсим все посты. Лимит: {max_posts} постов")
+        
+        # Проверяем инициализацию парсера
+        log_print(f"🔍 [API] Проверка инициализации парсера...")
+        success, message = web_parser.init_parser()
+        if not success:
+            log_print(f"❌ [API] Ошибка инициализации: {message}")
+            return jsonify({'success': False, 'message': message})
+        log_print(f"✅ [API] Парсер инициализирован")
+        
+        # Сначала регистрируем сессию
+        log_print(f"🔧 [API] Регистрация сессии {session_id}")
+        active_parsing_sessions[session_id] = {
+            'status': 'starting',
+            'accounts': accounts,
+            'max_posts': max_posts,
+            'date_from': date_from,
+            'started_at': datetime.now().isoformat(),
+            'progress': 0,
+            'current_account': None,
+            'results': []
+        }
+        log_print(f"✅ [API] Сессия зарегистрирована")
+        
+        # Затем запускаем парсинг в отдельном потоке
+        log_print(f"🧵 [API] Создание потока для парсинга...")
+        log_print(f"   Аргументы: session_id={session_id}, accounts={accounts}, max_posts={max_posts}, date_from={date_from}")
+        
+        thread = threading.Thread(
+            target=run_parsing_session,
+            args=(session_id, accounts, max_posts, date_from),
+            name=f"parsing_thread_{session_id}"
+        )
+        thread.daemon = True
+        
+        log_print(f"🚀 [API] Запуск потока...")
+        thread.start()
+        log_print(f"✅ [API] Поток запущен, thread.is_alive() = {thread.is_alive()}")
+        log_print(f"{'='*70}\n")
+        
+        return jsonify({
+            'success': True,
+            'message': 'Парсинг запущен',
+            'session_id': session_id
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/session/<session_id>')
+def api_session_status(session_id):
+    """API статуса сессии"""
+    if session_id in active_parsing_sessions:
+        return jsonify(active_parsing_sessions[session_id])
+    else:
+        return jsonify({'error': 'Сессия не найдена'})
+
+@bp.route('/api/sessions')
+def api_sessions():
+    """API списка активных сессий"""
+    return jsonify({
+        'sessions': list(active_parsing_sessions.keys()),
+        'count': len(active_parsing_sessions)
+    })
+
+def save_parsing_run(telemetry, status, error=None):
+    """Сохранить телеметрию сессии в parsing_runs (ошибка сохранения не роняет сессию)"""
+    try:
+        return telemetry.save(get_collection().database, status, error)
+    except Exception as e:
+        log_print(f"⚠️ [THREAD] Не удалось сохранить телеметрию сессии: {e}")
+        return telemetry.summary(status, error)
+
+def run_parsing_session(session_id, accounts, max_posts, date_from=None):
+    """Запуск парсинга в отдельном потоке"""
+    log_print(f"\n{'='*70}")
+    log_print(f"🚀 [THREAD] НАЧАЛО ПОТОКА ПАРСИНГА")
+    log_print(f"{'='*70}")
+    log_print(f"   session_id: {session_id}")
+    log_print(f"   accounts: {accounts}")
+    log_print(f"   max_posts: {max_posts}")
+    log_print(f"   date_from: {date_from} (до сегодня)")
+    log_print(f"   thread_name: {threading.current_thread().name}")
+    log_print(f"{'='*70}\n")
+    
+    session_data = None
+    telemetry = IngestionTelemetry(session_id, accounts, max_posts, date_from)
+    parser = None
+    try:
+        log_print(f"🚀 [THREAD] Запуск парсинга в потоке для session_id={session_id}")
+        log_print(f"📋 [THREAD] Аккаунты: {accounts}")
+        log_print(f"📅 [THREAD] Дата: с {date_from} до сегодня")
+        log_print(f"📊 [THREAD] max_posts: {max_posts}")
+        
+        # Небольшая задержка для гарантии регистрации сессии
+        time.sleep(0.1)
+        
+        # Проверяем, что сессия существует
+        if session_id not in active_parsing_sessions:
+            log_print(f"⚠️ [THREAD] Сессия {session_id} не найдена в активных сессиях")
+            log_print(f"Доступные сессии: {list(active_parsing_sessions.keys())}")
+            return
+        
+        log_print(f"✅ [THREAD] Сессия найдена")
+        session_data = active_parsing_sessions[session_id]
+        session_data['status'] = 'running'
+        
+        log_print(f"🔗 [THREAD] Подключение к MongoDB...")
+        # Свой парсер на сессию: параллельные сессии не делят телеметрию и детектор дубликатов
+        parser = web_parser.session_parser(telemetry)
+        # Подключаемся к MongoDB
+        if not parser.connect_mongodb():
+            log_print(f"❌ [THREAD] Ошибка подключения к MongoDB")
+            session_data['status'] = 'error'
+            session_data['error'] = 'Ошибка подключения к MongoDB'
+            socketio.emit('parsing_update', session_data, room=session_id)
+            return
+        
+        log_print(f"✅ [THREAD] MongoDB подключена")
+        total_accounts = len(accounts)
+        results = []
+        
+        for i, account in enumerate(accounts):
+            try:
+                log_print(f"🔍 [THREAD] Обработка аккаунта {i+1}/{total_accounts}: @{account}")
+                telemetry.start_account(account)
+                # Обновляем статус
+                session_data['current_account'] = account
+                session_data['progress'] = int((i / total_accounts) * 100)
+                socketio.emit('parsing_update', session_data, room=session_id)
+                
+                # Парсим аккаунт
+                date_info = ""
+                if date_from:
+                    date_info = f" (с {date_from} до сегодня)"
+                
+                log_print(f"📨 [THREAD] Отправка WebSocket сообщения о начале парсинга @{account}")
+                socketio.emit('parsing_log', {
+                    'message': f'🔍 Парсинг аккаунта: @{account}{date_info}',
+                    'timestamp': datetime.now().isoformat()
+                }, room=session_id)
+                
+                log_print(f"🚀 [THREAD] Запуск parse_instagram_account для @{account}")
+                parsed_data = parser.parse_instagram_account(account, max_posts, date_from)
+                log_print(f"✅ [THREAD] parse_instagram_account завершён для @{account}: {parsed_data is not None}")
+                if not parsed_data:
+                    socketio.emit('parsing_log', {
+                        'message': f'❌ Ошибка парсинга @{account}',
+                        'timestamp': datetime.now().isoformat()
+                    }, room=session_id)
+                    continue
+                
+                # Извлекаем URL изображений
+                with telemetry.stage("extract_urls"):
+                    image_data = parser.extract_image_urls(parsed_data["posts"])
+                telemetry.count("images_extracted", len(image_data))
+                if not image_data:
+                    socketio.emit('parsing_log', {
+                        'message': f'❌ Нет изображений в @{account}',
+                        'timestamp': datetime.now().isoformat()
+                    }, room=session_id)
+                    continue
+                
+                # Скачиваем изображения
+                socketio.emit('parsing_log', {
+                    'message': f'⬇️ Скачивание изображений из @{account}...',
+                    'timestamp': datetime.now().isoformat()
+                }, room=session_id)
+                
+                downloaded_data = parser.download_images(image_data, 999999)  # Без ограничений
+                
+                # Сохраняем в MongoDB
+                socketio.emit('parsing_log', {
+                    'message': f'💾 Сохранение в MongoDB...',
+                    'timestamp': datetime.now().isoformat()
+                }, room=session_id)
+                
+                with telemetry.stage("mongo_save"):
+                    saved_count = parser.save_to_mongodb(downloaded_data, account)
+                telemetry.count("images_saved", saved_count or 0)
+                
+                # Создаем HTML галерею
+                socketio.emit('parsing_log', {
+                    'message': f'🌐 Создание HTML галереи...',
+                    'timestamp': datetime.now().isoformat()
+                }, room=session_id)
+                
+                with telemetry.stage("gallery_html"):
+                    parser.create_gallery_html(downloaded_data, account)
+                
+                result = {
+                    'account': account,
+                    'success': True,
+                    'images_downloaded': len(downloaded_data),
+                    'images_saved': saved_count or 0,
+                    'images_skipped': len(downloaded_data) - (saved_count or 0),
+                    'gallery_url': f'/gallery_{account}.html'
+                }
+                
+                socketio.emit('parsing_log', {
+                    'message': f'✅ @{account} завершен: {len(downloaded_data)} изображений, сохранено {saved_count or 0}, пропущено дубликатов {len(downloaded_data) - (saved_count or 0)}',
+                    'timestamp': datetime.now().isoformat()
+                }, room=session_id)
+                
+            except Exception as e:
+                result = {
+                    'account': account,
+                    'success': False,
+                    'error': str(e)
+                }
+                
+                socketio.emit('parsing_log', {
+                    'message': f'❌ Ошибка @{account}: {e}',
+                    'timestamp': datetime.now().isoformat()
+                }, room=session_id)
+            
+            results.append(result)
+            session_data['results'] = results
+        
+        # Создаем общую галерею всех аккаунтов
+        socketio.emit('parsing_log', {
+            'message': f'🌐 Создание общей галереи всех аккаунтов...',
+            'timestamp': datetime.now().isoformat()
+        }, room=session_id)
+        
+        try:
+            with telemetry.stage("combined_gallery_html"):
+                combined_gallery_html = parser.create_combined_gallery_html(page=1, per_page=200)
+            if combined_gallery_html:
+                socketio.emit('parsing_log', {
+                    'message': f'✅ Общая галерея создана: /all_accounts_gallery.html',
+                    'timestamp': datetime.now().isoformat()
+                }, room=session_id)
+            else:
+                socketio.emit('parsing_log', {
+                    'message': f'⚠️ Не удалось создать общую галерею',
+                    'timestamp': datetime.now().isoformat()
+                }, room=session_id)
+        except Exception as e:
+            socketio.emit('parsing_log', {
+                'message': f'❌ Ошибка создания общей галереи: {e}',
+                'timestamp': datetime.now().isoformat()
+            }, room=session_id)
+        
+        # Завершаем сессию
+        session_data['status'] = 'completed'
+        session_data['progress'] = 100
+        session_data['completed_at'] = datetime.now().isoformat()
+        session_data['telemetry'] = save_parsing_run(telemetry, 'completed')
+        socketio.emit('parsing_complete', session_data, room=session_id)
+
+        # Новые изображения не оттегированы - меняется только вкладка "Галерея"
+        invalidate_tags([gallery_tag('gallery')], 'parsing')
+        
+        # Удаляем сессию через 5 минут
+        threading.Timer(300, lambda: active_parsing_sessions.pop(session_id, None)).start()
+        
+    except Exception as e:
+        log_print(f"\n{'='*70}")
+        log_print(f"❌ [THREAD] КРИТИЧЕСКАЯ ОШИБКА В ПОТОКЕ ПАРСИНГА")
+        log_print(f"{'='*70}")
+        log_print(f"   session_id: {session_id}")
+        log_print(f"   Ошибка: {e}")
+        log_print(f"   Тип ошибки: {type(e).__name__}")
+        log_print(f"{'='*70}")
+        
+        import sys
+        import traceback
+        log_print("📋 [THREAD] Полный traceback:")
+        traceback.print_exc(file=sys.stderr)
+        log_print(f"{'='*70}\n")
+        
+        if session_data is not None:
+            session_data['status'] = 'error'
+            session_data['error'] = str(e)
+            session_data['telemetry'] = save_parsing_run(telemetry, 'error', str(e))
+            socketio.emit('parsing_error', session_data, room=session_id)
+        else:
+            # Если сессия не найдена, создаем временную запись об ошибке
+            error_data = {
+                'session_id': session_id,
+                'status': 'error',
+                'error': f'Сессия не найдена: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }
+            socketio.emit('parsing_error', error_data, room=session_id)
+    finally:
+        if parser is not None and parser.client is not None:
+            parser.client.close()
+
+@socketio.on('connect')
+def handle_connect():
+    """Обработка подключения WebSocket"""
+    print(f'Клиент подключен: {request.sid}')
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    """Обработка отключения WebSocket"""
+    print(f'Клиент отключен: {request.sid}')
+
+@socketio.on('join_session')
+def handle_join_session(data):
+    """Присоединение к сессии парсинга"""
+    from flask_socketio import join_room
+    session_id = data.get('session_id')
+    if session_id:
+        join_room(session_id)
+        print(f'Клиент присоединился к сессии: {session_id}')
+
+@bp.route('/api/parsing-runs', methods=['GET'])
+def api_parsing_runs():
+    """API для получения телеметрии последних сессий парсинга (parsing_runs)"""
+    try:
+        limit = min(int(request.args.get('limit', 10)), 100)
+        return jsonify({'success': True, 'runs': recent_runs(get_collection().database, limit)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
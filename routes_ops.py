@@ -0,0 +1,55 @@
+"""Служебные эндпоинты: метрики Prometheus, медленные запросы и профили"""
+
+import os
+import metrics
+import profiling
+from flask import Blueprint, request, jsonify, Response, send_from_directory
+
+bp = Blueprint('ops', __name__)
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Метрики процесса в текстовом формате Prometheus"""
+    if not metrics.authorized(request.headers.get('Authorization'), request.remote_addr, request.headers):
+        return Response('unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@bp.route('/api/metrics/slow-queries', methods=['GET'])
+def api_metrics_slow_queries():
+    """API для получения журнала медленных команд MongoDB с планами explain"""
+    try:
+        if not metrics.authorized(request.headers.get('Authorization'), request.remote_addr, request.headers):
+            return jsonify({'success': False, 'message': 'Нет доступа'}), 401
+        return jsonify({
+            'success': True,
+            'threshold_ms': metrics.SLOW_QUERY_MS,
+            'queries': metrics.slow_queries()
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+def _profile_token():
+    return request.headers.get(profiling.PROFILE_HEADER) or request.args.get(profiling.PROFILE_QUERY_FLAG)
+
+@bp.route('/api/profiles', methods=['GET'])
+def api_profiles():
+    """API для получения списка сохранённых профилей запросов"""
+    try:
+        if not profiling.authorized(_profile_token()):
+            return jsonify({'success': False, 'message': 'Нет доступа'}), 401
+        return jsonify({'success': True, 'profiles': profiling.list_profiles()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/profiles/<profile_id>.<kind>', methods=['GET'])
+def api_profile_download(profile_id, kind):
+    """Скачать артефакт профиля: .prof (pstats), .txt (отчёт) или .json (метаданные)"""
+    if not profiling.authorized(_profile_token()):
+        return jsonify({'success': False, 'message': 'Нет доступа'}), 401
+    path = profiling.artifact_path(profile_id, kind)
+    if path is None:
+        return jsonify({'success': False, 'message': 'Профиль не найден'}), 404
+    return send_from_directory(
+        profiling.PROFILE_DIR, os.path.basename(path),
+        mimetype=profiling.ARTIFACT_KINDS[kind], as_attachment=(kind == 'prof')
+    )
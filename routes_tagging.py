@@ -0,0 +1,326 @@
+"""Теггирование: отметка изображений и запуск Ximilar"""
+
+import os
+import time
+from flask import Blueprint, request, jsonify
+from cache_dependencies import snapshot_tags, invalidate_images
+from ximilar_schema import (
+    DIGEST_FIELD, NO_FASHION_QUERY, PRESCREEN_OVERRIDE_FIELD,
+    build_prescreen_restore_update, build_tag_update, save_raw_response,
+)
+from app_context import web_parser, get_precomputer
+
+bp = Blueprint('tagging', __name__)
+
+@bp.route('/api/mark-for-tagging', methods=['POST'])
+def api_mark_for_tagging():
+    """API для отметки изображений для теггирования"""
+    try:
+        data = request.get_json()
+        image_ids = data.get('image_ids', [])
+        
+        if not image_ids:
+            return jsonify({'success': False, 'message': 'Список ID изображений пуст'})
+        
+        # Проверяем инициализацию парсера
+        success, message = web_parser.init_parser()
+        if not success:
+            return jsonify({'success': False, 'message': message})
+        
+        # Подключаемся к MongoDB
+        if not web_parser.parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к MongoDB'})
+        
+        # Обновляем статус изображений
+        from bson import ObjectId
+        from datetime import datetime
+        
+        # Преобразуем строковые ID в ObjectId
+        object_ids = []
+        for img_id in image_ids:
+            try:
+                object_ids.append(ObjectId(img_id))
+            except Exception as e:
+                print(f"❌ Ошибка преобразования ID {img_id}: {e}")
+                continue
+        
+        if not object_ids:
+            return jsonify({'success': False, 'message': 'Некорректные ID изображений'})
+        
+        # Обновляем документы в MongoDB
+        query = {"_id": {"$in": object_ids}}
+        tags_before = snapshot_tags(web_parser.parser.collection, query)
+        result = web_parser.parser.collection.update_many(
+            query,
+            {
+                "$set": {
+                    "selected_for_tagging": True,
+                    "selected_at": datetime.now().isoformat()
+                }
+            }
+        )
+        invalidate_images(web_parser.parser.collection, query, tags_before, 'mark-for-tagging')
+        
+        return jsonify({
+            'success': True,
+            'message': f'Отмечено {result.modified_count} изображений для теггирования',
+            'marked_count': result.modified_count
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/unmark-for-tagging', methods=['POST'])
+def api_unmark_for_tagging():
+    """API для снятия отметки с изображений для теггирования"""
+    try:
+        data = request.get_json()
+        image_ids = data.get('image_ids', [])
+        
+        if not image_ids:
+            return jsonify({'success': False, 'message': 'Список ID изображений пуст'})
+        
+        # Проверяем инициализацию парсера
+        success, message = web_parser.init_parser()
+        if not success:
+            return jsonify({'success': False, 'message': message})
+        
+        # Подключаемся к MongoDB
+        if not web_parser.parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к MongoDB'})
+        
+        # Обновляем статус изображений
+        from bson import ObjectId
+        
+        # Преобразуем строковые ID в ObjectId
+        object_ids = []
+        for img_id in image_ids:
+            try:
+                object_ids.append(ObjectId(img_id))
+            except Exception as e:
+                print(f"❌ Ошибка преобразования ID {img_id}: {e}")
+                continue
+        
+        if not object_ids:
+            return jsonify({'success': False, 'message': 'Некорректные ID изображений'})
+        
+        # Обновляем статус изображений
+        query = {"_id": {"$in": object_ids}}
+        tags_before = snapshot_tags(web_parser.parser.collection, query)
+        result = web_parser.parser.collection.update_many(
+            query,
+            {
+                "$set": {
+                    "selected_for_tagging": False,
+                    "selected_at": None
+                }
+            }
+        )
+        invalidate_images(web_parser.parser.collection, query, tags_before, 'unmark-for-tagging')
+        
+        return jsonify({
+            'success': True,
+            'message': f'Снята отметка с {result.modified_count} изображений',
+            'unmarked_count': result.modified_count
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/tag-images', methods=['POST'])
+def api_tag_images():
+    """API для теггирования изображений через Ximilar"""
+    try:
+        data = request.get_json()
+        image_ids = data.get('image_ids', [])
+
+        if not image_ids:
+            return jsonify({'success': False, 'message': 'Список ID изображений пуст'})
+
+        # Проверяем инициализацию парсера
+        success, message = web_parser.init_parser()
+        if not success:
+            return jsonify({'success': False, 'message': message})
+
+        # Подключаемся к MongoDB
+        if not web_parser.parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к MongoDB'})
+
+        from bson import ObjectId
+
+        # Преобразуем строковые ID в ObjectId
+        object_ids = []
+        for img_id in image_ids:
+            try:
+                object_ids.append(ObjectId(img_id))
+            except Exception as e:
+                print(f"❌ Ошибка преобразования ID {img_id}: {e}")
+                continue
+
+        if not object_ids:
+            return jsonify({'success': False, 'message': 'Некорректные ID изображений'})
+
+        # Получаем изображения из базы данных
+        images = list(web_parser.parser.collection.find(
+            {"_id": {"$in": object_ids}},
+            {"_id": 1, "local_filename": 1, "local_path": 1, "image_hash": 1, PRESCREEN_OVERRIDE_FIELD: 1}
+        ))
+
+        if not images:
+            return jsonify({'success': False, 'message': 'Изображения не найдены в базе данных'})
+
+        # Локальный пре-скрин: изображения без одежды не отправляются в Ximilar
+        no_fashion_count = 0
+        if not data.get('force'):
+            try:
+                from fashion_prescreen import screen_images, mark_no_fashion
+
+                started = time.perf_counter()
+                # Модель грузится в фоне при старте; пока не готова - всё уходит в Ximilar
+                images, rejected = screen_images(web_parser.parser.collection, images, wait=False)
+                if rejected:
+                    rejected_query = {"_id": {"$in": [image['_id'] for image, _ in rejected]}}
+                    rejected_tags = snapshot_tags(web_parser.parser.collection, rejected_query)
+                    mark_no_fashion(web_parser.parser.collection, rejected)
+                    invalidate_images(web_parser.parser.collection, rejected_query, rejected_tags, 'prescreen')
+                    no_fashion_count = len(rejected)
+                    print(f"🚫 Пре-скрин: {no_fashion_count} изображений без одежды не отправлены в Ximilar "
+                          f"({time.perf_counter() - started:.2f} сек)")
+            except Exception as e:
+                print(f"⚠️ Пре-скрин пропущен: {e}")
+
+        if not images:
+            get_precomputer().trigger('tagging')
+            return jsonify({
+                'success': True,
+                'message': f'Все {no_fashion_count} изображений отсеяны пре-скрином (одежды не найдено)',
+                'tagged_count': 0,
+                'no_fashion_count': no_fashion_count
+            })
+
+        # Создаем экземпляр Ximilar теггера
+        from ximilar_fashion_tagger import XimilarFashionTagger
+        ximilar_api_key = os.getenv("XIMILAR_API_KEY")
+
+        if not ximilar_api_key:
+            return jsonify({'success': False, 'message': 'XIMILAR_API_KEY не найден в переменных окружения'})
+
+        tagger = XimilarFashionTagger(ximilar_api_key, web_parser.parser.mongodb_uri)
+
+        # Подключаемся к MongoDB
+        if not tagger.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к MongoDB для теггирования'})
+
+        # Теггируем изображения через Ximilar
+        query = {"_id": {"$in": [image['_id'] for image in images]}}
+        tags_before = snapshot_tags(web_parser.parser.collection, query)
+        tagged_count = 0
+        reused_count = 0
+        # Визуально идентичные уже оттегированным получают их теги без вызова Ximilar
+        from tag_reuse import get_reuse_index, build_reuse_update
+        reuse = get_reuse_index(web_parser.parser.collection)
+        for image in images:
+            try:
+                match = reuse.find(image)
+                if match:
+                    web_parser.parser.collection.update_one({"_id": image['_id']}, build_reuse_update(match))
+                    tagged_count += 1
+                    reused_count += 1
+                    print(f"♻️ Теги {image['local_filename']} взяты у {match['source']['_id']} "
+                          f"({match['match']}, расстояние {match['distance']})")
+                    continue
+
+                # Формируем URL изображения
+                image_url = f"http://158.160.19.119:5000/images/{image['local_filename']}"
+
+                # Используем существующую функциональность теггирования
+                tags_result = tagger.tag_image_with_ximilar(image_url)
+
+                if tags_result and 'success' in tags_result and tags_result['success']:
+                    # Компактные объекты в документе, полный ответ - в ximilar_raw
+                    update = build_tag_update(tags_result)
+                    update["$set"]["selected_for_tagging"] = False  # Убираем из списка для теггирования
+                    if image.get(DIGEST_FIELD):
+                        update["$set"][DIGEST_FIELD] = image[DIGEST_FIELD]
+
+                    web_parser.parser.collection.update_one({"_id": image['_id']}, update)
+                    save_raw_response(web_parser.parser.db, image['_id'], tags_result.get("api_response"))
+                    reuse.add(image)
+                    tagged_count += 1
+                    print(f"✅ Изображение {image['local_filename']} оттегировано")
+                else:
+                    print(f"❌ Не удалось оттегировать {image['local_filename']}")
+
+            except Exception as e:
+                print(f"❌ Ошибка теггирования {image['local_filename']}: {e}")
+                continue
+
+        if tagged_count:
+            invalidate_images(web_parser.parser.collection, query, tags_before, 'tagging')
+        if tagged_count or no_fashion_count:
+            get_precomputer().trigger('tagging')
+
+        message = f'Оттегировано {tagged_count} из {len(images)} изображений'
+        if reused_count:
+            message += f' (теги переиспользованы: {reused_count})'
+        if no_fashion_count:
+            message += f', без одежды (пре-скрин): {no_fashion_count}'
+        return jsonify({
+            'success': True,
+            'message': message,
+            'tagged_count': tagged_count,
+            'reused_count': reused_count,
+            'no_fashion_count': no_fashion_count
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
+
+@bp.route('/api/restore-no-fashion', methods=['POST'])
+def api_restore_no_fashion():
+    """API для возврата отсеянных пре-скрином изображений в очередь без тегов"""
+    try:
+        data = request.get_json()
+        image_ids = data.get('image_ids', [])
+
+        if not image_ids:
+            return jsonify({'success': False, 'message': 'Список ID изображений пуст'})
+
+        # Проверяем инициализацию парсера
+        success, message = web_parser.init_parser()
+        if not success:
+            return jsonify({'success': False, 'message': message})
+
+        # Подключаемся к MongoDB
+        if not web_parser.parser.connect_mongodb():
+            return jsonify({'success': False, 'message': 'Ошибка подключения к MongoDB'})
+
+        from bson import ObjectId
+
+        # Преобразуем строковые ID в ObjectId
+        object_ids = []
+        for img_id in image_ids:
+            try:
+                object_ids.append(ObjectId(img_id))
+            except Exception as e:
+                print(f"❌ Ошибка преобразования ID {img_id}: {e}")
+                continue
+
+        if not object_ids:
+            return jsonify({'success': False, 'message': 'Некорректные ID изображений'})
+
+        # Убираем состояние no_fashion; повторный пре-скрин эти изображения не отсеет
+        query = dict({"_id": {"$in": object_ids}}, **NO_FASHION_QUERY)
+        tags_before = snapshot_tags(web_parser.parser.collection, query)
+        result = web_parser.parser.collection.update_many(query, build_prescreen_restore_update())
+        invalidate_images(web_parser.parser.collection, {"_id": {"$in": object_ids}}, tags_before, 'restore-no-fashion')
+        get_precomputer().trigger('restore-no-fashion')
+
+        return jsonify({
+            'success': True,
+            'message': f'Возвращено в галерею {result.modified_count} изображений',
+            'restored_count': result.modified_count
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {e}'})
@@ -0,0 +1,208 @@
+"""Повторное использование тегов Ximilar для визуально идентичных изображений
+
+Одна и та же фотография приходит от нескольких блогеров или повторно под новым
+post_id, и раньше каждый раз тегировалась заново (1-60 секунд и квота API).
+Перед вызовом Ximilar теггер ищет уже оттегированное изображение:
+
+    1. по точному дайджесту содержимого (sha256 файла, поле content_digest);
+    2. по perceptual hash с расстоянием Хэмминга <= REUSE_DISTANCE (0-2).
+
+При совпадении ximilar_items копируется из источника, а в документ пишется
+происхождение тегов: tags_reused_from (_id источника) и tags_reuse
+(способ совпадения, расстояние, время). Сырой ответ Ximilar не копируется,
+он остаётся у источника в ximilar_raw.
+
+Точные совпадения (дайджест, одинаковый image_hash) ищутся find_one по индексам
+content_digest_1 и image_hash_1. Для близких pHash (расстояние 1..REUSE_DISTANCE)
+в процессе держится один массив uint64 оттегированных изображений: он загружается
+при первом обращении, а дальше только дополняется - изображениями, оттегированными
+в этом процессе (add), и оттегированными другими процессами после последнего
+обновления (refresh по ximilar_tagged_at, индекс ximilar_tagged_at_-1).
+
+    reuse = get_reuse_index(collection)       # общий на процесс, без полного чтения коллекции
+    match = reuse.find(image)                 # image: {_id, image_hash, local_filename}
+    if match:
+        collection.update_one({"_id": image["_id"]}, build_reuse_update(match))
+    else:
+        ... Ximilar, запись тегов ...
+        reuse.add(image)                      # следующие изображения найдут его
+"""
+
+import os
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from near_duplicates import hamming, hash_to_int
+from taxonomy import TAXONOMY_VERSION, VERSION_FIELD, annotate_items
+from ximilar_schema import DIGEST_FIELD, ITEMS_FIELD, LEGACY_FIELDS, PRESCREEN_FIELDS, TAGGED_QUERY
+
+# Максимальное расстояние pHash для переиспользования (pHash 64 бита)
+REUSE_DISTANCE = int(os.getenv('TAG_REUSE_DISTANCE', 2))
+
+# Дайджест содержимого (читает файл целиком); отключается TAG_REUSE_DIGEST=0
+USE_DIGEST = os.getenv('TAG_REUSE_DIGEST', '1') == '1'
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGES_DIR = os.path.join(BASE_DIR, 'images')
+
+
+def content_digest(local_filename: Optional[str]) -> Optional[str]:
+    """sha256 файла изображения или None, если файла нет"""
+    if not local_filename:
+        return None
+    try:
+        digest = hashlib.sha256()
+        with open(os.path.join(IMAGES_DIR, local_filename), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+
+class TagReuseIndex:
+    """pHash оттегированных изображений (uint64) для поиска близких; точные совпадения - через MongoDB
+
+    Объекты Ximilar в память не грузятся - только у найденного источника.
+    """
+
+    def __init__(self, collection, max_distance: int = REUSE_DISTANCE, use_digest: bool = USE_DIGEST):
+        self.collection = collection
+        self.max_distance = max_distance
+        self.use_digest = use_digest
+        self.ids: List = []
+        self.known = set()
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.synced_at: Optional[str] = None   # максимальный ximilar_tagged_at из загруженных
+        self.hits = {"digest": 0, "phash": 0}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _append(self, image_id, image_hash: Optional[str]):
+        value = hash_to_int(image_hash)
+        if value is None or image_id in self.known:
+            return
+        position = len(self.ids)
+        if position == len(self.hashes):
+            self.hashes = np.resize(self.hashes, max(1024, 2 * position))
+        self.hashes[position] = value
+        self.ids.append(image_id)
+        self.known.add(image_id)
+
+    def refresh(self):
+        """Первая загрузка или дочитывание оттегированных после synced_at (другими процессами)"""
+        if self.max_distance <= 0:
+            return
+        with self._lock:
+            query = dict(TAGGED_QUERY, image_hash={"$exists": True, "$ne": None})
+            if self._loaded and self.synced_at:
+                # $gte: изображения с той же секундой не теряются, повторы отсекает known
+                query["ximilar_tagged_at"] = {"$gte": self.synced_at}
+            for doc in self.collection.find(query, {"image_hash": 1, "ximilar_tagged_at": 1}):
+                self._append(doc["_id"], doc.get("image_hash"))
+                tagged_at = doc.get("ximilar_tagged_at")
+                if isinstance(tagged_at, str) and (self.synced_at is None or tagged_at > self.synced_at):
+                    self.synced_at = tagged_at
+            self._loaded = True
+
+    def _exact(self, field: str, value: str, image_id) -> Optional[Dict]:
+        query = dict(TAGGED_QUERY, **{field: value, "_id": {"$ne": image_id}})
+        return self.collection.find_one(query, {ITEMS_FIELD: 1})
+
+    def find(self, image: Dict) -> Optional[Dict]:
+        """Источник тегов для изображения: {'source', 'items', 'match', 'distance', 'digest'} или None"""
+        digest = content_digest(image.get("local_filename")) if self.use_digest else None
+        # Запоминаем дайджест, чтобы после теггирования изображение само стало источником
+        image[DIGEST_FIELD] = digest
+
+        candidates = []
+        if digest:
+            source = self._exact(DIGEST_FIELD, digest, image["_id"])
+            if source:
+                candidates.append((source, "digest", 0))
+        value = hash_to_int(image.get("image_hash"))
+        if value is not None and not candidates:
+            source = self._exact("image_hash", image["image_hash"], image["_id"])
+            if source:
+                candidates.append((source, "phash", 0))
+            elif self.max_distance > 0:
+                self.refresh()
+                hashes = self.hashes[:len(self.ids)]
+                distances = hamming(hashes, value) if len(hashes) else np.zeros(0, dtype=np.int64)
+                for position in np.argsort(distances, kind="stable"):
+                    if distances[position] > self.max_distance:
+                        break
+                    candidates.append(({"_id": self.ids[position]}, "phash", int(distances[position])))
+
+        for source, match, distance in candidates:
+            if source["_id"] == image["_id"]:
+                continue
+            items = self._items(source)
+            if items:
+                self.hits[match] += 1
+                return {"source": source, "items": items, "match": match, "distance": distance,
+                        "digest": digest}
+        return None
+
+    def _items(self, source: Dict) -> List[Dict]:
+        """Объекты источника (из точного совпадения - уже прочитаны, иначе из MongoDB)"""
+        if ITEMS_FIELD in source:
+            return source[ITEMS_FIELD]
+        doc = self.collection.find_one({"_id": source["_id"]}, {ITEMS_FIELD: 1})
+        return (doc or {}).get(ITEMS_FIELD) or []
+
+    def add(self, image: Dict):
+        """Изображение только что оттегировано и записано - использовать его для остальных"""
+        if self.max_distance <= 0 or not self._loaded:
+            return
+        with self._lock:
+            self._append(image["_id"], image.get("image_hash"))
+
+
+_shared: Dict[str, TagReuseIndex] = {}
+_shared_lock = threading.Lock()
+
+
+def get_reuse_index(collection) -> TagReuseIndex:
+    """Общий на процесс индекс для коллекции (загружается один раз, дальше дополняется)"""
+    key = collection.full_name
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = TagReuseIndex(collection)
+        return _shared[key]
+
+
+def build_reuse_update(match: Dict) -> Dict:
+    """$set/$unset: теги источника и их происхождение"""
+    now = datetime.now().isoformat()
+    source = match["source"]
+    # Копия с "ns" по текущей таксономии (источник мог быть оттегирован со старой)
+    items = annotate_items([dict(item) for item in match["items"]])
+    update_set = {
+        ITEMS_FIELD: items,
+        VERSION_FIELD: TAXONOMY_VERSION,
+        "ximilar_total_objects": len(items),
+        "ximilar_tagged_at": now,
+        "ximilar_success": True,
+        "tagged_at": now,
+        "selected_for_tagging": False,
+        "tags_reused_from": source["_id"],
+        "tags_reuse": {
+            "match": match["match"],
+            "distance": match["distance"],
+            "reused_at": now,
+        },
+    }
+    if match.get("digest"):
+        update_set[DIGEST_FIELD] = match["digest"]
+    return {
+        "$set": update_set,
+        "$unset": {field: "" for field in LEGACY_FIELDS + PRESCREEN_FIELDS},
+    }
@@ -0,0 +1,36 @@
+"""Общие настройки тестов: модули проекта импортируются из корня репозитория
+
+Кеш аналитики в тестах - в памяти процесса (не трогает analytics_cache.sqlite3),
+фоновые задачи create_app() выключены (WEB_BACKGROUND_TASKS=0),
+MongoDB - mongomock (pip install mongomock).
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault("ANALYTICS_CACHE_BACKEND", "memory")
+# Без фонового пересчёта аналитики и загрузки CLIP при сборке приложения
+os.environ.setdefault("WEB_BACKGROUND_TASKS", "0")
+
+
+@pytest.fixture
+def db():
+    """Пустая база mongomock"""
+    mongomock = pytest.importorskip("mongomock")
+    return mongomock.MongoClient().get_database("instagram_gallery")
+
+
+@pytest.fixture
+def cache():
+    """Глобальный кеш аналитики, очищенный до и после теста"""
+    from analytics_cache import analytics_cache
+
+    analytics_cache.clear()
+    yield analytics_cache
+    analytics_cache.clear()
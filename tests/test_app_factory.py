@@ -0,0 +1,80 @@
+"""Фоновые задачи веб-процесса запускаются из create_app(), один раз на процесс"""
+
+import os
+import threading
+import types
+
+import pytest
+
+import analytics_precompute
+import app_factory
+import clip_encoder
+import index_registry
+
+
+class FakePrecomputer:
+    def __init__(self):
+        self.starts = []
+        self.started = threading.Event()
+
+    def start(self):
+        self.starts.append(app_factory._background_pid)
+        self.started.set()
+
+
+@pytest.fixture
+def precomputer(monkeypatch):
+    precomputer = FakePrecomputer()
+    monkeypatch.setenv("WEB_BACKGROUND_TASKS", "1")
+    monkeypatch.setattr(app_factory, "_background_pid", None)
+    monkeypatch.setattr(app_factory, "get_precomputer", lambda: precomputer)
+    monkeypatch.setattr(app_factory, "get_collection", lambda: types.SimpleNamespace(database=None))
+    monkeypatch.setattr(clip_encoder, "warm_up", lambda: False)
+    monkeypatch.setattr(index_registry, "apply_on_startup", lambda db: None)
+    return precomputer
+
+
+def wait_for_starts(precomputer, count):
+    for _ in range(100):
+        if len(precomputer.starts) >= count:
+            return
+        precomputer.started.wait(0.05)
+        precomputer.started.clear()
+
+
+def test_create_app_starts_precomputer_once_per_process(precomputer):
+    app = app_factory.create_app()
+    wait_for_starts(precomputer, 1)
+    assert len(precomputer.starts) == 1
+
+    app_factory.create_app()
+    app.test_client().get("/missing")
+    assert not app_factory.start_background()
+    assert len(precomputer.starts) == 1
+
+
+def test_forked_worker_starts_on_first_request(precomputer):
+    app = app_factory.create_app()
+    wait_for_starts(precomputer, 1)
+
+    # Приложение собрано в другом процессе (gunicorn --preload)
+    app_factory._background_pid = -1
+    app.test_client().get("/missing")
+    wait_for_starts(precomputer, 2)
+    assert len(precomputer.starts) == 2
+
+
+def test_background_disabled(precomputer, monkeypatch):
+    monkeypatch.setenv("WEB_BACKGROUND_TASKS", "0")
+    app_factory.create_app()
+    assert not app_factory.start_background()
+    assert app_factory._background_pid is None
+
+
+def test_start_takes_lease_as_current_process(monkeypatch):
+    monkeypatch.setattr(analytics_precompute.AnalyticsPrecomputer, "_loop", lambda self: None)
+    precomputer = analytics_precompute.AnalyticsPrecomputer(analytics=None)
+    precomputer.owner = "preload-master:1"
+    precomputer.start()
+    precomputer._thread.join()
+    assert precomputer.owner.endswith(f":{os.getpid()}")
@@ -0,0 +1,69 @@
+"""Пакетные миграции: запись пакетами и продолжение с чекпоинта"""
+
+import pytest
+
+from batch_migration import Migration, load_checkpoint, run_migration
+
+UpdateOne = pytest.importorskip("pymongo").UpdateOne
+
+
+class FixLikes(Migration):
+    name = "fix_negative_likes_test"
+    query = {"likes_count": {"$lt": 0}}
+    projection = {"likes_count": 1}
+
+    def __init__(self, fail_after=None):
+        super().__init__()
+        self.fail_after = fail_after
+        self.seen = []
+
+    def operations(self, doc, result):
+        if self.fail_after is not None and len(self.seen) >= self.fail_after:
+            raise RuntimeError("interrupted")
+        self.seen.append(doc["_id"])
+        return [UpdateOne({"_id": doc["_id"]}, {"$set": {"likes_count": 0}})]
+
+
+def run(migration, db, **kwargs):
+    return run_migration(migration, db, workers=1, partitions=1, batch_size=10, **kwargs)
+
+
+@pytest.fixture
+def images(db):
+    db.images.insert_many([{"_id": i, "likes_count": -1 if i % 2 else 5} for i in range(60)])
+    return db.images
+
+
+def test_dry_run_writes_nothing(db, images):
+    stats = run(FixLikes(), db, dry_run=True)
+    assert stats["processed"] == 30
+    assert images.count_documents({"likes_count": {"$lt": 0}}) == 30
+    assert load_checkpoint(db, FixLikes.name) is None
+
+
+def test_interrupted_run_resumes_from_checkpoint(db, images):
+    with pytest.raises(RuntimeError):
+        run(FixLikes(fail_after=15), db)
+
+    checkpoint = load_checkpoint(db, FixLikes.name)
+    assert checkpoint["status"] == "running"
+    assert checkpoint["partitions"][0]["processed"] == 10
+    assert images.count_documents({"likes_count": {"$lt": 0}}) == 20
+
+    migration = FixLikes()
+    stats = run(migration, db)
+    # Первый записанный пакет повторно не читается
+    assert stats["processed"] == 20
+    assert min(migration.seen) > checkpoint["partitions"][0]["last_id"]
+    assert images.count_documents({"likes_count": {"$lt": 0}}) == 0
+    assert load_checkpoint(db, FixLikes.name)["status"] == "done"
+
+
+def test_finished_run_starts_over(db, images):
+    run(FixLikes(), db)
+    images.update_many({"_id": {"$lt": 4}}, {"$set": {"likes_count": -3}})
+
+    migration = FixLikes()
+    stats = run(migration, db)
+    assert stats["processed"] == 4
+    assert migration.seen == [0, 1, 2, 3]
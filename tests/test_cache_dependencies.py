@@ -0,0 +1,91 @@
+"""Кеш аналитики: инвалидация по тегам зависимостей в обоих бэкендах"""
+
+import time
+
+import pytest
+
+from analytics_cache import AnalyticsCache, SharedAnalyticsCache, cached
+from cache_dependencies import (
+    EXCLUDED_IMAGES, TAGGED_CORPUS, category_tag, gallery_tag, image_tags, invalidate_images, snapshot_tags,
+)
+from ximilar_schema import build_tag_update
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return AnalyticsCache()
+    return SharedAnalyticsCache(str(tmp_path / "cache.sqlite3"))
+
+
+def test_invalidate_tags_removes_only_dependent_entries(backend):
+    backend.set("categories", 1, tags=[TAGGED_CORPUS])
+    backend.set("top_items_Footwear", 2, tags=[category_tag("Footwear")])
+    backend.set("bloggers_gallery", 3, tags=[gallery_tag("gallery")])
+
+    assert backend.invalidate_tags([category_tag("Footwear")]) == 1
+
+    assert backend.get("top_items_Footwear") is None
+    assert backend.get("categories") == 1
+    assert backend.get("bloggers_gallery") == 3
+
+
+def test_result_started_before_invalidation_is_not_published(backend):
+    started_at = time.time()
+    backend.invalidate_tags([TAGGED_CORPUS])
+    assert backend.set("categories", 1, tags=[TAGGED_CORPUS], started_at=started_at) is False
+    assert backend.get("categories") is None
+
+
+def test_invalidate_pattern_drops_tag_mappings(backend):
+    backend.set("top_items_Footwear", 1, tags=[category_tag("Footwear"), TAGGED_CORPUS])
+    backend.set("categories", 2, tags=[TAGGED_CORPUS])
+
+    backend.invalidate("top_items_")
+
+    if isinstance(backend, AnalyticsCache):
+        assert backend.tags == {TAGGED_CORPUS: {"categories"}}
+    else:
+        rows = backend._connection().execute("SELECT tag, key FROM entry_tags ORDER BY tag").fetchall()
+        assert rows == [(TAGGED_CORPUS, "categories")]
+    assert backend.invalidate_tags([category_tag("Footwear")]) == 0
+
+
+def test_shared_cache_preserves_value_types(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    value = {"pair": ("Clothing", 3), 2025: ["x"]}
+    SharedAnalyticsCache(path).set("key", value)
+    # Другой процесс читает из файла, а не из своей декодированной копии
+    assert SharedAnalyticsCache(path).get("key") == value
+
+
+def test_image_tags():
+    doc = {"local_filename": "a.jpg", "hidden": True}
+    doc.update(build_tag_update({"success": True, "objects": [{"name": "jeans", "top_category": "Clothing"}]})["$set"])
+    assert image_tags(doc) == {TAGGED_CORPUS, category_tag("Clothing"), gallery_tag("gallery_hidden"), EXCLUDED_IMAGES}
+    assert image_tags({"local_filename": "b.jpg"}) == {gallery_tag("gallery")}
+
+
+def test_hiding_invalidates_galleries_before_and_after(db, cache):
+    calls = []
+
+    @cached(key_func=lambda gallery_type: f"bloggers_{gallery_type}",
+            tags=lambda gallery_type: [gallery_tag(gallery_type)])
+    def bloggers(gallery_type):
+        calls.append(gallery_type)
+        return [gallery_type]
+
+    db.images.insert_many([{"_id": 1, "local_filename": "a.jpg"}, {"_id": 2, "local_filename": "b.jpg"}])
+    for gallery_type in ("gallery", "gallery_hidden", "gallery_tagged"):
+        bloggers(gallery_type)
+
+    query = {"_id": 1}
+    tags_before = snapshot_tags(db.images, query)
+    db.images.update_one(query, {"$set": {"hidden": True}})
+    invalidate_images(db.images, query, tags_before, "test")
+
+    calls.clear()
+    for gallery_type in ("gallery", "gallery_hidden", "gallery_tagged"):
+        bloggers(gallery_type)
+    # Вкладка, откуда ушло изображение, и вкладка, куда оно пришло; третья - из кеша
+    assert calls == ["gallery", "gallery_hidden"]
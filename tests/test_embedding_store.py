@@ -0,0 +1,75 @@
+"""Хранилище эмбеддингов: дозапись, точный поиск, переоткрытие"""
+
+import numpy as np
+import pytest
+
+import embedding_store
+from embedding_store import EmbeddingStore
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(50, 16)).astype(np.float32)
+
+
+@pytest.fixture
+def store(tmp_path, vectors):
+    store = EmbeddingStore(str(tmp_path))
+    assert store.add([f"id{i}" for i in range(len(vectors))], vectors, model="test") == len(vectors)
+    return store
+
+
+def brute_force(vectors, query, k, skip=()):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    return [f"id{i}" for i in np.argsort(-scores) if f"id{i}" not in skip][:k]
+
+
+def test_add_skips_stored_and_repeated_ids(store, vectors):
+    assert store.add(["id0", "id1"], vectors[:2]) == 0
+    assert store.add(["new", "new"], vectors[:2]) == 1
+    assert len(store) == 51
+    assert store.rows["new"] == 50
+
+
+def test_search_matches_brute_force(store, vectors, monkeypatch):
+    query = vectors[7] + 0.1
+    expected = brute_force(vectors, query, 5)
+    assert [image_id for image_id, _ in store.search(query, k=5)] == expected
+
+    # Мелкие блоки из memmap без резидентной копии - тот же результат
+    monkeypatch.setattr(embedding_store, "BLOCK_ROWS", 8)
+    monkeypatch.setattr(embedding_store, "RESIDENT_MB", 0)
+    results = store.search(query, k=5)
+    assert [image_id for image_id, _ in results] == expected
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+
+def test_search_exclude_and_rows(store, vectors):
+    query = vectors[3]
+    results = store.search(query, k=3, exclude=["id3"])
+    assert [image_id for image_id, _ in results] == brute_force(vectors, query, 3, skip={"id3"})
+
+    rows = store.rows_for(["id10", "id20", "missing", "id30"])
+    assert rows.tolist() == [10, 20, 30]
+    assert {image_id for image_id, _ in store.search(query, k=5, rows=rows)} == {"id10", "id20", "id30"}
+
+
+def test_similar(store, vectors):
+    results = store.similar("id4", k=4)
+    assert [image_id for image_id, _ in results] == brute_force(vectors, vectors[4], 4, skip={"id4"})
+    assert store.similar("missing") is None
+
+
+def test_reader_sees_rows_added_by_another_writer(tmp_path, store, vectors):
+    reader = EmbeddingStore(str(tmp_path))
+    assert reader.model == "test" and len(reader) == 50
+
+    store.add(["late"], vectors[0] * -1)
+    assert reader.search(-vectors[0], k=1)[0][0] == "late"
+    np.testing.assert_allclose(reader.vector("late"), -vectors[0] / np.linalg.norm(vectors[0]), atol=1e-3)
+
+
+def test_dimension_mismatch(store):
+    with pytest.raises(ValueError):
+        store.add(["other"], np.ones((1, 8), dtype=np.float32))
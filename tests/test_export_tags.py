@@ -0,0 +1,69 @@
+"""Выгрузка тегов: строки объектов и Parquet по частям"""
+
+import io
+
+import pytest
+
+import export_tags
+from ximilar_schema import build_tag_update
+
+OBJECTS = [
+    {
+        "name": "midi dresses", "top_category": "Clothing", "probability": 0.91,
+        "properties": {
+            "other_attributes": {"Subcategory": [{"name": "midi dresses", "confidence": 0.88}]},
+            "visual_attributes": {"Color": [{"name": "black", "confidence": 0.8}, {"name": "white", "confidence": 0.3}]},
+        },
+    },
+    {"name": "sneakers", "top_category": "Footwear", "probability": 0.7, "properties": {}},
+]
+
+
+def tagged_doc(image_id="img1", **fields):
+    doc = {"_id": image_id, "post_id": "p1", "username": "linda.sza", "timestamp": "2025-03-10T10:00:00",
+           "likes_count": 10, "comments_count": 2, "local_filename": "a.jpg"}
+    doc.update(fields)
+    doc.update(build_tag_update({"success": True, "objects": OBJECTS})["$set"])
+    return doc
+
+
+def row_dict(row):
+    return dict(zip(export_tags.COLUMN_NAMES, row))
+
+
+def test_object_rows_one_row_per_object():
+    rows = [row_dict(row) for row in export_tags.object_rows(tagged_doc())]
+
+    assert all(len(row) == len(export_tags.COLUMNS) for row in rows)
+    assert [row["object_index"] for row in rows] == [0, 1]
+    assert rows[0] == dict(rows[0], image_id="img1", date="2025-03-10", engagement=12,
+                           top_category="Clothing", object_name="midi dresses", object_confidence=91,
+                           subcategory="midi dresses", subcategory_confidence=88, normalized_subcategory="Dresses",
+                           color="black", color_confidence=80, colors="black|white", material=None)
+    assert rows[1]["object_name"] == "sneakers" and rows[1]["colors"] is None
+
+
+def test_object_rows_missing_values():
+    doc = tagged_doc(timestamp="N/A", likes_count="10", comments_count=3)
+    row = row_dict(next(export_tags.object_rows(doc)))
+    assert (row["timestamp"], row["date"]) == (None, None)
+    assert (row["likes_count"], row["comments_count"], row["engagement"]) == (None, 3, 3)
+
+    doc = tagged_doc(likes_count=None, comments_count=None)
+    assert row_dict(next(export_tags.object_rows(doc)))["engagement"] is None
+
+    assert list(export_tags.object_rows({"_id": "untagged"})) == []
+
+
+def test_parquet_round_trip():
+    pq = pytest.importorskip("pyarrow.parquet")
+    assert export_tags.parquet_available()
+
+    rows = list(export_tags.object_rows(tagged_doc()))
+    # Два пакета - две row group, байты отдаются по частям
+    data = b"".join(export_tags.parquet_chunks(iter([rows[:1], rows[1:]])))
+    table = pq.read_table(io.BytesIO(data))
+
+    assert table.column_names == export_tags.COLUMN_NAMES
+    assert table.num_rows == len(rows)
+    assert [tuple(row.values()) for row in table.to_pylist()] == rows
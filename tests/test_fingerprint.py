@@ -0,0 +1,101 @@
+"""Каскад FingerprintIndex: пороги этапов и дочитывание общего индекса"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import fingerprint
+from fingerprint import FingerprintIndex, get_index, to_int64
+from near_duplicates import PHASH_ONLY_DISTANCE
+
+BASE = 0x0F0F_0F0F_0F0F_0F0F
+MOMENTS = [0.5] * 9
+
+
+def flip(value, bits):
+    """Хеш, отличающийся от value ровно в bits младших битах"""
+    return value ^ ((1 << bits) - 1)
+
+
+def hex_hash(value):
+    return f"{value:016x}"
+
+
+def record(phash, dhash=BASE, whash=BASE, moments=MOMENTS):
+    return {"v": 1, "p": to_int64(hex_hash(phash)), "d": to_int64(hex_hash(dhash)),
+            "w": to_int64(hex_hash(whash)), "m": list(moments)}
+
+
+def reasons(results):
+    return [(doc["_id"], distance, reason) for doc, distance, _, reason in results]
+
+
+def test_fingerprint_threshold_defaults_to_phash_only_rule():
+    assert PHASH_ONLY_DISTANCE == 5
+    assert fingerprint.FINGERPRINT_PHASH_DISTANCE == PHASH_ONLY_DISTANCE
+
+
+@pytest.mark.parametrize("bits, accepted", [(0, True), (5, True), (6, False)])
+def test_phash_only_threshold(bits, accepted):
+    index = FingerprintIndex()
+    index.add({"_id": "old"}, None, hex_hash(BASE))
+    results = index.search({"p": to_int64(hex_hash(flip(BASE, bits)))})
+    assert reasons(results) == ([("old", bits, "phash")] if accepted else [])
+
+
+@pytest.mark.parametrize("bits, accepted", [(5, True), (6, False)])
+def test_full_fingerprint_phash_threshold(bits, accepted):
+    index = FingerprintIndex()
+    index.add({"_id": "old"}, record(BASE))
+    results = index.search(record(flip(BASE, bits)))
+    assert reasons(results) == ([("old", bits, "fingerprint")] if accepted else [])
+    if not accepted:
+        assert index.stats["phash_rejected"] == 1
+
+
+def test_bucket_hit_skips_corpus_scan():
+    index = FingerprintIndex()
+    index.add({"_id": "same"}, record(BASE))
+    index.add({"_id": "near"}, record(flip(BASE, 2)))
+    assert reasons(index.search(record(BASE))) == [("same", 0, "fingerprint")]
+    assert index.stats["bucket_hits"] == 1
+
+
+@pytest.mark.parametrize("changes, stage", [
+    ({"dhash": flip(BASE, 13)}, "dhash"),
+    ({"whash": flip(BASE, 13)}, "whash"),
+    ({"moments": [0.9] * 9}, "color"),
+])
+def test_full_fingerprint_stages_reject(changes, stage):
+    index = FingerprintIndex()
+    index.add({"_id": "old"}, record(BASE))
+    assert index.search(record(flip(BASE, 1), **changes)) == []
+    assert index.stats[f"{stage}_rejected"] == 1
+
+
+def test_embedding_decides_when_available():
+    index = FingerprintIndex()
+    index.add({"_id": "old"}, record(BASE))
+    query = record(flip(BASE, 8), moments=[0.9] * 9)
+    # Перекрашенный репост: цвет не совпадает, но эмбеддинги почти одинаковые
+    assert reasons(index.search(query, similarity=lambda doc: 0.99)) == [("old", 8, "phash")]
+    assert index.search(query, similarity=lambda doc: 0.5) == []
+
+
+def test_get_index_reads_only_recent_downloads(db, monkeypatch):
+    monkeypatch.setattr(fingerprint, "_shared", {})
+    now = datetime.now()
+    db.images.insert_one({"_id": 1, "image_hash": hex_hash(BASE), "downloaded_at": (now - timedelta(days=30)).isoformat()})
+
+    index = get_index(db.images)
+    assert len(index) == 1
+
+    db.images.insert_many([
+        {"_id": 2, "fingerprint": record(flip(BASE, 20)), "downloaded_at": now.isoformat()},
+        # Старые изображения без отпечатка при загрузке не было - дочитывание их не видит
+        {"_id": 3, "image_hash": hex_hash(flip(BASE, 30)), "downloaded_at": (now - timedelta(days=30)).isoformat()},
+        {"_id": 4, "downloaded_at": now.isoformat()},
+    ])
+    assert get_index(db.images) is index
+    assert [doc["_id"] for doc in index.docs] == [1, 2]
+    assert index.refresh(db.images) == 0
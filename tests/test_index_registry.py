@@ -0,0 +1,69 @@
+"""Реестр индексов: сверка с сервером и создание недостающих"""
+
+import pytest
+
+import index_registry
+from index_registry import ASCENDING, DESCENDING, IndexSpec, ensure_indexes, plan_collection
+
+SPECS = [
+    IndexSpec("post_id_1", [("post_id", ASCENDING)], "дубликаты по post_id"),
+    IndexSpec("username_timestamp_idx", [("username", ASCENDING), ("timestamp", DESCENDING)], "галерея блогера"),
+    IndexSpec("timestamp_idx", [("timestamp", ASCENDING)], "сортировка галерей"),
+]
+
+
+@pytest.fixture(autouse=True)
+def no_index_stats(monkeypatch):
+    # mongomock не реализует $indexStats
+    monkeypatch.setattr(index_registry, "get_index_usage", lambda collection: {})
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(index_registry, "INDEX_REGISTRY", {"images": SPECS})
+
+
+def test_plan_reports_missing_changed_and_extra(db):
+    db.images.create_index([("post_id", ASCENDING)], name="post_id_custom")
+    db.images.create_index([("timestamp", DESCENDING)], name="timestamp_idx")
+    db.images.create_index([("legacy", ASCENDING)], name="legacy_1")
+
+    plan = plan_collection(db.images, SPECS)
+
+    assert plan["present"] == [{"name": "post_id_custom", "declared_name": "post_id_1", "ops": None}]
+    assert [spec.name for spec in plan["missing"]] == ["username_timestamp_idx"]
+    assert [(index["spec"].name, index["keys"]) for index in plan["changed"]] == [
+        ("timestamp_idx", [("timestamp", -1)])
+    ]
+    assert plan["extra"] == [{"name": "legacy_1", "keys": [("legacy", 1)], "ops": None}]
+
+
+def test_ensure_indexes_creates_missing(db, registry):
+    db.images.create_index([("legacy", ASCENDING)], name="legacy_1")
+
+    report = ensure_indexes(db, verbose=False)
+
+    assert report["images"]["created"] == ["post_id_1", "username_timestamp_idx", "timestamp_idx"]
+    assert report["images"]["dropped"] == []
+    names = {index["name"] for index in db.images.list_indexes()}
+    assert names == {"_id_", "legacy_1", "post_id_1", "username_timestamp_idx", "timestamp_idx"}
+
+    plan = plan_collection(db.images, SPECS)
+    assert plan["missing"] == [] and plan["changed"] == []
+    assert ensure_indexes(db, verbose=False)["images"]["created"] == []
+
+
+def test_ensure_indexes_drop_extra_recreates_changed(db, registry):
+    db.images.create_index([("timestamp", DESCENDING)], name="timestamp_idx")
+    db.images.create_index([("legacy", ASCENDING)], name="legacy_1")
+
+    # Без drop_extra изменённый индекс не трогается
+    assert ensure_indexes(db, verbose=False)["images"]["created"] == ["post_id_1", "username_timestamp_idx"]
+    assert plan_collection(db.images, SPECS)["changed"]
+
+    report = ensure_indexes(db, drop_extra=True, verbose=False)
+    assert sorted(report["images"]["dropped"]) == ["legacy_1", "timestamp_idx"]
+    assert report["images"]["created"] == ["timestamp_idx"]
+    keys = {index["name"]: list(index["key"].items()) for index in db.images.list_indexes()}
+    assert keys["timestamp_idx"] == [("timestamp", 1)]
+    assert "legacy_1" not in keys
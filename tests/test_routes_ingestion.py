@@ -0,0 +1,86 @@
+"""Параллельные сессии парсинга: у каждой своя телеметрия"""
+
+import threading
+import types
+
+import pytest
+
+import app_context
+import instagram_parser
+import routes_ingestion
+
+
+class FakeParser(instagram_parser.InstagramParser):
+    """Парсер без Apify и сети: download_images ждёт сигнала сессии"""
+
+    client_factory = None
+    gates = {}
+
+    def connect_mongodb(self):
+        self.client = self.client_factory()
+        self.db = self.client.get_database("instagram_gallery")
+        self.collection = self.db["images"]
+        return True
+
+    def parse_instagram_account(self, account, max_posts, date_from=None):
+        return {"posts": [{"account": account}]}
+
+    def extract_image_urls(self, posts):
+        return [{"url": f"{posts[0]['account']}/{i}"} for i in range(int(posts[0]["account"][-1]))]
+
+    def download_images(self, image_data, max_images):
+        self.gates[image_data[0]["url"].split("/")[0]].wait(5)
+        with self.telemetry.stage("download"):
+            self.telemetry.count("images_downloaded", len(image_data))
+        return image_data
+
+    def save_to_mongodb(self, data, account):
+        return len(data)
+
+    def create_gallery_html(self, data, account):
+        pass
+
+    def create_combined_gallery_html(self, page=1, per_page=200):
+        return None
+
+
+@pytest.fixture
+def sessions(db, cache, monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    FakeParser.client_factory = mongomock.MongoClient
+    FakeParser.gates = {"a3": threading.Event(), "b5": threading.Event()}
+    monkeypatch.setattr(instagram_parser, "InstagramParser", FakeParser)
+    monkeypatch.setattr(app_context.web_parser, "apify_token", "token")
+    monkeypatch.setattr(routes_ingestion, "get_collection", lambda: db.images)
+    monkeypatch.setattr(routes_ingestion, "socketio", types.SimpleNamespace(emit=lambda *args, **kwargs: None))
+    monkeypatch.setattr(routes_ingestion.threading, "Timer", lambda *args: types.SimpleNamespace(start=lambda: None))
+    for session_id, account in (("A", "a3"), ("B", "b5")):
+        monkeypatch.setitem(app_context.active_parsing_sessions, session_id, {"accounts": [account]})
+    return FakeParser.gates
+
+
+def test_concurrent_sessions_keep_their_own_telemetry(db, sessions):
+    threads = {
+        session_id: threading.Thread(target=routes_ingestion.run_parsing_session, args=(session_id, [account], 10))
+        for session_id, account in (("A", "a3"), ("B", "b5"))
+    }
+    for thread in threads.values():
+        thread.start()
+
+    # Сессия A завершается, пока B ещё скачивает
+    sessions["a3"].set()
+    threads["A"].join(5)
+    sessions["b5"].set()
+    threads["B"].join(5)
+
+    runs = {run["session_id"]: run for run in db.parsing_runs.find()}
+    assert runs["A"]["counters"]["images_downloaded"] == 3
+    assert runs["B"]["counters"]["images_downloaded"] == 5
+    assert runs["B"]["counters"]["images_saved"] == 5
+
+
+def test_session_parser_is_not_shared():
+    telemetry = object()
+    parser = app_context.web_parser.session_parser(telemetry)
+    assert parser.telemetry is telemetry
+    assert parser is not app_context.web_parser.session_parser(telemetry)
@@ -0,0 +1,10 @@
+"""Бюджет холодного старта web_parser (см. check_startup_time.py)"""
+
+import check_startup_time
+
+
+def test_startup_within_budget():
+    result = check_startup_time.measure(runs=3)
+    assert result["problems"] == [], (
+        f"медиана {result['median']:.3f} сек: " + "; ".join(result["problems"])
+    )
@@ -0,0 +1,86 @@
+"""Компактная схема ximilar_items: запись, чтение и миграция со старых полей"""
+
+from ximilar_schema import (
+    ITEMS_FIELD, LEGACY_FIELDS, LEGACY_OBJECTS_COLLECTION, LEGACY_SOURCE, RAW_COLLECTION,
+    build_tag_update, load_raw_response, migrate, read_objects, save_raw_response, with_legacy_objects,
+)
+
+DRESS = {
+    "name": "midi dresses", "top_category": "Clothing", "probability": 0.912,
+    "properties": {
+        "other_attributes": {
+            "Category": [{"name": "Dresses", "confidence": 0.95}],
+            "Subcategory": [{"name": "midi dresses", "confidence": 0.88}, {"name": "maxi dresses", "confidence": 0.1}],
+        },
+        "visual_attributes": {"Color": [{"name": "black", "confidence": 0.81}]},
+        "material_attributes": {"Material": [{"name": "silk", "confidence": 0.6}]},
+        "style_attributes": {"Style": [{"name": "elegant", "confidence": 0.7}]},
+    },
+}
+
+
+def subcategories(obj):
+    return [value["name"] for value in obj["properties"]["other_attributes"]["Subcategory"]]
+
+
+def test_tag_update_round_trip(db):
+    db.images.insert_one({"_id": 1})
+    db.images.update_one({"_id": 1}, build_tag_update({"success": True, "objects": [DRESS]}))
+
+    doc = db.images.find_one({"_id": 1})
+    objects = read_objects(doc)
+    assert len(doc[ITEMS_FIELD]) == 1
+    assert objects[0]["top_category"] == "Clothing"
+    assert subcategories(objects[0]) == ["midi dresses", "maxi dresses"]
+    assert objects[0]["properties"]["visual_attributes"]["Color"][0]["name"] == "black"
+
+
+def test_read_objects_legacy_document():
+    doc = {"_id": 1, "ximilar_objects_structured": [DRESS]}
+    assert read_objects(doc) == [DRESS]
+    assert read_objects({"_id": 2}) == []
+
+
+def test_with_legacy_objects_replaces_items():
+    doc = build_tag_update({"success": True, "objects": [DRESS]})["$set"]
+    doc = with_legacy_objects(dict(doc))
+    assert ITEMS_FIELD not in doc
+    assert subcategories(doc["ximilar_objects_structured"][0])[0] == "midi dresses"
+
+
+def test_migrate_moves_legacy_fields(db):
+    db.images.insert_many([
+        {"_id": 1, "ximilar_objects_structured": [DRESS], "ximilar_tags": [{"name": "dress"}]},
+        {"_id": 2, "ximilar_objects_structured": [DRESS]},
+        {"_id": 3, "username": "untouched"},
+    ])
+    # У изображения 2 уже есть ответ API - список объектов ему не нужен
+    save_raw_response(db, 2, {"records": []})
+    # Запись ранней версии миграции в ximilar_raw переезжает в отдельную коллекцию
+    db[RAW_COLLECTION].insert_one({"_id": 9, "payload": None, "source": LEGACY_SOURCE})
+
+    stats = migrate(db)
+
+    assert stats["migrated"] == 2
+    assert stats["raw_saved"] == 1
+    assert stats["legacy_moved"] == 1
+    for doc in db.images.find({"_id": {"$in": [1, 2]}}):
+        assert not any(field in doc for field in LEGACY_FIELDS)
+        assert subcategories(read_objects(doc)[0])[0] == "midi dresses"
+    assert db.images.find_one({"_id": 3}) == {"_id": 3, "username": "untouched"}
+
+    assert sorted(doc["_id"] for doc in db[RAW_COLLECTION].find()) == [2]
+    assert sorted(doc["_id"] for doc in db[LEGACY_OBJECTS_COLLECTION].find()) == [1, 9]
+    raw = load_raw_response(db, 1)
+    assert raw["source"] == LEGACY_SOURCE and raw["payload"] == [DRESS]
+
+    # Повторный запуск ничего не делает
+    assert migrate(db)["migrated"] == 0
+
+
+def test_migrate_dry_run_writes_nothing(db):
+    db.images.insert_one({"_id": 1, "ximilar_objects_structured": [DRESS]})
+    stats = migrate(db, dry_run=True)
+    assert stats["migrated"] == 1
+    assert "ximilar_objects_structured" in db.images.find_one({"_id": 1})
+    assert db[LEGACY_OBJECTS_COLLECTION].count_documents({}) == 0
@@ -7,6 +7,7 @@ import os
 import json
 from dotenv import load_dotenv
 from pymongo import MongoClient
+from ximilar_schema import ITEMS_FIELD, TAGGED_QUERY, read_objects, load_raw_response
 
 load_dotenv()
 load_dotenv('mongodb_config.env')
@@ -24,9 +25,7 @@ def view_object_structure():
         print("=" * 60)
         
         # Находим изображения с тегами Ximilar
-        images_with_tags = collection.find({
-            "ximilar_objects": {"$exists": True, "$ne": []}
-        }).limit(5)
+        images_with_tags = collection.find(TAGGED_QUERY).limit(5)
         
         count = 0
         for img in images_with_tags:
@@ -35,44 +34,33 @@ def view_object_structure():
             print(f"   • ID: {img['_id']}")
             print(f"   • URL: {img.get('url', 'N/A')[:50]}...")
             print(f"   • Успех тегирования: {img.get('ximilar_success', False)}")
-            print(f"   • Всего тегов: {img.get('ximilar_total_tags', 0)}")
             print(f"   • Всего объектов: {img.get('ximilar_total_objects', 0)}")
             
-            # Показываем структуру объектов
-            objects = img.get('ximilar_objects', [])
-            if objects:
-                print(f"\n   📦 ОБЪЕКТЫ ({len(objects)}):")
-                for i, obj in enumerate(objects, 1):
-                    print(f"      {i}. {obj.get('name', 'N/A')} (ID: {obj.get('object_id', 'N/A')})")
-                    print(f"         • Категория: {obj.get('top_category', 'N/A')}")
-                    print(f"         • Вероятность: {obj.get('probability', 0):.3f}")
-                    print(f"         • Площадь: {obj.get('area', 0):.3f}")
+            # Показываем компактные объекты (c, n, p + атрибуты top-k)
+            items = img.get(ITEMS_FIELD, [])
+            if items:
+                print(f"\n   📦 ОБЪЕКТЫ ({len(items)}):")
+                for i, item in enumerate(items, 1):
+                    print(f"      {i}. {item.get('n', 'N/A')}")
+                    print(f"         • Категория: {item.get('c', 'N/A')}")
+                    print(f"         • Вероятность: {item.get('p', 0)}%")
                     
-                    # Показываем теги по категориям
-                    tags = obj.get('tags', {})
-                    if tags:
-                        print(f"         • Теги по категориям:")
-                        for category, tag_list in tags.items():
-                            if tag_list:
-                                tag_names = [tag.get('name', '') for tag in tag_list[:3]]
-                                print(f"           - {category}: {', '.join(tag_names)}")
-                    
-                    # Показываем простые теги
-                    simple_tags = obj.get('tags_simple', [])
-                    if simple_tags:
-                        print(f"         • Простые теги: {', '.join(simple_tags[:5])}")
-                    
-                    # Показываем карту тегов
-                    tags_map = obj.get('tags_map', {})
-                    if tags_map:
-                        print(f"         • Карта тегов:")
-                        for key, value in list(tags_map.items())[:3]:
-                            print(f"           - {key}: {value}")
+                    for key, label in (("s", "Subcategory"), ("k", "Category"), ("col", "Color"), ("mat", "Material"), ("sty", "Style")):
+                        if item.get(key):
+                            values = [f"{v['n']} ({v['p']}%)" for v in item[key]]
+                            print(f"           - {label}: {', '.join(values)}")
+                    for category, values in (item.get("a") or {}).items():
+                        print(f"           - {category}: {', '.join(v['n'] for v in values)}")
                     
                     print()
             else:
                 print("   ❌ Объекты не найдены")
             
+            # Полный ответ Ximilar хранится отдельно
+            raw = load_raw_response(db, img['_id'])
+            if raw:
+                print(f"   🗜️  Сырой ответ: {raw['source']}, сохранён {raw['saved_at']}")
+            
             print("-" * 50)
         
         if count == 0:
@@ -93,9 +81,7 @@ def export_object_structure():
         collection = db["images"]
         
         # Находим все изображения с объектами
-        images = list(collection.find({
-            "ximilar_objects": {"$exists": True, "$ne": []}
-        }))
+        images = list(collection.find(TAGGED_QUERY))
         
         # Создаем структуру для экспорта
         export_data = {
@@ -108,7 +94,7 @@ def export_object_structure():
                 "id": str(img["_id"]),
                 "url": img.get("url", ""),
                 "total_objects": img.get("ximilar_total_objects", 0),
-                "objects": img.get("ximilar_objects", [])
+                "objects": read_objects(img)
             }
             export_data["images"].append(image_data)
         
@@ -4,12 +4,17 @@ Ximilar Fashion API для тегирования одежды в изображ
 """
 
 import os
-import json
 import requests
 import pymongo
-from datetime import datetime
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
+from ximilar_schema import (
+    DIGEST_FIELD, ITEMS_FIELD, TAGGED_QUERY, UNTAGGED_QUERY, categorize_property,
+    build_tag_update, read_objects, save_raw_response, structure_response
+)
+from analytics_cache import analytics_cache
+from cache_dependencies import snapshot_tags, invalidate_images
+from tag_reuse import get_reuse_index, build_reuse_update
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -41,44 +46,16 @@ class XimilarFashionTagger:
             return False
     
     def _categorize_property(self, category: str) -> str:
-        """Категоризация свойств по типам"""
-        category_lower = category.lower()
-        
-        # Визуальные атрибуты
-        if any(word in category_lower for word in ['color', 'pattern', 'texture', 'shape', 'size', 'length', 'width', 'height']):
-            return "visual_attributes"
-        
-        # Стилевые атрибуты
-        elif any(word in category_lower for word in ['style', 'fashion', 'trend', 'design', 'cut', 'fit', 'silhouette']):
-            return "style_attributes"
-        
-        # Цветовые атрибуты
-        elif any(word in category_lower for word in ['color', 'hue', 'shade', 'tone', 'brightness']):
-            return "color_attributes"
-        
-        # Материальные атрибуты
-        elif any(word in category_lower for word in ['material', 'fabric', 'textile', 'leather', 'cotton', 'silk', 'wool']):
-            return "material_attributes"
-        
-        # Брендовые атрибуты
-        elif any(word in category_lower for word in ['brand', 'logo', 'label', 'manufacturer']):
-            return "brand_attributes"
-        
-        # Остальные атрибуты
-        else:
-            return "other_attributes"
+        """Категоризация свойств по типам (правила в ximilar_schema)"""
+        return categorize_property(category)
     
     def get_untagged_images(self, limit: int = 100) -> List[Dict]:
         """Получение изображений без тегов Ximilar"""
         try:
-            # Ищем изображения без поля ximilar_tags
+            # Ищем изображения без поля ximilar_items
             query = {
                 "full_image_url": {"$exists": True},
-                "$or": [
-                    {"ximilar_tags": {"$exists": False}},
-                    {"ximilar_tags": None},
-                    {"ximilar_tags": []}
-                ]
+                **UNTAGGED_QUERY
             }
             
             images = list(self.collection.find(query).limit(limit))
@@ -122,105 +99,8 @@ class XimilarFashionTagger:
                 )
             
                 if response.status_code == 200:
-                    result = response.json()
-                    
-                    if result.get("records") and len(result["records"]) > 0:
-                        record = result["records"][0]
-                        
-                        # Извлекаем объекты с их тегами (объектно-ориентированная структура)
-                        objects = []
-                        if record.get("_objects"):
-                            for obj in record["_objects"]:
-                                object_data = {
-                                    "object_id": obj.get("id", ""),
-                                    "name": obj.get("name", ""),
-                                    "top_category": obj.get("Top Category", ""),
-                                    "bound_box": obj.get("bound_box", []),
-                                    "probability": obj.get("prob", 0.0),
-                                    "area": obj.get("area", 0.0),
-                                    "properties": {
-                                        "basic_info": {
-                                            "name": obj.get("name", ""),
-                                            "category": obj.get("Top Category", ""),
-                                            "confidence": obj.get("prob", 0.0),
-                                            "area": obj.get("area", 0.0)
-                                        },
-                                        "visual_attributes": {},
-                                        "style_attributes": {},
-                                        "color_attributes": {},
-                                        "material_attributes": {},
-                                        "brand_attributes": {},
-                                        "other_attributes": {}
-                                    },
-                                    "tags_simple": [],
-                                    "tags_map": {}
-                                }
-                                
-                                # Извлекаем теги объекта и группируем по типам свойств
-                                if obj.get("_tags"):
-                                    obj_tags = obj["_tags"]
-                                    
-                                    # Простые теги
-                                    if obj_tags.get("_tags_simple"):
-                                        object_data["tags_simple"] = obj_tags["_tags_simple"]
-                                    
-                                    # Карта тегов
-                                    if obj_tags.get("_tags_map"):
-                                        object_data["tags_map"] = obj_tags["_tags_map"]
-                                    
-                                    # Группируем теги по типам свойств
-                                    for category, tag_list in obj_tags.items():
-                                        if category not in ["_tags_simple", "_tags_map"] and isinstance(tag_list, list):
-                                            # Определяем тип свойства по категории
-                                            property_type = self._categorize_property(category)
-                                            
-                                            if property_type not in object_data["properties"]:
-                                                object_data["properties"][property_type] = {}
-                                            
-                                            object_data["properties"][property_type][category] = []
-                                            for tag in tag_list:
-                                                if isinstance(tag, dict):
-                                                    tag_data = {
-                                                        "name": tag.get("name", ""),
-                                                        "confidence": tag.get("prob", 0.0),
-                                                        "id": tag.get("id", ""),
-                                                        "category": category
-                                                    }
-                                                    object_data["properties"][property_type][category].append(tag_data)
-                                
-                                objects.append(object_data)
-                        
-                        # Создаем плоский список тегов для обратной совместимости
-                        tags = []
-                        for obj in objects:
-                            for property_type, properties in obj["properties"].items():
-                                if isinstance(properties, dict):
-                                    for category, tag_list in properties.items():
-                                        if isinstance(tag_list, list):
-                                            for tag in tag_list:
-                                                tags.append({
-                                                    "name": tag["name"],
-                                                    "confidence": tag["confidence"],
-                                                    "category": category,
-                                                    "property_type": property_type,
-                                                    "object_id": obj["object_id"],
-                                                    "object_name": obj["name"]
-                                                })
-                        
-                        return {
-                            "success": True,
-                            "tags": tags,
-                            "objects": objects,
-                            "total_tags": len(tags),
-                            "total_objects": len(objects),
-                            "api_response": result
-                        }
-                    else:
-                        return {
-                            "success": False,
-                            "error": "No tags returned",
-                            "api_response": result
-                        }
+                    # Объекты, properties.* и плоские теги строятся из _objects (ximilar_schema)
+                    return structure_response(response.json())
                 else:
                     if attempt == max_retries - 1:  # Последняя попытка
                         return {
@@ -250,33 +130,18 @@ class XimilarFashionTagger:
             "api_response": None
         }
     
-    def update_image_with_tags(self, image_id: str, tags_data: Dict) -> bool:
+    def update_image_with_tags(self, image_id: str, tags_data: Dict, digest: str = None) -> bool:
         """Обновление изображения в MongoDB с тегами (объектно-ориентированная структура)"""
         try:
-            update_data = {
-                # Новая объектно-ориентированная структура
-                "ximilar_objects_structured": tags_data.get("objects", []),
-                "ximilar_properties_summary": self._create_properties_summary(tags_data.get("objects", [])),
-                
-                # Обратная совместимость
-                "ximilar_tags": tags_data.get("tags", []),
-                "ximilar_objects": tags_data.get("objects", []),
-                "ximilar_total_tags": tags_data.get("total_tags", 0),
-                "ximilar_total_objects": tags_data.get("total_objects", 0),
-                "ximilar_tagged_at": datetime.now().isoformat(),
-                "ximilar_success": tags_data.get("success", False)
-            }
-            
-            if not tags_data.get("success"):
-                update_data["ximilar_error"] = tags_data.get("error", "Unknown error")
-            
-            result = self.collection.update_one(
-                {"_id": image_id},
-                {"$set": update_data}
-            )
+            # Компактные объекты в документе, полный ответ - в ximilar_raw
+            update = build_tag_update(tags_data)
+            if digest:
+                update["$set"][DIGEST_FIELD] = digest
+            result = self.collection.update_one({"_id": image_id}, update)
+            save_raw_response(self.db, image_id, tags_data.get("api_response"))
             
             if result.modified_count > 0:
-                print(f"✅ Обновлено изображение {image_id} с объектно-ориентированной структурой")
+                print(f"✅ Обновлено изображение {image_id} (компактная схема)")
                 return True
             else:
                 print(f"❌ Не удалось обновить изображение {image_id}")
@@ -286,32 +151,6 @@ class XimilarFashionTagger:
             print(f"❌ Ошибка обновления изображения {image_id}: {e}")
             return False
     
-    def _create_properties_summary(self, objects: List[Dict]) -> Dict:
-        """Создание сводки по свойствам объектов"""
-        summary = {
-            "total_objects": len(objects),
-            "property_types": {},
-            "most_common_properties": {},
-            "objects_by_category": {}
-        }
-        
-        for obj in objects:
-            # Группируем по категориям
-            category = obj.get("top_category", "unknown")
-            if category not in summary["objects_by_category"]:
-                summary["objects_by_category"][category] = 0
-            summary["objects_by_category"][category] += 1
-            
-            # Анализируем свойства
-            properties = obj.get("properties", {})
-            for property_type, property_data in properties.items():
-                if isinstance(property_data, dict):
-                    if property_type not in summary["property_types"]:
-                        summary["property_types"][property_type] = 0
-                    summary["property_types"][property_type] += len(property_data)
-        
-        return summary
-    
     def tag_batch_images(self, batch_size: int = 10, max_images: int = 100):
         """Тегирование пакета изображений"""
         print(f"🏷️ ЗАПУСК ТЕГИРОВАНИЯ ЧЕРЕЗ XIMILAR")
@@ -326,7 +165,27 @@ class XimilarFashionTagger:
             print("❌ Нет изображений для тегирования")
             return False
         
+        # Теги зависимостей кеша аналитики до теггирования
+        query = {"_id": {"$in": [image["_id"] for image in images]}}
+        tags_before = snapshot_tags(self.collection, query)
+
+        # Изображения без одежды отсеиваются локально и в Ximilar не уходят
+        from fashion_prescreen import screen_images, mark_no_fashion
+        images, rejected = screen_images(self.collection, images)
+        if rejected:
+            mark_no_fashion(self.collection, rejected)
+            print(f"🚫 Пре-скрин: {len(rejected)} изображений без одежды")
+            invalidate_images(self.collection, query, tags_before, 'prescreen')
+            analytics_cache.request_refresh()
+        if not images:
+            print("✅ Все изображения отсеяны пре-скрином, теггировать нечего")
+            return False
+
         print(f"📊 Будет обработано {len(images)} изображений")
+
+        # Визуально идентичные уже оттегированным получают их теги без вызова Ximilar
+        reuse = get_reuse_index(self.collection)
+        reused_count = 0
         
         success_count = 0
         error_count = 0
@@ -343,14 +202,24 @@ class XimilarFashionTagger:
                 print(f"\n🔄 [{i}/{len(images)}] Обработка изображения...")
                 print(f"   • ID: {image_id}")
                 print(f"   • URL: {image_url[:60]}...")
+
+                match = reuse.find(image)
+                if match:
+                    self.collection.update_one({"_id": image_id}, build_reuse_update(match))
+                    success_count += 1
+                    reused_count += 1
+                    print(f"   ♻️ Теги взяты у {match['source']['_id']} ({match['match']}, "
+                          f"расстояние {match['distance']})")
+                    continue
                 
                 # Тегируем изображение
                 tags_result = self.tag_image_with_ximilar(image_url)
                 
                 if tags_result:
                     # Обновляем в MongoDB
-                    if self.update_image_with_tags(image_id, tags_result):
+                    if self.update_image_with_tags(image_id, tags_result, image.get(DIGEST_FIELD)):
                         success_count += 1
+                        reuse.add(image)
                         
                         if tags_result.get("success"):
                             tags_count = tags_result.get("total_tags", 0)
@@ -388,10 +257,16 @@ class XimilarFashionTagger:
                 print(f"   ❌ Ошибка обработки: {e}")
                 error_count += 1
         
+        # Сбрасываем затронутые записи кеша аналитики, веб-процесс пересчитает их
+        if success_count:
+            invalidate_images(self.collection, query, tags_before, 'tagging')
+            analytics_cache.request_refresh()
+        
         # Итоговая статистика
         print(f"\n📊 ИТОГОВАЯ СТАТИСТИКА:")
         print("="*30)
         print(f"✅ Успешно обработано: {success_count}")
+        print(f"♻️ Теги переиспользованы: {reused_count}")
         print(f"❌ Ошибок: {error_count}")
         print(f"📈 Успешность: {success_count/(success_count+error_count)*100:.1f}%")
         
@@ -405,7 +280,7 @@ class XimilarFashionTagger:
             
             # Общая статистика
             total_images = self.collection.count_documents({})
-            tagged_images = self.collection.count_documents({"ximilar_tags": {"$exists": True, "$ne": []}})
+            tagged_images = self.collection.count_documents(TAGGED_QUERY)
             untagged_images = total_images - tagged_images
             
             print(f"\n📊 СТАТИСТИКА ТЕГИРОВАНИЯ:")
@@ -415,14 +290,14 @@ class XimilarFashionTagger:
             print(f"❓ Без тегов: {untagged_images}")
             print(f"📈 Процент тегированных: {tagged_images/total_images*100:.1f}%")
             
-            # Топ теги
+            # Топ объекты (confidence в ximilar_items хранится в процентах)
             pipeline = [
-                {"$match": {"ximilar_tags": {"$exists": True, "$ne": []}}},
-                {"$unwind": "$ximilar_tags"},
+                {"$match": TAGGED_QUERY},
+                {"$unwind": f"${ITEMS_FIELD}"},
                 {"$group": {
-                    "_id": "$ximilar_tags.name",
+                    "_id": f"${ITEMS_FIELD}.n",
                     "count": {"$sum": 1},
-                    "avg_confidence": {"$avg": "$ximilar_tags.confidence"}
+                    "avg_confidence": {"$avg": f"${ITEMS_FIELD}.p"}
                 }},
                 {"$sort": {"count": -1}},
                 {"$limit": 10}
@@ -431,12 +306,12 @@ class XimilarFashionTagger:
             top_tags = list(self.collection.aggregate(pipeline))
             
             if top_tags:
-                print(f"\n🏷️ ТОП-10 ТЕГОВ:")
+                print(f"\n🏷️ ТОП-10 ОБЪЕКТОВ:")
                 print("-" * 30)
                 for i, tag in enumerate(top_tags, 1):
                     name = tag["_id"]
                     count = tag["count"]
-                    avg_conf = tag["avg_confidence"]
+                    avg_conf = (tag["avg_confidence"] or 0) / 100
                     print(f"{i:2d}. {name:<20} ({count} раз, {avg_conf:.2f})")
             
         except Exception as e:
@@ -458,12 +333,12 @@ class XimilarFashionTagger:
                 print(f"\n🔍 СТРУКТУРА ОБЪЕКТОВ ДЛЯ ИЗОБРАЖЕНИЯ {image_id}")
                 print("="*60)
                 
-                if "ximilar_objects_structured" in image:
-                    for i, obj in enumerate(image["ximilar_objects_structured"], 1):
+                objects = read_objects(image)
+                if objects:
+                    for i, obj in enumerate(objects, 1):
                         print(f"\n📦 ОБЪЕКТ {i}: {obj.get('name', 'Unknown')}")
                         print(f"   Категория: {obj.get('top_category', 'Unknown')}")
                         print(f"   Уверенность: {obj.get('probability', 0):.2f}")
-                        print(f"   Область: {obj.get('bound_box', [])}")
                         
                         properties = obj.get("properties", {})
                         for prop_type, prop_data in properties.items():
@@ -476,9 +351,9 @@ class XimilarFashionTagger:
                     print("❌ Нет объектно-ориентированных данных для этого изображения")
             else:
                 # Показать пример структуры
-                image = self.collection.find_one({"ximilar_objects_structured": {"$exists": True, "$ne": []}})
+                image = self.collection.find_one(TAGGED_QUERY)
                 if image:
-                    self.show_object_structure(str(image["_id"]))
+                    self.show_object_structure(image["_id"])
                 else:
                     print("❌ Нет изображений с объектно-ориентированными данными")
                     